@@ -2,12 +2,17 @@
 Enhanced API endpoints for file management system integration
 Includes advanced processing capabilities from Flask reference
 """
-from django.http import JsonResponse, HttpResponse, Http404
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
+from django.views.decorators.vary import vary_on_headers
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+import fcntl
 import json
 import os
 import gzip
@@ -18,97 +23,227 @@ import pickle
 import base64
 import shutil
 from datetime import datetime
-from werkzeug.utils import secure_filename
 from cryptography.fernet import Fernet
-from .models import Folder, UploadedFile
+from .models import (
+    CHUNK_FORMAT_CHOICES, EFFECTIVE_CHUNK_FORMAT, Folder, InferenceRecord, ProcessingJob, UploadedFile, UploadSession,
+    UploadSessionChunk, UserStorageStats, parse_inference_timestamp
+)
+from .pagination import (
+    InvalidCursor, decode_cursor, encode_cursor, get_page_limit, keyset_queryset, paginate_keyset
+)
+from .blobs import ingest_path, save_upload
+from .uploadhandlers import get_rejected_uploads, restrict_upload_types
+from .chunking import (
+    ARROW_STREAM_CONTENT_TYPE, MANIFEST_NAME, UnsupportedFileType, arrow_stream_bytes, chunk_path, find_format_dir,
+    iter_record_range, load_manifest, read_chunk, read_chunk_table
+)
+from .processing import CHUNKABLE_TYPES, ensure_preview, get_chunking_settings, save_inference_result
+from .record_index import RecordIndex, find_records
+from .jobs import enqueue_file_processing, enqueue_job
+from .conditional import (
+    chunk_etag, chunk_last_modified, folder_contents_etag, sidecar_etag, sidecar_last_modified
+)
+from .streaming import (
+    StreamedList, get_stream_format, iter_queryset, streaming_json_response, streaming_ndjson_response
+)
+from . import cache, search
 from .forms import FolderForm, FileUploadForm
 
 # ==================== UTILITY FUNCTIONS ====================
 
-def get_file_processing_hash(filename):
-    """Generate hash-based directory like Flask reference"""
-    sec_filename = secure_filename(filename)
-    m = hashlib.sha512()
-    m.update(bytes(sec_filename, "utf-8"))
-    return m.hexdigest()
-
 def get_file_processing_info(file_obj):
-    """Get file processing information"""
+    """Get file processing information from the stored state (no filesystem access)"""
     if not file_obj.file:
         return {}
-    
-    filename = os.path.basename(file_obj.file.name)
-    processing_hash = get_file_processing_hash(filename)
-    processing_dir = os.path.join(settings.MEDIA_ROOT, processing_hash)
-    chunks_dir = processing_dir
-    inference_dir = os.path.join(processing_dir, "inference")
-    config_file = os.path.join(processing_dir, "config.json")
-    
-    # Count chunks
-    chunk_count = 0
-    if os.path.exists(chunks_dir):
-        chunk_files = [f for f in os.listdir(chunks_dir) if f.endswith('.json.gz')]
-        chunk_count = len(chunk_files)
-    
+
+    # Set on save (and backfilled by migration 0023): reading state never writes
+    processing_hash = file_obj.processing_hash
     return {
         'processing_hash': processing_hash,
-        'processing_dir': processing_dir,
-        'has_chunks': chunk_count > 0,
-        'has_inference': os.path.exists(inference_dir),
-        'has_config': os.path.exists(config_file),
-        'chunk_count': chunk_count,
-        'status': 'processed' if chunk_count > 0 else 'raw'
+        'processing_dir': os.path.join(settings.MEDIA_ROOT, processing_hash) if processing_hash else None,
+        'has_chunks': file_obj.has_chunks,
+        'has_inference': file_obj.has_inference,
+        'has_config': file_obj.has_config,
+        'chunk_count': file_obj.chunk_count,
+        'has_record_index': file_obj.has_record_index,
+        'status': file_obj.processing_status
     }
 
+def get_file_manifest(file_obj):
+    """Chunk manifest (cached in memory) for a processed file, or None"""
+    if not file_obj.has_chunks:
+        return None
+    return load_manifest(file_obj.get_chunks_dir())
+
 def initialize_file_processing(file_obj):
     """Initialize file processing directory structure"""
-    processing_info = get_file_processing_info(file_obj)
-    processing_dir = processing_info['processing_dir']
+    processing_dir = file_obj.get_processing_dir()
     
     # Create processing directory
     os.makedirs(processing_dir, exist_ok=True)
     os.makedirs(os.path.join(processing_dir, "inference"), exist_ok=True)
     
-    # Update model fields
-    file_obj.processing_hash = processing_info['processing_hash']
-    file_obj.save()
-    
+    return get_file_processing_info(file_obj)
+
+def serialize_job(job):
+    return {
+        'id': job.id,
+        'file_id': job.file_id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'records_done': job.records_done,
+        'records_total': job.records_total,
+        'progress': job.progress,
+        'cancel_requested': job.cancel_requested,
+        'error': job.error or None,
+        'result': job.result,
+        'created_at': job.created_at.isoformat(),
+        'run_after': job.run_after.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+def start_file_processing(file_obj):
+    """
+    Initialize the processing directory and queue preview/chunking jobs for
+    supported types; `manage.py process_jobs` workers run them off the request path
+    """
+    processing_info = initialize_file_processing(file_obj)
+    processing_info['jobs'] = [serialize_job(job) for job in enqueue_file_processing(file_obj)]
     return processing_info
 
+# ==================== LISTING SERIALIZATION ====================
+
+# Field name -> (columns needed, getter). Columns drive .only()/select_related so a
+# ?fields= projection also narrows the query.
+FILE_LIST_FIELDS = {
+    'id': (('id',), lambda f: f.id),
+    'original_name': (('original_name',), lambda f: f.original_name),
+    'file_path': (('file',), lambda f: f.file.url if f.file else None),
+    'file_size': (('file_size',), lambda f: f.file_size),
+    'uploaded_by': (('uploaded_by__username',), lambda f: f.uploaded_by.username if f.uploaded_by_id else None),
+    'uploaded_at': (('uploaded_at',), lambda f: f.uploaded_at.isoformat() if f.uploaded_at else None),
+    'folder_id': (('folder_id',), lambda f: f.folder_id),
+    'folder_name': (('folder__name',), lambda f: f.folder.name if f.folder_id else None),
+    'is_public': (('is_public',), lambda f: f.is_public),
+    'description': (('description',), lambda f: f.description),
+    # Enhanced with processing status
+    'processing_hash': (('processing_hash',), lambda f: f.processing_hash),
+    'has_chunks': (('has_chunks',), lambda f: f.has_chunks),
+    'has_inference': (('has_inference',), lambda f: f.has_inference),
+    'has_config': (('has_config',), lambda f: f.has_config),
+    'processing_status': (('processing_status',), lambda f: f.processing_status),
+    'chunk_count': (('chunk_count',), lambda f: f.chunk_count),
+    'has_record_index': (('has_record_index',), lambda f: f.has_record_index),
+}
+
+FOLDER_LIST_FIELDS = {
+    'id': (('id',), lambda f: f.id),
+    'name': (('name',), lambda f: f.name),
+    'allowed_type': (('allowed_type',), lambda f: f.allowed_type),
+    'created_by': (('created_by__username',), lambda f: f.created_by.username if f.created_by_id else None),
+    'created_at': (('created_at',), lambda f: f.created_at.isoformat() if f.created_at else None),
+    'file_count': ((), lambda f: f.file_count),  # annotated
+    'is_public': (('is_public',), lambda f: f.is_public),
+    'description': (('description',), lambda f: f.description),
+    'parent_id': (('parent_id',), lambda f: f.parent_id),
+    'depth': (('depth',), lambda f: f.depth),
+}
+
+def parse_fields_param(request, available_fields):
+    """Return requested field names from ?fields=a,b (all fields when absent)"""
+    fields_param = request.GET.get('fields')
+    if not fields_param:
+        return list(available_fields)
+    fields = [name.strip() for name in fields_param.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available_fields]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (available: {', '.join(available_fields)})")
+    return fields
+
+def project_queryset(queryset, available_fields, fields, extra_columns=()):
+    """Load only the columns (and joins) the requested fields need"""
+    columns = {'id', *extra_columns}
+    for name in fields:
+        columns.update(available_fields[name][0])
+    related = {column.split('__')[0] for column in columns if '__' in column}
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*(columns | related))
+
+def serialize_fields(obj, available_fields, fields):
+    return {name: available_fields[name][1](obj) for name in fields}
+
+def stream_listing(name, rows, stream_format):
+    """
+    Every row from the cursor on, streamed: the paginated response shape with
+    the whole listing under ``name`` (next_cursor is always null), or one row
+    per line for NDJSON
+    """
+    if stream_format == 'ndjson':
+        return streaming_ndjson_response(rows)
+    rows = StreamedList(rows)
+    return streaming_json_response([
+        (name, rows), ('count', lambda: rows.count), ('next_cursor', None), ('has_more', False)
+    ])
+
 # ==================== EXISTING API ENDPOINTS ====================
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def api_folders_list(request):
-    """List all folders with their metadata"""
+    """List folders with their metadata (keyset-paginated by id, or streamed whole)"""
+    if get_stream_format(request):
+        # Unbounded, so never held in memory or in the cache
+        return build_folders_list(request)
+    version_names = [cache.FOLDERS_VERSION]
+    if 'file_count' in request.GET.get('fields', 'file_count'):
+        version_names.append(cache.FILE_COUNTS_VERSION)
+    query = json.dumps(sorted(request.GET.lists()))
+    return cache.cached_response('api_folders_list', version_names, lambda: build_folders_list(request), query)
+
+def build_folders_list(request):
     user_id = request.GET.get('user_id')
     folders = Folder.objects.all()
+    stream_format = get_stream_format(request)
     
     if user_id:
         folders = folders.filter(created_by_id=user_id)
     
-    folder_data = []
-    for folder in folders:
-        folder_data.append({
-            'id': folder.id,
-            'name': folder.name,
-            'allowed_type': folder.allowed_type,
-            'created_by': folder.created_by.username if folder.created_by else None,
-            'created_at': folder.created_at.isoformat() if folder.created_at else None,
-            'file_count': folder.files.count(),
-            'is_public': folder.is_public,
-            'description': folder.description,
-            'parent_id': folder.parent_id
-        })
+    try:
+        fields = parse_fields_param(request, FOLDER_LIST_FIELDS)
+        folders = project_queryset(folders, FOLDER_LIST_FIELDS, fields)
+        if 'file_count' in fields:
+            folders = folders.annotate(file_count=Count('files'))
+        if stream_format:
+            folders = keyset_queryset(folders, request.GET.get('cursor'))
+        else:
+            page, next_cursor = paginate_keyset(folders, request.GET.get('cursor'), get_page_limit(request))
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    if stream_format:
+        rows = (serialize_fields(folder, FOLDER_LIST_FIELDS, fields) for folder in iter_queryset(folders))
+        return stream_listing('folders', rows, stream_format)
+    
+    folder_data = [serialize_fields(folder, FOLDER_LIST_FIELDS, fields) for folder in page]
     
-    return JsonResponse({'folders': folder_data})
+    return JsonResponse({
+        'folders': folder_data,
+        'count': len(folder_data),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def api_files_list(request):
-    """List all files with their metadata and processing status"""
+    """List files with metadata and processing status (keyset-paginated by uploaded_at, id, or streamed whole)"""
     folder_id = request.GET.get('folder_id')
     user_id = request.GET.get('user_id')
+    stream_format = get_stream_format(request)
     
     files = UploadedFile.objects.all()
     
@@ -117,30 +252,29 @@ def api_files_list(request):
     if user_id:
         files = files.filter(uploaded_by_id=user_id)
     
-    file_data = []
-    for file in files:
-        processing_info = get_file_processing_info(file)
-        file_data.append({
-            'id': file.id,
-            'original_name': file.original_name,
-            'file_path': file.file.url if file.file else None,
-            'file_size': file.file_size,
-            'uploaded_by': file.uploaded_by.username if file.uploaded_by else None,
-            'uploaded_at': file.uploaded_at.isoformat() if file.uploaded_at else None,
-            'folder_id': file.folder_id,
-            'folder_name': file.folder.name if file.folder else None,
-            'is_public': file.is_public,
-            'description': file.description,
-            # Enhanced with processing status
-            'processing_hash': processing_info.get('processing_hash'),
-            'has_chunks': processing_info.get('has_chunks', False),
-            'has_inference': processing_info.get('has_inference', False),
-            'has_config': processing_info.get('has_config', False),
-            'processing_status': processing_info.get('status', 'raw'),
-            'chunk_count': processing_info.get('chunk_count', 0)
-        })
+    try:
+        fields = parse_fields_param(request, FILE_LIST_FIELDS)
+        files = project_queryset(files, FILE_LIST_FIELDS, fields, extra_columns=('uploaded_at',))
+        if stream_format:
+            files = keyset_queryset(files, request.GET.get('cursor'), field='uploaded_at')
+        else:
+            page, next_cursor = paginate_keyset(files, request.GET.get('cursor'), get_page_limit(request),
+                                                field='uploaded_at')
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    if stream_format:
+        rows = (serialize_fields(file, FILE_LIST_FIELDS, fields) for file in iter_queryset(files))
+        return stream_listing('files', rows, stream_format)
+    
+    file_data = [serialize_fields(file, FILE_LIST_FIELDS, fields) for file in page]
     
-    return JsonResponse({'files': file_data})
+    return JsonResponse({
+        'files': file_data,
+        'count': len(file_data),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -155,7 +289,8 @@ def api_create_folder(request):
             parent_id=data.get('parent_id'),
             created_by_id=data.get('user_id'),
             description=data.get('description', ''),
-            is_public=data.get('is_public', True)  # Default to True - all folders are public
+            is_public=data.get('is_public', True),  # Default to True - all folders are public
+            chunk_format=data.get('chunk_format', 'json')
         )
         
         return JsonResponse({
@@ -163,7 +298,8 @@ def api_create_folder(request):
             'folder': {
                 'id': folder.id,
                 'name': folder.name,
-                'allowed_type': folder.allowed_type
+                'allowed_type': folder.allowed_type,
+                'chunk_format': folder.chunk_format
             }
         })
     except Exception as e:
@@ -172,16 +308,27 @@ def api_create_folder(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 def api_upload_file(request):
-    """Upload a file via API with processing initialization"""
+    """
+    Upload a file via API with processing initialization. Passing folder_id in
+    the query string lets disallowed types be refused before the body is stored.
+    """
     try:
-        folder_id = request.POST.get('folder_id')
+        if request.GET.get('folder_id'):
+            restrict_upload_types(request, [Folder.objects.get(id=request.GET['folder_id']).allowed_type])
+        folder_id = request.GET.get('folder_id') or request.POST.get('folder_id')
         user_id = request.POST.get('user_id')
         description = request.POST.get('description', '')
         is_public = request.POST.get('is_public', 'true').lower() == 'true'  # Default to True
         process_file = request.POST.get('process', 'false').lower() == 'true'
+        chunk_format = request.POST.get('chunk_format', '')  # Blank inherits the folder's format
         
         if 'file' not in request.FILES:
+            rejected = get_rejected_uploads(request)
+            if rejected:
+                return JsonResponse({'status': 'error', 'message': rejected[0]['reason']})
             return JsonResponse({'status': 'error', 'message': 'No file provided'})
+        if chunk_format and chunk_format not in dict(CHUNK_FORMAT_CHOICES):
+            return JsonResponse({'status': 'error', 'message': f'Unknown chunk format: {chunk_format}'})
         
         uploaded_file = request.FILES['file']
         
@@ -195,19 +342,19 @@ def api_upload_file(request):
                     'message': f'File type .{ext} not allowed in this folder (allowed: .{folder.allowed_type})'
                 })
         
-        file_obj = UploadedFile.objects.create(
-            file=uploaded_file,
+        file_obj = save_upload(UploadedFile(
             folder_id=folder_id,
             uploaded_by_id=user_id,
             description=description,
             is_public=is_public,
-            original_name=uploaded_file.name
-        )
+            original_name=uploaded_file.name,
+            chunk_format=chunk_format
+        ), uploaded_file)
         
         # Initialize processing if requested
         processing_info = {}
         if process_file:
-            processing_info = initialize_file_processing(file_obj)
+            processing_info = start_file_processing(file_obj)
         
         return JsonResponse({
             'status': 'success',
@@ -228,12 +375,7 @@ def api_delete_file(request, file_id):
     """Delete a file via API with cleanup of processed data"""
     try:
         file_obj = UploadedFile.objects.get(id=file_id)
-        
-        # Clean up processing directory
-        processing_info = get_file_processing_info(file_obj)
-        if processing_info.get('processing_dir') and os.path.exists(processing_info['processing_dir']):
-            shutil.rmtree(processing_info['processing_dir'])
-        
+        # Releases the blob and removes processed data once no copy shares it
         file_obj.delete()
         return JsonResponse({'status': 'success'})
     except UploadedFile.DoesNotExist:
@@ -253,62 +395,39 @@ def api_delete_folder(request, folder_id):
 @csrf_exempt
 @require_http_methods(["GET"])
 def api_user_stats(request, user_id):
-    """Get user's enhanced file management statistics"""
-    try:
-        user = User.objects.get(id=user_id)
-        
-        folder_count = Folder.objects.filter(created_by=user).count()
-        file_count = UploadedFile.objects.filter(uploaded_by=user).count()
-        total_size = sum(f.file_size or 0 for f in UploadedFile.objects.filter(uploaded_by=user))
-        
-        # Enhanced stats with processing info
-        processed_files = 0
-        files_with_inference = 0
-        files_with_config = 0
-        total_chunks = 0
-        
-        for file in UploadedFile.objects.filter(uploaded_by=user):
-            processing_info = get_file_processing_info(file)
-            if processing_info.get('has_chunks'):
-                processed_files += 1
-                total_chunks += processing_info.get('chunk_count', 0)
-            if processing_info.get('has_inference'):
-                files_with_inference += 1
-            if processing_info.get('has_config'):
-                files_with_config += 1
-        
-        return JsonResponse({
-            'user': user.username,
-            'folders_created': folder_count,
-            'files_uploaded': file_count,
-            'files_processed': processed_files,
-            'files_with_inference': files_with_inference,
-            'files_with_config': files_with_config,
-            'total_chunks': total_chunks,
-            'total_storage_bytes': total_size,
-            'total_storage_mb': round(total_size / (1024 * 1024), 2)
-        })
-    except User.DoesNotExist:
+    """Get user's enhanced file management statistics (rollup table, ?fresh=1 forces a recompute)"""
+    username = User.objects.filter(id=user_id).values_list('username', flat=True).first()
+    if username is None:
         return JsonResponse({'status': 'error', 'message': 'User not found'})
+    
+    stats = UserStorageStats.get_for_user(user_id, fresh=request.GET.get('fresh') in ('1', 'true'))
+    
+    return JsonResponse({
+        'user': username,
+        'folders_created': stats.folders_created,
+        'files_uploaded': stats.files_uploaded,
+        'files_processed': stats.files_processed,
+        'files_with_inference': stats.files_with_inference,
+        'files_with_config': stats.files_with_config,
+        'total_chunks': stats.total_chunks,
+        'total_storage_bytes': stats.total_storage_bytes,
+        'total_storage_mb': round(stats.total_storage_bytes / (1024 * 1024), 2),
+        'refreshed_at': stats.refreshed_at.isoformat()
+    })
 
 # ==================== ENHANCED API ENDPOINTS (Flask Reference Pattern) ====================
 
 @csrf_exempt
 @require_http_methods(["GET"])
 def api_file_processing_status(request, file_id):
-    """Get detailed processing status for a file"""
+    """Get detailed processing status for a file (?refresh=1 re-syncs from disk)"""
     try:
         file_obj = UploadedFile.objects.get(id=file_id)
-        processing_info = get_file_processing_info(file_obj)
         
-        # Update model with current status
-        file_obj.has_chunks = processing_info.get('has_chunks', False)
-        file_obj.has_inference = processing_info.get('has_inference', False)
-        file_obj.has_config = processing_info.get('has_config', False)
-        file_obj.chunk_count = processing_info.get('chunk_count', 0)
-        file_obj.processing_status = processing_info.get('status', 'raw')
-        file_obj.processing_hash = processing_info.get('processing_hash')
-        file_obj.save()
+        # Stored state is authoritative; refresh reconciles it with the processing directory
+        if request.GET.get('refresh') in ('1', 'true'):
+            file_obj.update_processing_status()
+        processing_info = get_file_processing_info(file_obj)
         
         return JsonResponse({
             'file_id': file_obj.id,
@@ -318,15 +437,55 @@ def api_file_processing_status(request, file_id):
             'has_inference': processing_info.get('has_inference', False),
             'has_config': processing_info.get('has_config', False),
             'chunk_count': processing_info.get('chunk_count', 0),
+            'has_record_index': processing_info.get('has_record_index', False),
             'processing_date': file_obj.uploaded_at.isoformat() if file_obj.uploaded_at else None
         })
     except UploadedFile.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'File not found'})
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def api_process_file(request, file_id):
+    """
+    Queue chunking of a CSV/JSON/Parquet file into CHUNK_SIZE-record chunks.
+    Returns 202 with the job; poll /api/jobs/<id>/ for progress.
+    """
+    try:
+        file_obj = UploadedFile.objects.get(id=file_id)
+    except UploadedFile.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'File not found'})
+    
+    if file_obj.extension not in CHUNKABLE_TYPES:
+        return JsonResponse({'status': 'error', 'message': f'Cannot chunk .{file_obj.extension} files'}, status=400)
+    chunk_format = request.POST.get('chunk_format')
+    if chunk_format:
+        if chunk_format not in dict(CHUNK_FORMAT_CHOICES):
+            return JsonResponse({'status': 'error', 'message': f'Unknown chunk format: {chunk_format}'}, status=400)
+        previous_format = file_obj.get_chunk_format()
+        file_obj.chunk_format = chunk_format
+        file_obj.save(update_fields=['chunk_format'])
+        if chunk_format != previous_format:
+            # The stored chunk flags described the previous format's chunks
+            file_obj.update_processing_status()
+    initialize_file_processing(file_obj)
+    job = enqueue_job(file_obj, 'chunk', chunk_format=file_obj.get_chunk_format())
+    return JsonResponse({
+        'status': 'success',
+        'file_id': file_obj.id,
+        'chunk_format': file_obj.get_chunk_format(),
+        'job': serialize_job(job)
+    }, status=202)
+
 @csrf_exempt
 @require_http_methods(["GET"])
+@vary_on_headers('Accept')
+@condition(etag_func=chunk_etag, last_modified_func=chunk_last_modified)
 def api_file_chunks(request, file_id, chunk_number):
-    """Get chunk data (Flask reference pattern)"""
+    """
+    Get chunk data (Flask reference pattern). ?columns=a,b projects columns (Arrow
+    chunks read only those columns); ?format=arrow or an Arrow Accept header
+    returns an Arrow IPC stream instead of JSON.
+    """
     try:
         file_obj = UploadedFile.objects.get(id=file_id)
         processing_info = get_file_processing_info(file_obj)
@@ -334,25 +493,148 @@ def api_file_chunks(request, file_id, chunk_number):
         if not processing_info.get('has_chunks'):
             return JsonResponse({'status': 'error', 'message': 'File not processed into chunks'})
         
-        chunk_path = os.path.join(processing_info['processing_dir'], f"{chunk_number}.json.gz")
+        # The manifest answers existence without touching the directory
+        manifest = get_file_manifest(file_obj)
+        entry = None
+        chunk_format = 'json'
+        chunks_dir = file_obj.get_chunks_dir()
+        if manifest is not None:
+            chunk_format = manifest.chunk_format
+            chunks_dir = manifest.chunks_path(chunks_dir)
+            entry = manifest.chunk(chunk_number)
+            if entry is None:
+                return JsonResponse({'status': 'error', 'message': 'Chunk not found'}, status=404)
+        elif not os.path.exists(chunk_path(chunks_dir, chunk_number)):
+            return JsonResponse({'status': 'error', 'message': 'Chunk not found'}, status=404)
         
-        if not os.path.exists(chunk_path):
-            return JsonResponse({'status': 'error', 'message': 'Chunk not found'}, status=410)
+        columns = [column for column in request.GET.get('columns', '').split(',') if column] or None
+        wants_arrow = (request.GET.get('format') == 'arrow'
+                       or ARROW_STREAM_CONTENT_TYPE in request.META.get('HTTP_ACCEPT', ''))
         
         try:
-            with gzip.open(chunk_path, "rb") as f:
-                data = json.load(f)
-                return JsonResponse({
-                    'chunk_number': chunk_number,
-                    'chunk_data': data,
-                    'record_count': len(data) if isinstance(data, list) else 1
-                })
+            if wants_arrow:
+                # No JSON serialization at all: Arrow buffers go straight into the stream
+                table = read_chunk_table(chunks_dir, chunk_number, chunk_format, columns)
+                response = HttpResponse(arrow_stream_bytes(table), content_type=ARROW_STREAM_CONTENT_TYPE)
+                response['X-Chunk-Number'] = str(chunk_number)
+                if entry is not None:
+                    response['X-First-Record'] = str(entry['first_record'])
+                return response
+            
+            data = read_chunk(chunks_dir, chunk_number, chunk_format, columns)
+            response = {
+                'chunk_number': chunk_number,
+                'chunk_data': data,
+                'record_count': len(data) if isinstance(data, list) else 1
+            }
+            if entry is not None:
+                response['first_record'] = entry['first_record']
+                response['total_records'] = manifest.record_count
+            return JsonResponse(response)
+        except UnsupportedFileType as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=406)
+        except KeyError as e:
+            return JsonResponse({'status': 'error', 'message': e.args[0]}, status=400)
+        except FileNotFoundError:
+            # Re-chunked twice since the manifest was read: its set is gone
+            return JsonResponse({'status': 'error', 'message': 'Chunks were replaced while reading; retry'},
+                                status=409)
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': f'Error reading chunk: {str(e)}'})
             
     except UploadedFile.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'File not found'})
 
+@csrf_exempt
+@require_http_methods(["GET"])
+@condition(etag_func=sidecar_etag(MANIFEST_NAME), last_modified_func=sidecar_last_modified(MANIFEST_NAME))
+def api_file_manifest(request, file_id):
+    """Chunk manifest: record range, size and checksum of every chunk"""
+    try:
+        file_obj = UploadedFile.objects.get(id=file_id)
+        manifest = get_file_manifest(file_obj)
+        if manifest is None:
+            return JsonResponse({'status': 'error', 'message': 'File has no chunk manifest'}, status=404)
+        return JsonResponse({
+            'file_id': file_obj.id,
+            'record_count': manifest.record_count,
+            'chunk_count': manifest.chunk_count,
+            'chunk_size': manifest.chunk_size,
+            'chunks': [manifest.chunk(number) for number in range(1, manifest.chunk_count + 1)]
+        })
+    except UploadedFile.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'File not found'})
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_file_record(request, file_id, record_index):
+    """One record by global (0-based) index, located through the manifest"""
+    try:
+        file_obj = UploadedFile.objects.get(id=file_id)
+        manifest = get_file_manifest(file_obj)
+        if manifest is None:
+            return JsonResponse({'status': 'error', 'message': 'File has no chunk manifest'}, status=404)
+        location = manifest.locate(record_index)
+        if location is None:
+            return JsonResponse({
+                'status': 'error',
+                'message': f'Record {record_index} out of range (0-{manifest.record_count - 1})'
+            }, status=404)
+        # Inflates only the frame holding the record
+        frames = iter_record_range(file_obj.get_chunks_dir(), manifest, record_index, record_index + 1)
+        return JsonResponse({
+            'file_id': file_obj.id,
+            'record_index': record_index,
+            'chunk_number': location[0],
+            'record': next(frames)[0]
+        })
+    except UploadedFile.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'File not found'})
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_file_records(request, file_id):
+    """Stream records [start, start+limit) decompressing only the frames that cover them"""
+    try:
+        file_obj = UploadedFile.objects.get(id=file_id)
+    except UploadedFile.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'File not found'})
+
+    manifest = get_file_manifest(file_obj)
+    if manifest is None:
+        return JsonResponse({'status': 'error', 'message': 'File has no chunk manifest'}, status=404)
+
+    max_limit = get_chunking_settings()['RECORDS_MAX_LIMIT']
+    try:
+        start = int(request.GET.get('start', 0))
+        limit = min(int(request.GET.get('limit', 100)), max_limit)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'start and limit must be integers'}, status=400)
+    if start < 0 or limit < 1:
+        return JsonResponse({'status': 'error', 'message': 'start must be >= 0 and limit >= 1'}, status=400)
+
+    stop = min(start + limit, manifest.record_count)
+    count = max(stop - start, 0)
+    header = {
+        'file_id': file_obj.id,
+        'start': start,
+        'count': count,
+        'total_records': manifest.record_count,
+        'next_start': stop if stop < manifest.record_count else None
+    }
+
+    def stream():
+        # Header fields first, then the records frame by frame
+        yield json.dumps(header)[:-1] + ', "records": ['
+        separator = ''
+        for records in iter_record_range(file_obj.get_chunks_dir(), manifest, start, stop):
+            if records:
+                yield separator + ','.join(json.dumps(record) for record in records)
+                separator = ','
+        yield ']}'
+
+    return StreamingHttpResponse(stream(), content_type='application/json')
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def api_file_inference(request, file_id):
@@ -361,14 +643,17 @@ def api_file_inference(request, file_id):
         file_obj = UploadedFile.objects.get(id=file_id)
         processing_info = get_file_processing_info(file_obj)
         
-        if not processing_info.get('has_inference'):
-            return JsonResponse({'status': 'error', 'message': 'No inference available for this file'})
-        
-        inference_file = os.path.join(processing_info['processing_dir'], "inference", "inference.json")
+        inference_file = os.path.join(file_obj.get_processing_dir(), "inference", "inference.json")
         
         if not os.path.exists(inference_file):
+            if not processing_info.get('has_inference'):
+                return JsonResponse({'status': 'error', 'message': 'No inference available for this file'})
             return JsonResponse({'status': 'error', 'message': 'Inference file not found'})
         
+        if not processing_info.get('has_inference'):
+            # Result was written by an external process; record it
+            file_obj.set_processing_state(has_inference=True)
+        
         try:
             with open(inference_file, 'r') as f:
                 inference_data = json.load(f)
@@ -389,13 +674,13 @@ def api_upload_config(request, file_id):
     """Upload configuration file for processing"""
     try:
         file_obj = UploadedFile.objects.get(id=file_id)
-        processing_info = get_file_processing_info(file_obj)
+        processing_dir = file_obj.get_processing_dir()
         
         # Initialize processing if not already done
-        if not os.path.exists(processing_info['processing_dir']):
-            processing_info = initialize_file_processing(file_obj)
+        if not os.path.exists(processing_dir):
+            initialize_file_processing(file_obj)
         
-        config_path = os.path.join(processing_info['processing_dir'], "config.json")
+        config_path = os.path.join(processing_dir, "config.json")
         
         if 'file' in request.FILES:
             # Upload config file
@@ -409,10 +694,8 @@ def api_upload_config(request, file_id):
             with open(config_path, 'w') as f:
                 json.dump(config_data, f, indent=2)
         
-        # Update model
-        file_obj.has_config = True
-        file_obj.config_added = True
-        file_obj.save()
+        # Update stored state for every file sharing this processing directory
+        file_obj.set_processing_state(has_config=True)
         
         return JsonResponse({'status': 'success', 'message': 'Config uploaded successfully'})
         
@@ -423,13 +706,12 @@ def api_upload_config(request, file_id):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@condition(etag_func=sidecar_etag('config.json'), last_modified_func=sidecar_last_modified('config.json'))
 def api_get_config(request, file_id):
     """Get configuration file for a file"""
     try:
         file_obj = UploadedFile.objects.get(id=file_id)
-        processing_info = get_file_processing_info(file_obj)
-        
-        config_path = os.path.join(processing_info['processing_dir'], "config.json")
+        config_path = os.path.join(file_obj.get_processing_dir(), "config.json")
         
         if not os.path.exists(config_path):
             return JsonResponse({'status': 'error', 'message': 'Config file not found'})
@@ -447,32 +729,22 @@ def api_get_config(request, file_id):
     except UploadedFile.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'File not found'})
 
+@csrf_exempt
+def api_file_config(request, file_id):
+    """GET reads the file's config (conditional: ETag / Last-Modified), POST uploads it"""
+    if request.method == 'POST':
+        return api_upload_config(request, file_id)
+    return api_get_config(request, file_id)
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def api_file_preview(request, file_id):
-    """Preview file content (first 10 records like Flask reference)"""
+    """
+    Preview file content: the first records of CSV/JSON/Parquet files from the
+    preview.json sidecar (built once, from a bounded read), else the first 5KB of text
+    """
     try:
         file_obj = UploadedFile.objects.get(id=file_id)
-        processing_info = get_file_processing_info(file_obj)
-        
-        # Try to get preview from processed chunks first
-        if processing_info.get('has_chunks'):
-            first_chunk_path = os.path.join(processing_info['processing_dir'], "1.json.gz")
-            if os.path.exists(first_chunk_path):
-                try:
-                    with gzip.open(first_chunk_path, "rb") as f:
-                        data = json.load(f)
-                        preview_data = data[1:11] if isinstance(data, list) and len(data) > 1 else data[:10]
-                        return JsonResponse({
-                            'file_id': file_id,
-                            'preview_type': 'processed',
-                            'data': preview_data,
-                            'total_records': len(data) if isinstance(data, list) else 1
-                        })
-                except Exception:
-                    pass
-        
-        # Fallback to raw file preview
         if not file_obj.file:
             return JsonResponse({'status': 'error', 'message': 'File not found'})
         
@@ -480,12 +752,24 @@ def api_file_preview(request, file_id):
         if not os.path.exists(file_path):
             return JsonResponse({'status': 'error', 'message': 'File not accessible'})
         
-        mimetype = mimetypes.guess_type(file_path)[0]
+        preview = ensure_preview(file_obj)
+        if preview is not None:
+            manifest = get_file_manifest(file_obj)
+            return JsonResponse({
+                'file_id': file_id,
+                'preview_type': 'records',
+                'columns': preview['columns'],
+                'schema': preview.get('schema'),
+                'data': preview['records'],
+                'total_records': manifest.record_count if manifest is not None else preview['total_records']
+            })
+        
+        mimetype = mimetypes.guess_type(file_obj.display_name)[0]
         
         if mimetype and (mimetype.startswith('text/') or mimetype == 'application/json'):
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()[:5000]  # First 5KB
+                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                    content = f.read(5000)  # First 5KB only
                     return JsonResponse({
                         'file_id': file_id,
                         'preview_type': 'text',
@@ -501,104 +785,143 @@ def api_file_preview(request, file_id):
             'preview_type': 'binary',
             'message': 'Binary file preview not supported',
             'mimetype': mimetype,
-            'file_size': os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            'file_size': os.path.getsize(file_path)
         })
         
     except UploadedFile.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'File not found'})
 
+def serialize_inference_record(record):
+    return {
+        'filename': record.filename,
+        'timestamp': record.timestamp.isoformat(),
+        'has_config': record.has_config,
+        'has_inference': record.has_inference,
+        'file_size': record.file_size
+    }
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def api_submit_inference(request, file_id):
+    """Store an inference result (JSON object body) and add it to the file's inference history"""
+    try:
+        file_obj = UploadedFile.objects.get(id=file_id)
+    except UploadedFile.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'File not found'}, status=404)
+    
+    try:
+        result = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Body must be JSON'}, status=400)
+    if not isinstance(result, dict):
+        return JsonResponse({'status': 'error', 'message': 'Inference result must be a JSON object'}, status=400)
+    
+    if not file_obj.get_processing_hash():
+        return JsonResponse({'status': 'error', 'message': 'File has no stored content'}, status=400)
+    record = save_inference_result(file_obj, result)
+    return JsonResponse({'status': 'success', 'file_id': file_id, 'inference': serialize_inference_record(record)})
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def api_available_inferences(request, file_id):
-    """Get list of available inference files with timestamps"""
+    """
+    List inference results newest first from the InferenceRecord index (no
+    result file is opened). Optional ?since=/?until= ISO timestamps bound the
+    range; ?cursor=/?limit= page through it; ?refresh=1 re-syncs the index
+    with the directory first (for results written outside the app).
+    """
     try:
         file_obj = UploadedFile.objects.get(id=file_id)
-        processing_info = get_file_processing_info(file_obj)
-        
-        if not processing_info.get('has_inference'):
-            return JsonResponse({'inferences': []})
-        
-        inference_dir = os.path.join(processing_info['processing_dir'], "inference")
-        
-        if not os.path.exists(inference_dir):
-            return JsonResponse({'inferences': []})
-        
-        inference_files = []
-        for filename in os.listdir(inference_dir):
-            if filename.startswith('conf_and_inf_') and filename.endswith('.json'):
-                file_path = os.path.join(inference_dir, filename)
-                try:
-                    with open(file_path, 'r') as f:
-                        data = json.load(f)
-                        inference_files.append({
-                            'filename': filename,
-                            'timestamp': data.get('timestamp'),
-                            'has_config': 'config' in data,
-                            'has_inference': 'inference' in data,
-                            'file_size': os.path.getsize(file_path)
-                        })
-                except Exception:
-                    continue
-        
-        # Sort by timestamp (newest first)
-        inference_files.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
-        return JsonResponse({
-            'file_id': file_id,
-            'inferences': inference_files,
-            'count': len(inference_files)
-        })
-        
     except UploadedFile.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'File not found'})
+    
+    if request.GET.get('refresh') in ('1', 'true'):
+        file_obj.update_processing_status()
+    
+    records = InferenceRecord.objects.filter(processing_hash=file_obj.get_processing_hash())
+    for param, lookup in (('since', 'timestamp__gte'), ('until', 'timestamp__lt')):
+        if request.GET.get(param):
+            value = parse_inference_timestamp(request.GET[param])
+            if value is None:
+                return JsonResponse({'status': 'error', 'message': f'Invalid {param} timestamp'}, status=400)
+            records = records.filter(**{lookup: value})
+    
+    try:
+        page, next_cursor = paginate_keyset(records, request.GET.get('cursor'), get_page_limit(request),
+                                            field='timestamp', descending=True)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    
+    inferences = [serialize_inference_record(record) for record in page]
+    return JsonResponse({
+        'file_id': file_id,
+        'inferences': inferences,
+        'count': len(inferences),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
+def serialize_contents_folder(folder):
+    return {
+        'id': folder.id,
+        'name': folder.name,
+        'allowed_type': folder.allowed_type,
+        'description': folder.description,
+        'is_public': folder.is_public,
+        'created_at': folder.created_at.isoformat() if folder.created_at else None
+    }
+
+def serialize_contents_file(file):
+    processing_info = get_file_processing_info(file)
+    return {
+        'id': file.id,
+        'name': file.display_name,
+        'original_name': file.original_name,
+        'size': file.file_size,
+        'uploaded_at': file.uploaded_at.isoformat() if file.uploaded_at else None,
+        'uploaded_by': file.uploaded_by.username if file.uploaded_by else None,
+        'description': file.description,
+        'is_public': file.is_public,
+        'processed': processing_info.get('has_chunks', False),
+        'has_inference': processing_info.get('has_inference', False),
+        'has_config': processing_info.get('has_config', False),
+        'processing_status': processing_info.get('status', 'raw'),
+        'chunk_count': processing_info.get('chunk_count', 0)
+    }
+
+def serialize_contents_subfolder(subfolder):
+    return {
+        'id': subfolder.id,
+        'name': subfolder.name,
+        'allowed_type': subfolder.allowed_type,
+        'file_count': subfolder.file_count,
+        'description': subfolder.description,
+        'is_public': subfolder.is_public
+    }
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@condition(etag_func=folder_contents_etag)
 def api_folder_contents(request, folder_id):
-    """Get detailed folder contents with processing status"""
+    """Get detailed folder contents with processing status (?stream=1 / ?format=ndjson stream it)"""
+    stream_format = get_stream_format(request)
+    if stream_format:
+        return stream_folder_contents(folder_id, stream_format)
+    return cache.cached_response('api_folder_contents', [cache.folder_version(folder_id)],
+                                 lambda: build_folder_contents(folder_id), folder_id)
+
+def build_folder_contents(folder_id):
     try:
         folder = Folder.objects.get(id=folder_id)
         
-        files_data = []
-        for file in folder.files.all():
-            processing_info = get_file_processing_info(file)
-            files_data.append({
-                'id': file.id,
-                'name': os.path.basename(file.file.name) if file.file else file.original_name,
-                'original_name': file.original_name,
-                'size': file.file_size,
-                'uploaded_at': file.uploaded_at.isoformat() if file.uploaded_at else None,
-                'uploaded_by': file.uploaded_by.username if file.uploaded_by else None,
-                'description': file.description,
-                'is_public': file.is_public,
-                'processed': processing_info.get('has_chunks', False),
-                'has_inference': processing_info.get('has_inference', False),
-                'has_config': processing_info.get('has_config', False),
-                'processing_status': processing_info.get('status', 'raw'),
-                'chunk_count': processing_info.get('chunk_count', 0)
-            })
+        files_data = [serialize_contents_file(file) for file in folder.files.select_related('uploaded_by')]
         
         # Get subfolders
-        subfolders_data = []
-        for subfolder in folder.subfolders.all():
-            subfolders_data.append({
-                'id': subfolder.id,
-                'name': subfolder.name,
-                'allowed_type': subfolder.allowed_type,
-                'file_count': subfolder.files.count(),
-                'description': subfolder.description,
-                'is_public': subfolder.is_public
-            })
+        subfolders_data = [serialize_contents_subfolder(subfolder)
+                           for subfolder in folder.subfolders.annotate(file_count=Count('files'))]
         
         return JsonResponse({
-            'folder': {
-                'id': folder.id,
-                'name': folder.name,
-                'allowed_type': folder.allowed_type,
-                'description': folder.description,
-                'is_public': folder.is_public,
-                'created_at': folder.created_at.isoformat() if folder.created_at else None
-            },
+            'folder': serialize_contents_folder(folder),
             'files': files_data,
             'subfolders': subfolders_data,
             'total_files': len(files_data),
@@ -607,3 +930,602 @@ def api_folder_contents(request, folder_id):
         
     except Folder.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'Folder not found'})
+
+def stream_folder_contents(folder_id, stream_format):
+    """
+    The api_folder_contents document with files and subfolders encoded as they
+    are fetched (totals follow the lists), or NDJSON: the folder, then one line
+    per file and subfolder, each tagged with its ``type``
+    """
+    try:
+        folder = Folder.objects.get(id=folder_id)
+    except Folder.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Folder not found'})
+    files = (serialize_contents_file(file) for file in iter_queryset(folder.files.select_related('uploaded_by')))
+    subfolders = (serialize_contents_subfolder(subfolder)
+                  for subfolder in iter_queryset(folder.subfolders.annotate(file_count=Count('files'))))
+    if stream_format == 'ndjson':
+        def lines():
+            yield dict(serialize_contents_folder(folder), type='folder')
+            for file in files:
+                yield dict(file, type='file')
+            for subfolder in subfolders:
+                yield dict(subfolder, type='subfolder')
+        return streaming_ndjson_response(lines())
+    files = StreamedList(files)
+    subfolders = StreamedList(subfolders)
+    return streaming_json_response([
+        ('folder', serialize_contents_folder(folder)),
+        ('files', files),
+        ('subfolders', subfolders),
+        ('total_files', lambda: files.count),
+        ('total_subfolders', lambda: subfolders.count)
+    ])
+
+# ==================== FOLDER HIERARCHY ====================
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_folder_tree(request, folder_id):
+    """Whole subtree of a folder as nested JSON (one query, ?file_counts=1 adds per-folder counts)"""
+    try:
+        folder = Folder.objects.get(id=folder_id)
+    except Folder.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Folder not found'})
+
+    with_counts = request.GET.get('file_counts') in ('1', 'true')
+    subtree = folder.get_descendants(include_self=True).only(
+        'id', 'name', 'parent_id', 'allowed_type', 'path', 'depth'
+    )
+    if with_counts:
+        subtree = subtree.annotate(file_count=Count('files'))
+
+    def serialize_node(node):
+        data = {
+            'id': node.id,
+            'name': node.name,
+            'allowed_type': node.allowed_type,
+            'depth': node.depth - folder.depth,
+            'children': [serialize_node(child) for child in node.children]
+        }
+        if with_counts:
+            data['file_count'] = node.file_count
+        return data
+
+    root = Folder.build_tree(subtree)[0]
+    return JsonResponse({'tree': serialize_node(root)})
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_folder_ancestors(request, folder_id):
+    """Breadcrumb path from the root folder down to this folder"""
+    try:
+        folder = Folder.objects.get(id=folder_id)
+    except Folder.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Folder not found'})
+
+    breadcrumbs = [{'id': a.id, 'name': a.name} for a in folder.get_ancestors().only('id', 'name', 'depth')]
+    breadcrumbs.append({'id': folder.id, 'name': folder.name})
+    return JsonResponse({
+        'folder_id': folder.id,
+        'ancestors': breadcrumbs[:-1],
+        'breadcrumbs': breadcrumbs,
+        'path': '/'.join(crumb['name'] for crumb in breadcrumbs)
+    })
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_folder_stats(request, folder_id):
+    """Descendant folder count and file count/size for a whole subtree"""
+    try:
+        folder = Folder.objects.get(id=folder_id)
+    except Folder.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Folder not found'})
+
+    stats = folder.get_subtree_stats()
+    return JsonResponse({
+        'folder_id': folder.id,
+        'descendant_folders': stats['folder_count'],
+        'file_count': stats['file_count'],
+        'total_size_bytes': stats['total_size'],
+        'total_size_mb': round(stats['total_size'] / (1024 * 1024), 2)
+    })
+
+# ==================== RESUMABLE UPLOAD SESSIONS ====================
+
+def serialize_upload_session(session):
+    """Session state including which chunks the server already holds"""
+    received = dict(session.chunks.values_list('number', 'size'))
+    total_chunks = session.total_chunks
+
+    # Contiguous bytes from the start, for clients that resume sequentially
+    next_offset = 0
+    for number in range(total_chunks):
+        if number not in received:
+            break
+        next_offset += received[number]
+
+    return {
+        'session_id': str(session.id),
+        'status': session.status,
+        'original_name': session.original_name,
+        'folder_id': session.folder_id,
+        'total_size': session.total_size,
+        'chunk_size': session.chunk_size,
+        'total_chunks': total_chunks,
+        'received_chunks': sorted(received),
+        'missing_chunks': [n for n in range(total_chunks) if n not in received],
+        'bytes_received': sum(received.values()),
+        'next_offset': next_offset,
+        'file_id': session.uploaded_file_id
+    }
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def api_create_upload_session(request):
+    """Start a resumable upload; the client then PUTs numbered chunks and finalizes"""
+    try:
+        data = json.loads(request.body)
+        original_name = os.path.basename(data.get('filename') or '')
+        total_size = int(data.get('size', -1))
+        folder_id = data.get('folder_id')
+
+        if not original_name:
+            return JsonResponse({'status': 'error', 'message': 'filename is required'})
+        if total_size < 0:
+            return JsonResponse({'status': 'error', 'message': 'size is required'})
+        if total_size > settings.ENCRYPTION_SETTINGS['MAX_FILE_SIZE']:
+            return JsonResponse({
+                'status': 'error',
+                'message': f"File exceeds maximum size of {settings.ENCRYPTION_SETTINGS['MAX_FILE_SIZE']} bytes"
+            })
+
+        # Validate file type up front so no bytes are sent for a rejected file
+        if folder_id:
+            folder = Folder.objects.get(id=folder_id)
+            ext = original_name.split('.')[-1].lower()
+            if folder.allowed_type and ext != folder.allowed_type:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': f'File type .{ext} not allowed in this folder (allowed: .{folder.allowed_type})'
+                })
+
+        session = UploadSession.objects.create(
+            folder_id=folder_id,
+            uploaded_by_id=data.get('user_id'),
+            original_name=original_name,
+            description=data.get('description', ''),
+            is_public=data.get('is_public', True),
+            process_file=data.get('process', False),
+            total_size=total_size,
+            chunk_size=settings.ENCRYPTION_SETTINGS['MAX_CHUNK_SIZE']
+        )
+
+        # Sparse part file at full size so chunks can be written at any offset in parallel
+        part_path = session.get_part_path()
+        os.makedirs(os.path.dirname(part_path), exist_ok=True)
+        with open(part_path, 'wb') as f:
+            f.truncate(total_size)
+
+        return JsonResponse({'status': 'success', 'session': serialize_upload_session(session)})
+    except Folder.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Folder not found'})
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
+@csrf_exempt
+@require_http_methods(["GET", "DELETE"])
+def api_upload_session(request, session_id):
+    """Get upload progress (GET) or abort the upload (DELETE)"""
+    try:
+        session = UploadSession.objects.get(id=session_id)
+    except UploadSession.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Upload session not found'})
+
+    if request.method == 'DELETE':
+        if session.status == 'active':
+            part_path = session.get_part_path()
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            session.status = 'aborted'
+            session.save(update_fields=['status', 'updated_at'])
+        return JsonResponse({'status': 'success', 'session': serialize_upload_session(session)})
+
+    return JsonResponse({'status': 'success', 'session': serialize_upload_session(session)})
+
+@csrf_exempt
+@require_http_methods(["PUT"])
+def api_upload_chunk(request, session_id, chunk_number):
+    """
+    Write one chunk (raw request body) at offset chunk_number * chunk_size.
+    Chunks may arrive in any order and in parallel; an optional
+    X-Chunk-Checksum header (SHA-256 hex) is verified before the chunk counts.
+    """
+    try:
+        session = UploadSession.objects.get(id=session_id)
+    except UploadSession.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Upload session not found'})
+
+    if session.status != 'active':
+        return JsonResponse({'status': 'error', 'message': f'Upload session is {session.status}'}, status=409)
+    if chunk_number < 0 or chunk_number >= session.total_chunks:
+        return JsonResponse({'status': 'error', 'message': 'Chunk number out of range'}, status=400)
+
+    expected_size = session.expected_chunk_size(chunk_number)
+    offset = chunk_number * session.chunk_size
+    hasher = hashlib.sha256()
+    received = 0
+
+    try:
+        fd = os.open(session.get_part_path(), os.O_WRONLY)
+    except FileNotFoundError:
+        # Finalized (renamed into the blob store) or aborted since the status check
+        return JsonResponse({'status': 'error', 'message': 'Upload session is no longer accepting chunks'},
+                            status=409)
+    try:
+        # Shared lock: chunks are written in parallel, while finalize takes it
+        # exclusively and so waits for every write already in progress
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        status = UploadSession.objects.filter(id=session.id).values_list('status', flat=True).first()
+        if status != 'active':
+            return JsonResponse({'status': 'error', 'message': f'Upload session is {status}'}, status=409)
+
+        # A re-sent chunk overwrites the region, so it only counts again once verified
+        UploadSessionChunk.objects.filter(session=session, number=chunk_number).delete()
+
+        while received < expected_size:
+            data = request.read(min(64 * 1024, expected_size - received))
+            if not data:
+                break
+            os.pwrite(fd, data, offset + received)
+            hasher.update(data)
+            received += len(data)
+
+        if received != expected_size or request.read(1):
+            return JsonResponse({
+                'status': 'error',
+                'message': f'Chunk {chunk_number} must be exactly {expected_size} bytes'
+            }, status=400)
+
+        checksum = hasher.hexdigest()
+        client_checksum = request.headers.get('X-Chunk-Checksum')
+        if client_checksum and client_checksum.lower() != checksum:
+            return JsonResponse({
+                'status': 'error',
+                'message': f'Checksum mismatch for chunk {chunk_number}',
+                'checksum': checksum
+            }, status=400)
+
+        # Recorded before the lock is released, so finalize sees every finished chunk
+        try:
+            UploadSessionChunk.objects.update_or_create(
+                session=session, number=chunk_number,
+                defaults={'size': received, 'checksum': checksum}
+            )
+        except IntegrityError:
+            # Same chunk PUT twice concurrently; the bytes are identical, the other request recorded it
+            pass
+    finally:
+        # Closing releases the lock
+        os.close(fd)
+
+    return JsonResponse({
+        'status': 'success',
+        'chunk_number': chunk_number,
+        'size': received,
+        'checksum': checksum
+    })
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def api_complete_upload_session(request, session_id):
+    """Finalize: move the part file into the blob store and create the UploadedFile"""
+    try:
+        session = UploadSession.objects.get(id=session_id)
+    except UploadSession.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Upload session not found'})
+    if session.status != 'active':
+        return JsonResponse({'status': 'error', 'message': f'Upload session is {session.status}'}, status=409)
+    incomplete = get_incomplete_upload_response(session)
+    if incomplete is not None:
+        return incomplete
+
+    # Claim the session with one conditional UPDATE (row locks are a no-op on
+    # SQLite): only one concurrent finalize wins, and new chunk PUTs are refused
+    claimed = UploadSession.objects.filter(id=session.id, status='active').update(
+        status='finalizing', updated_at=timezone.now()
+    )
+    if claimed != 1:
+        session.refresh_from_db(fields=['status'])
+        return JsonResponse({'status': 'error', 'message': f'Upload session is {session.status}'}, status=409)
+    session.status = 'finalizing'
+
+    part_path = session.get_part_path()
+    try:
+        fd = os.open(part_path, os.O_RDONLY)
+    except FileNotFoundError:
+        UploadSession.objects.filter(id=session.id).update(status='aborted')
+        return JsonResponse({'status': 'error', 'message': 'Upload part file is missing'}, status=409)
+    try:
+        # Waits for chunk writes that started before the status changed
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        # A re-sent chunk that failed verification while we waited no longer counts
+        incomplete = get_incomplete_upload_response(session)
+        if incomplete is not None:
+            UploadSession.objects.filter(id=session.id).update(status='active')
+            return incomplete
+
+        with transaction.atomic():
+            file_obj = UploadedFile(
+                folder_id=session.folder_id,
+                uploaded_by_id=session.uploaded_by_id,
+                description=session.description,
+                is_public=session.is_public,
+                original_name=session.original_name,
+                file_size=session.total_size
+            )
+
+            # Renamed into the blob store (no second copy); dropped if the content is already stored
+            blob = ingest_path(part_path)
+            file_obj.blob = blob
+            file_obj.file = blob.storage_name
+            file_obj.save()
+
+            session.status = 'completed'
+            session.uploaded_file = file_obj
+            session.save(update_fields=['status', 'uploaded_file', 'updated_at'])
+    except Exception as e:
+        # Resumable again unless the part file is already gone
+        UploadSession.objects.filter(id=session.id, status='finalizing').update(
+            status='active' if os.path.exists(part_path) else 'aborted'
+        )
+        return JsonResponse({'status': 'error', 'message': str(e)})
+    finally:
+        os.close(fd)
+
+    processing_info = {}
+    if session.process_file:
+        processing_info = start_file_processing(file_obj)
+
+    return JsonResponse({
+        'status': 'success',
+        'file': {
+            'id': file_obj.id,
+            'name': file_obj.original_name,
+            'size': file_obj.file_size,
+            'url': file_obj.file.url,
+            'processing_info': processing_info
+        }
+    })
+
+def get_incomplete_upload_response(session):
+    """Error response while chunks are missing, else None"""
+    state = serialize_upload_session(session)
+    if state['missing_chunks'] or state['bytes_received'] != session.total_size:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Upload incomplete',
+            'missing_chunks': state['missing_chunks']
+        })
+    return None
+
+# ==================== PROCESSING JOBS ====================
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_job_status(request, job_id):
+    """Status and progress (records done/total) of a processing job"""
+    try:
+        job = ProcessingJob.objects.get(id=job_id)
+    except ProcessingJob.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Job not found'}, status=404)
+    return JsonResponse({'job': serialize_job(job)})
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def api_cancel_job(request, job_id):
+    """Cancel a queued job, or ask a running one to stop at its next progress report"""
+    try:
+        job = ProcessingJob.objects.get(id=job_id)
+    except ProcessingJob.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Job not found'}, status=404)
+    if not job.request_cancel():
+        return JsonResponse({'status': 'error', 'message': f'Job already {job.status}', 'job': serialize_job(job)},
+                            status=409)
+    return JsonResponse({'status': 'success', 'job': serialize_job(job)})
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_file_jobs(request, file_id):
+    """Processing jobs of a file, newest first (?status= filters)"""
+    if not UploadedFile.objects.filter(id=file_id).exists():
+        return JsonResponse({'status': 'error', 'message': 'File not found'})
+    jobs = ProcessingJob.objects.filter(file_id=file_id)
+    if request.GET.get('status'):
+        jobs = jobs.filter(status=request.GET['status'])
+    try:
+        page, next_cursor = paginate_keyset(jobs, request.GET.get('cursor'), get_page_limit(request), descending=True)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    job_data = [serialize_job(job) for job in page]
+    return JsonResponse({
+        'file_id': file_id,
+        'jobs': job_data,
+        'count': len(job_data),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
+# ==================== SEARCH ====================
+
+SEARCH_KINDS = ('file', 'folder')
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_search(request):
+    """
+    Ranked metadata search over file and folder names, descriptions, folder
+    paths and types. Every word of ?q= is a prefix match; ?type=file|folder
+    narrows the kind, ?limit= and ?offset= page through the ranking.
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'status': 'error', 'message': 'q is required'}, status=400)
+    kind = request.GET.get('type') or None
+    if kind is not None and kind not in SEARCH_KINDS:
+        return JsonResponse({'status': 'error', 'message': f'type must be one of: {", ".join(SEARCH_KINDS)}'},
+                            status=400)
+    try:
+        offset = max(0, int(request.GET.get('offset', 0)))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'offset must be an integer'}, status=400)
+    limit = get_page_limit(request)
+    results = search.search(query, kind=kind, limit=limit, offset=offset)
+    return JsonResponse({
+        'query': query,
+        'results': results,
+        'count': len(results),
+        'offset': offset,
+        'has_more': len(results) == limit,
+        'ranked': search.search_available()
+    })
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def api_index_file_records(request, file_id):
+    """
+    Queue building the record index (field/value -> chunk and offset) of a
+    chunked file. Returns 202 with the job; rebuilt automatically after re-chunking.
+    """
+    try:
+        file_obj = UploadedFile.objects.get(id=file_id)
+    except UploadedFile.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'File not found'}, status=404)
+    if file_obj.extension not in CHUNKABLE_TYPES:
+        return JsonResponse({'status': 'error', 'message': f'Cannot index .{file_obj.extension} files'}, status=400)
+    if not file_obj.has_chunks:
+        return JsonResponse({'status': 'error', 'message': 'File has no chunks; process it first'}, status=409)
+    job = enqueue_job(file_obj, 'index', chunk_format=file_obj.get_chunk_format())
+    return JsonResponse({'status': 'success', 'file_id': file_obj.id, 'job': serialize_job(job)}, status=202)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_search_records(request):
+    """
+    Records whose ?field= (any field when omitted) equals ?value= (or starts
+    with it, ?prefix=1), across every file with a record index, optionally
+    within ?folder_id= (subtree) or ?file_id=1,2. Copies are searched once.
+    Only chunks holding a hit are read. ?limit= and ?cursor= page the results.
+    """
+    value = request.GET.get('value', '').strip()
+    if not value:
+        return JsonResponse({'status': 'error', 'message': 'value is required'}, status=400)
+    field = request.GET.get('field') or None
+    prefix = request.GET.get('prefix') in ('1', 'true')
+    limit = get_page_limit(request)
+    max_value_length = get_chunking_settings()['RECORD_INDEX_MAX_VALUE_LENGTH']
+
+    files = UploadedFile.objects.filter(has_record_index=True)
+    try:
+        if request.GET.get('folder_id'):
+            try:
+                folder_id = int(request.GET['folder_id'])
+            except ValueError:
+                raise ValueError('folder_id must be an integer') from None
+            folder = Folder.objects.get(id=folder_id)
+            files = files.filter(folder__path__startswith=folder.path)
+        if request.GET.get('file_id'):
+            try:
+                file_ids = [int(file_id) for file_id in request.GET['file_id'].split(',')]
+            except ValueError:
+                raise ValueError('file_id must be a comma-separated list of integers') from None
+            files = files.filter(id__in=file_ids)
+        after_file, after = 0, None
+        if request.GET.get('cursor'):
+            values = decode_cursor(request.GET['cursor'])
+            if len(values) != 3:
+                raise InvalidCursor('Invalid cursor')
+            try:
+                after_file, after = int(values[0]), (int(values[1]), int(values[2]))
+            except (TypeError, ValueError):
+                raise InvalidCursor('Invalid cursor')
+    except Folder.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Folder not found'}, status=404)
+    except ValueError as e:
+        # Raised above with a stable message (InvalidCursor included)
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    # One representative (lowest id) per processing directory and chunk format
+    candidates = files.annotate(effective_chunk_format=EFFECTIVE_CHUNK_FORMAT).values(
+        'processing_hash', 'effective_chunk_format'
+    ).annotate(file_id=Min('id')).filter(file_id__gte=after_file).order_by('file_id')
+    results = []
+    files_searched = 0
+    chunks_read = set()
+    for candidate in candidates.iterator():
+        if len(results) >= limit:
+            break
+        processing_dir = find_format_dir(os.path.join(settings.MEDIA_ROOT, candidate['processing_hash']),
+                                         candidate['effective_chunk_format'])
+        manifest = load_manifest(processing_dir)
+        index = RecordIndex.open(processing_dir)
+        if index is None:
+            continue
+        with index:
+            if not index.matches(manifest):
+                continue
+            files_searched += 1
+            hits = find_records(
+                processing_dir, manifest, index, value, field=field, prefix=prefix,
+                after=after if candidate['file_id'] == after_file else None,
+                limit=limit - len(results), max_value_length=max_value_length
+            )
+        for number, offset, record in hits:
+            chunks_read.add((candidate['file_id'], number))
+            results.append({
+                'file_id': candidate['file_id'],
+                'chunk': number,
+                'offset': offset,
+                'record_index': manifest.chunk(number)['first_record'] + offset,
+                'record': record
+            })
+
+    names = dict(UploadedFile.objects.filter(id__in={result['file_id'] for result in results}).values_list(
+        'id', 'original_name'
+    ))
+    for result in results:
+        result['file_name'] = os.path.basename(names.get(result['file_id']) or '')
+    next_cursor = None
+    if len(results) >= limit:
+        last = results[-1]
+        next_cursor = encode_cursor([last['file_id'], last['chunk'], last['offset']])
+    return JsonResponse({
+        'value': value,
+        'field': field,
+        'prefix': prefix,
+        'results': results,
+        'count': len(results),
+        'files_searched': files_searched,
+        'chunks_read': len(chunks_read),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+
+# ==================== RESPONSE CACHE ====================
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def api_cache_stats(request):
+    """Hit/miss counters of the folder response cache in this process (?reset=1 clears them after reading)"""
+    stats = cache.get_stats()
+    if request.GET.get('reset') in ('1', 'true'):
+        cache.reset_stats()
+    response_cache_settings = cache.get_response_cache_settings()
+    return JsonResponse({
+        'enabled': response_cache_settings['ENABLED'],
+        'cache_alias': response_cache_settings['ALIAS'],
+        'pid': os.getpid(),
+        'views': stats,
+        'hits': sum(view['hits'] for view in stats.values()),
+        'misses': sum(view['misses'] for view in stats.values())
+    })
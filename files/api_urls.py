@@ -7,8 +7,24 @@ from .api import (
     
     # Only include API endpoints that exist in api.py
     api_file_processing_status, api_file_chunks, api_file_inference,
-    api_upload_config, api_file_preview, api_available_inferences,
-    api_folder_contents
+    api_file_config, api_file_preview, api_available_inferences, api_submit_inference,
+    api_folder_contents, api_process_file, api_file_manifest, api_file_record, api_file_records,
+
+    # Folder hierarchy
+    api_folder_tree, api_folder_ancestors, api_folder_stats,
+
+    # Resumable uploads
+    api_create_upload_session, api_upload_session, api_upload_chunk,
+    api_complete_upload_session,
+
+    # Processing jobs
+    api_job_status, api_cancel_job, api_file_jobs,
+
+    # Search
+    api_search, api_index_file_records, api_search_records,
+
+    # Response cache
+    api_cache_stats
 )
 
 # API endpoints for integration
@@ -25,11 +41,38 @@ api_urlpatterns = [
     path('api/folders/<int:folder_id>/delete/', api_delete_folder, name='api_delete_folder'),
     
     # Enhanced processing endpoints
+    path('api/files/<int:file_id>/process/', api_process_file, name='api_process_file'),
     path('api/files/<int:file_id>/processing-status/', api_file_processing_status, name='api_file_processing_status'),
     path('api/files/<int:file_id>/chunks/<int:chunk_number>/', api_file_chunks, name='api_file_chunks'),
+    path('api/files/<int:file_id>/manifest/', api_file_manifest, name='api_file_manifest'),
+    path('api/files/<int:file_id>/records/', api_file_records, name='api_file_records'),
+    path('api/files/<int:file_id>/records/<int:record_index>/', api_file_record, name='api_file_record'),
     path('api/files/<int:file_id>/inference/', api_file_inference, name='api_file_inference'),
-    path('api/files/<int:file_id>/config/', api_upload_config, name='api_upload_config'),
+    path('api/files/<int:file_id>/config/', api_file_config, name='api_upload_config'),
     path('api/files/<int:file_id>/preview/', api_file_preview, name='api_file_preview'),
     path('api/files/<int:file_id>/inferences/', api_available_inferences, name='api_available_inferences'),
+    path('api/files/<int:file_id>/inferences/submit/', api_submit_inference, name='api_submit_inference'),
     path('api/folders/<int:folder_id>/contents/', api_folder_contents, name='api_folder_contents'),
+    path('api/folders/<int:folder_id>/tree/', api_folder_tree, name='api_folder_tree'),
+    path('api/folders/<int:folder_id>/ancestors/', api_folder_ancestors, name='api_folder_ancestors'),
+    path('api/folders/<int:folder_id>/stats/', api_folder_stats, name='api_folder_stats'),
+
+    # Resumable chunked uploads
+    path('api/uploads/', api_create_upload_session, name='api_create_upload_session'),
+    path('api/uploads/<uuid:session_id>/', api_upload_session, name='api_upload_session'),
+    path('api/uploads/<uuid:session_id>/chunks/<int:chunk_number>/', api_upload_chunk, name='api_upload_chunk'),
+    path('api/uploads/<uuid:session_id>/complete/', api_complete_upload_session, name='api_complete_upload_session'),
+
+    # Background processing jobs
+    path('api/jobs/<int:job_id>/', api_job_status, name='api_job_status'),
+    path('api/jobs/<int:job_id>/cancel/', api_cancel_job, name='api_cancel_job'),
+    path('api/files/<int:file_id>/jobs/', api_file_jobs, name='api_file_jobs'),
+
+    # Metadata search
+    path('api/search/', api_search, name='api_search'),
+    path('api/files/<int:file_id>/record-index/', api_index_file_records, name='api_index_file_records'),
+    path('api/records/search/', api_search_records, name='api_search_records'),
+
+    # Response cache
+    path('api/cache/stats/', api_cache_stats, name='api_cache_stats'),
 ]
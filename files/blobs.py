@@ -0,0 +1,310 @@
+"""
+Content-addressed blob store
+Uploaded bytes are stored once under blobs/<aa>/<bb>/<sha256> and every
+UploadedFile row with the same content references the same Blob. Copies are
+metadata-only; Blob.release() removes the bytes when the last reference goes.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from . import cache, search
+from .models import (
+    BULK_BATCH_SIZE, CHUNK_STATE_FIELDS, PROCESSING_STATE_FIELDS, SHARED_STATE_FIELDS, Blob, UploadedFile,
+    UserStorageStats, batched, get_blob_storage_name, relocated_chunk_state, remove_paths_on_commit,
+    resolve_chunk_format
+)
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_django_file(django_file):
+    """SHA-256 of an uploaded file, read in the upload handler's chunks"""
+    m = hashlib.sha256()
+    for chunk in django_file.chunks():
+        m.update(chunk)
+    django_file.seek(0)
+    return m.hexdigest()
+
+
+def hash_path(file_path):
+    m = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            m.update(block)
+    return m.hexdigest()
+
+
+def create_blob(digest, size, storage_name):
+    """Register freshly stored bytes; a concurrent ingest of the same content wins the row"""
+    try:
+        with transaction.atomic():
+            return Blob.objects.create(digest=digest, size=size, storage_name=storage_name, ref_count=1)
+    except IntegrityError:
+        blob = Blob.acquire(digest)
+        if storage_name != blob.storage_name:
+            default_storage.delete(storage_name)
+        return blob
+
+
+def create_staging_file():
+    """(fd, path) of a new temp file inside the blob store, so ingesting it is a rename"""
+    staging_dir = default_storage.path('blobs')
+    os.makedirs(staging_dir, exist_ok=True)
+    return tempfile.mkstemp(prefix='.ingest-', dir=staging_dir)
+
+
+def stream_into_store(django_file):
+    """
+    Copy an upload into a temp file inside the blob store while hashing it, so
+    the bytes are read once; returns (temp_path, digest)
+    """
+    fd, temp_path = create_staging_file()
+    m = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in django_file.chunks():
+                m.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, m.hexdigest()
+
+
+def ingest_file(django_file, digest=None):
+    """Store an uploaded file (once per distinct content) and return its Blob with one new reference"""
+    if getattr(django_file, 'sha256', None):
+        # Staged in the store by StreamingBlobUploadHandler, already hashed
+        return ingest_path(django_file.temporary_file_path(), django_file.sha256)
+    if digest is None:
+        if not hasattr(django_file, 'temporary_file_path'):
+            # In memory: hash while writing, then rename into place
+            return ingest_path(*stream_into_store(django_file))
+        # Already on disk: one hashing read, then the storage moves the file
+        digest = hash_django_file(django_file)
+    blob = Blob.acquire(digest)
+    if blob is not None:
+        return blob
+    # A leftover file under the same name gets a suffixed name from the storage
+    storage_name = default_storage.save(get_blob_storage_name(digest), django_file)
+    return create_blob(digest, django_file.size, storage_name)
+
+
+def link_into_store(file_path, final_path):
+    """Give ``file_path``'s bytes a second name at ``final_path`` (a hard link, or a copy across filesystems)"""
+    fd, temp_path = create_staging_file()
+    os.close(fd)
+    try:
+        os.remove(temp_path)
+        try:
+            os.link(file_path, temp_path)
+        except OSError:
+            shutil.copyfile(file_path, temp_path)
+        os.replace(temp_path, final_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def ingest_path(file_path, digest=None, keep_source=False):
+    """
+    Move a local file under MEDIA_ROOT into the store (rename, no copy); returns
+    its Blob. With ``keep_source`` the file is linked instead and left for the
+    caller to remove, e.g. once a transaction has committed.
+    """
+    digest = digest or hash_path(file_path)
+    blob = Blob.acquire(digest)
+    if blob is not None:
+        if not keep_source:
+            os.remove(file_path)
+        return blob
+    storage_name = get_blob_storage_name(digest)
+    final_path = default_storage.path(storage_name)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    size = os.path.getsize(file_path)
+    if keep_source:
+        link_into_store(file_path, final_path)
+    else:
+        os.replace(file_path, final_path)
+    if settings.FILE_UPLOAD_PERMISSIONS is not None:
+        os.chmod(final_path, settings.FILE_UPLOAD_PERMISSIONS)
+    return create_blob(digest, size, storage_name)
+
+
+def attach_upload(file_obj, django_file, digest=None):
+    """Point an unsaved UploadedFile at the blob for ``django_file`` (caller saves it)"""
+    blob = ingest_file(django_file, digest)
+    file_obj.blob = blob
+    # Assigning the name (not the upload) marks the field committed, so save() writes nothing
+    file_obj.file = blob.storage_name
+    file_obj.file_size = blob.size
+    if not file_obj.original_name:
+        file_obj.original_name = os.path.basename(django_file.name)
+    return file_obj
+
+
+def save_upload(file_obj, django_file, digest=None):
+    """attach_upload() and save in one transaction so a failed save does not leak a reference"""
+    with transaction.atomic():
+        attach_upload(file_obj, django_file, digest)
+        file_obj.save()
+    return file_obj
+
+
+def get_store_workers():
+    return getattr(settings, 'UPLOAD_SETTINGS', {}).get('STORE_WORKERS', 8)
+
+
+def place_staged_file(staged_path, digest):
+    """Rename a hashed staging file to its blob path; returns the storage name"""
+    storage_name = get_blob_storage_name(digest)
+    final_path = default_storage.path(storage_name)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(staged_path, final_path)
+    if settings.FILE_UPLOAD_PERMISSIONS is not None:
+        os.chmod(final_path, settings.FILE_UPLOAD_PERMISSIONS)
+    return storage_name
+
+
+def bulk_save_uploads(entries):
+    """
+    Store many uploads at once: ``entries`` is [(unsaved UploadedFile, django_file)].
+    Content already in the store is referenced, each new digest is written
+    once (files on a bounded thread pool), and the rows are inserted with
+    batched bulk_create. Returns the created rows in order.
+    """
+    with ThreadPoolExecutor(max_workers=get_store_workers()) as pool:
+        # Uploads staged by StreamingBlobUploadHandler are already hashed; others are copied in here
+        staged = list(pool.map(
+            lambda entry: ((entry[1].temporary_file_path(), entry[1].sha256) if getattr(entry[1], 'sha256', None)
+                           else stream_into_store(entry[1])),
+            entries
+        ))
+        counts = Counter(digest for _, digest in staged)
+        blobs = {}
+        for batch in batched(counts):
+            blobs.update((blob.digest, blob) for blob in Blob.objects.filter(digest__in=batch))
+
+        placed = {}
+        for staged_path, digest in staged:
+            if digest in blobs or digest in placed:
+                os.remove(staged_path)  # Duplicate content: only the first copy is kept
+            else:
+                placed[digest] = pool.submit(place_staged_file, staged_path, digest)
+        new_blobs = [Blob(digest=digest, size=os.path.getsize(default_storage.path(future.result())),
+                          storage_name=future.result(), ref_count=counts[digest])
+                     for digest, future in placed.items()]
+
+    try:
+        with transaction.atomic():
+            Blob.acquire_many(Counter({blobs[digest].pk: counts[digest] for digest in counts if digest in blobs}))
+            blobs.update((blob.digest, blob) for blob in Blob.objects.bulk_create(new_blobs, batch_size=BULK_BATCH_SIZE))
+
+            # Content processed before shares its directory and stored flags (chunk flags per chunk format)
+            states = {}
+            chunk_states = {}
+            for batch in batched(counts):
+                for state in UploadedFile.objects.filter(processing_hash__in=batch).values(
+                        'processing_hash', 'chunk_format', 'folder__chunk_format', *PROCESSING_STATE_FIELDS):
+                    digest = state.pop('processing_hash')
+                    chunk_format = resolve_chunk_format(state.pop('chunk_format'), state.pop('folder__chunk_format'))
+                    states.setdefault(digest, {field: state[field] for field in SHARED_STATE_FIELDS})
+                    chunk_states.setdefault((digest, chunk_format),
+                                            {field: state[field] for field in CHUNK_STATE_FIELDS})
+
+            file_objs = []
+            for (file_obj, django_file), (_, digest) in zip(entries, staged):
+                blob = blobs[digest]
+                file_obj.blob = blob
+                file_obj.file = blob.storage_name
+                file_obj.file_size = blob.size
+                file_obj.original_name = file_obj.original_name or os.path.basename(django_file.name)
+                file_obj.processing_hash = digest
+                inherited = dict(states.get(digest, {}), **chunk_states.get((digest, file_obj.get_chunk_format()), {}))
+                for field, value in inherited.items():
+                    setattr(file_obj, field, value)
+                file_objs.append(file_obj)
+            file_objs = UploadedFile.objects.bulk_create(file_objs, batch_size=BULK_BATCH_SIZE)
+            search.index_files([file_obj.pk for file_obj in file_objs])
+            cache.invalidate_file_folders({file_obj.folder_id for file_obj in file_objs})
+            UserStorageStats.mark_stale(*{file_obj.uploaded_by_id for file_obj in file_objs})
+    except IntegrityError:
+        # A concurrent upload registered one of the new digests first: fall back to one row at a time
+        file_objs = []
+        for (file_obj, _), (_, digest) in zip(entries, staged):
+            storage_name = get_blob_storage_name(digest)
+            with transaction.atomic():
+                blob = Blob.acquire(digest) or create_blob(
+                    digest, os.path.getsize(default_storage.path(storage_name)), storage_name
+                )
+                file_obj.pk = None
+                file_obj.blob = blob
+                file_obj.file = blob.storage_name
+                file_obj.file_size = blob.size
+                file_obj.processing_hash = None
+                file_obj.save()
+            file_objs.append(file_obj)
+    return file_objs
+
+
+def ensure_blob(file_obj):
+    """
+    Move a legacy (pre blob store) file into the store so it can be shared, and
+    key its processing directory by the content digest
+    """
+    if file_obj.blob_id or not file_obj.file:
+        return file_obj
+    with transaction.atomic():
+        legacy_name = file_obj.file.name
+        # Linked, not moved: a rollback must leave the legacy file where its rows point
+        blob = ingest_path(file_obj.file.path, keep_source=True)
+        remove_paths_on_commit([file_obj.file.path])
+        # Every legacy row naming the same stored file moves over together
+        legacy_rows = UploadedFile.objects.filter(blob__isnull=True, file=legacy_name)
+        file_ids = list(legacy_rows.values_list('id', flat=True))
+        moved = legacy_rows.update(blob=blob, file=blob.storage_name)
+        if moved > 1:
+            Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + moved - 1)
+        UploadedFile.rekey_processing(file_ids, blob.digest)
+    file_obj.refresh_from_db()
+    return file_obj
+
+
+def clone_file(file_obj, folder):
+    """Metadata-only copy into ``folder``: the new row shares the blob and processing data"""
+    return bulk_clone_files([file_obj], folder)[0]
+
+
+def bulk_clone_files(files, folder):
+    """
+    Metadata-only copies of ``files`` into ``folder`` with one bulk INSERT and
+    one reference UPDATE per distinct copy count; returns the new rows in order.
+    """
+    files = [ensure_blob(file_obj) for file_obj in files]
+    copy_fields = [field.attname for field in UploadedFile._meta.concrete_fields
+                   if not field.primary_key and field.attname not in ('folder_id', 'file')]
+    with transaction.atomic():
+        Blob.acquire_many(Counter(file_obj.blob_id for file_obj in files))
+        # Copies share the processing directory, so the hash must be on the source first
+        for file_obj in files:
+            file_obj.get_processing_hash()
+        # The destination's chunk format may differ from the source's: its chunk flags are the copy's
+        chunk_states = relocated_chunk_state(files, folder)
+        new_files = []
+        for file_obj in files:
+            values = {name: getattr(file_obj, name) for name in copy_fields}
+            values.update(chunk_states.get(file_obj.pk, {}))
+            new_files.append(UploadedFile(folder=folder, file=file_obj.file.name, **values))
+        new_files = UploadedFile.objects.bulk_create(new_files, batch_size=BULK_BATCH_SIZE)
+        search.index_files([file_obj.pk for file_obj in new_files])
+        cache.invalidate_file_folders([folder.pk] if folder else [])
+        UserStorageStats.mark_stale(*{file_obj.uploaded_by_id for file_obj in files})
+    return new_files
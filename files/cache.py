@@ -0,0 +1,169 @@
+"""
+Versioned response cache for the folder views
+Rendered responses of folder_detail, api_folder_contents, api_folders_list and
+folder_list_json are cached under keys that embed version tokens:
+
+- ``folder:<id>``: the folder row, its files (incl. processing flags) and its
+  direct subfolders with their file counts
+- ``folders``: the set of folders and their metadata (folder lists)
+- ``folder-file-counts``: the number of files per folder (folder lists with file_count)
+
+A change replaces the affected tokens with fresh random ones after its
+transaction commits, so stale entries are never read again and simply expire.
+Single-row saves are covered by the model signals (files/signals.py); bulk
+paths (bulk_create, queryset update/delete) call invalidate_* directly.
+A hit costs two cache reads and no database query.
+"""
+import hashlib
+import json
+import threading
+import uuid
+from collections import Counter
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+# Module import: models.py imports this module for its bulk paths
+from . import models
+
+FOLDERS_VERSION = 'folders'
+FILE_COUNTS_VERSION = 'folder-file-counts'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_response_cache_settings():
+    response_cache_settings = {
+        'ENABLED': True,
+        'ALIAS': 'file_processing',  # Must be shared by every process that changes folders or files
+        'TIMEOUT': 300,
+        'KEY_PREFIX': 'folder-views',
+    }
+    response_cache_settings.update(getattr(settings, 'RESPONSE_CACHE_SETTINGS', {}))
+    return response_cache_settings
+
+
+def get_cache():
+    return caches[get_response_cache_settings()['ALIAS']]
+
+
+def folder_version(folder_id):
+    return f'folder:{folder_id}'
+
+
+def version_cache_key(name):
+    return f"{get_response_cache_settings()['KEY_PREFIX']}:version:{name}"
+
+
+def get_versions(names):
+    """Current token of every version name; missing (never set or evicted) ones get a fresh token"""
+    cache = get_cache()
+    keys = {name: version_cache_key(name) for name in names}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for name, key in keys.items():
+        if key not in found:
+            # add(): a concurrent request may have just set it
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            found[key] = cache.get(key)
+        versions[name] = found[key]
+    return versions
+
+
+def bump_versions(names):
+    """Replace the tokens once the current transaction commits (immediately in autocommit)"""
+    names = set(names)
+    if not names or not get_response_cache_settings()['ENABLED']:
+        return
+    transaction.on_commit(lambda: get_cache().set_many(
+        {version_cache_key(name): uuid.uuid4().hex for name in names}, timeout=None
+    ))
+
+
+def invalidate_folders(folder_ids, parents=False, folders=False, file_counts=False):
+    """
+    Invalidate the given folders, plus their parents (whose contents list them
+    with a file count), the folder lists, and/or the per-folder file counts.
+    """
+    folder_ids = {folder_id for folder_id in folder_ids if folder_id}
+    names = {folder_version(folder_id) for folder_id in folder_ids}
+    if parents and folder_ids:
+        for batch in models.batched(folder_ids):
+            names.update(folder_version(parent_id) for parent_id in models.Folder.objects.filter(
+                id__in=batch, parent_id__isnull=False
+            ).values_list('parent_id', flat=True).distinct())
+    if folders:
+        names.add(FOLDERS_VERSION)
+    if file_counts:
+        names.add(FILE_COUNTS_VERSION)
+    bump_versions(names)
+
+
+def invalidate_file_folders(folder_ids):
+    """Files were added to, removed from or moved between ``folder_ids``"""
+    invalidate_folders(folder_ids, parents=True, file_counts=True)
+
+
+def record(kind, hit):
+    with _stats_lock:
+        _stats[kind, 'hits' if hit else 'misses'] += 1
+
+
+def get_stats():
+    """Hit/miss counters of this process per cached view"""
+    with _stats_lock:
+        kinds = sorted({kind for kind, _ in _stats})
+        stats = {}
+        for kind in kinds:
+            hits, misses = _stats[kind, 'hits'], _stats[kind, 'misses']
+            stats[kind] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None
+            }
+    return stats
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def response_key(kind, versions, *parts):
+    # Hashed: query strings may hold characters (or lengths) some backends reject in keys
+    key_source = json.dumps([sorted(versions.items()), [str(part) for part in parts]])
+    return f"{get_response_cache_settings()['KEY_PREFIX']}:{kind}:{hashlib.sha256(key_source.encode()).hexdigest()}"
+
+
+def current_version_token(name):
+    """Token of one version name (used as a validator), or None when caching is off"""
+    if not get_response_cache_settings()['ENABLED']:
+        return None
+    return get_versions([name])[name]
+
+
+def cached_response(kind, version_names, build, *key_parts):
+    """
+    Serve ``kind`` from the cache under the current versions of
+    ``version_names`` (plus ``key_parts``), or call ``build()`` and cache its
+    response when it is a plain 200.
+    """
+    response_cache_settings = get_response_cache_settings()
+    if not response_cache_settings['ENABLED']:
+        return build()
+    cache = get_cache()
+    key = response_key(kind, get_versions(version_names), *key_parts)
+    entry = cache.get(key)
+    if entry is not None:
+        record(kind, True)
+        content_type, content = entry
+        response = HttpResponse(content, content_type=content_type)
+        response['X-Cache'] = 'HIT'
+        return response
+    record(kind, False)
+    response = build()
+    if response.status_code == 200 and not response.streaming:
+        cache.set(key, (response['Content-Type'], response.content), response_cache_settings['TIMEOUT'])
+    response['X-Cache'] = 'MISS'
+    return response
@@ -0,0 +1,699 @@
+"""
+Streaming chunker for CSV, JSON and Parquet datasets
+Records are read incrementally (the source is never loaded whole), grouped into
+CHUNK_SIZE-record batches and written as <n>.json.gz chunks (1-based). JSON
+encoding and gzip compression fan out over a process pool with a bounded number
+of batches in flight, so parent memory stays at a few chunks. A manifest.json
+maps chunk numbers to record ranges, sizes and checksums.
+
+Every chunking run writes a new set into its own chunks-<id>/ subdirectory,
+named by the manifest's ``chunk_dir``. Replacing manifest.json (one rename)
+publishes the set, so a reader always pairs a manifest with the chunks it
+describes. The previous set is kept until the next run, for readers that
+loaded the old manifest just before the switch. Manifests written before
+chunk sets existed have no ``chunk_dir``; their chunks sit next to them.
+
+Each chunk is a multi-member gzip: every FRAME_RECORDS records form an
+independently compressed member, and the members concatenate to one JSON
+array. gzip.open() still reads a chunk whole, while the frame sizes in the
+manifest let a reader seek to and inflate only the frames it needs.
+
+With the optional columnar format a chunk is an Arrow IPC file (<n>.arrow,
+zstd-compressed record batches of FRAME_RECORDS rows), so a reader can load
+only the columns and batches it needs. Arrow artifacts live in an arrow/
+subdirectory (see format_dir), so both formats of one content can coexist.
+
+This module has no Django imports so pool workers can be spawned cheaply.
+"""
+import bisect
+import csv
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet and Arrow chunk support are optional
+    pa = None
+    pq = None
+
+READ_BLOCK_SIZE = 1024 * 1024
+CHUNK_SUFFIX = '.json.gz'
+ARROW_CHUNK_SUFFIX = '.arrow'
+CHUNK_SUFFIXES = {'json': CHUNK_SUFFIX, 'arrow': ARROW_CHUNK_SUFFIX}
+ARROW_STREAM_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 2
+MANIFEST_CHUNK_FIELDS = ['first_record', 'records', 'bytes', 'sha256', 'frames']
+FRAME_RECORDS = 100
+MANIFEST_CACHE_SIZE = 256
+CHUNK_SET_PREFIX = 'chunks-'
+PREVIEW_NAME = 'preview.json'
+PREVIEW_VERSION = 1
+
+
+class UnsupportedFileType(ValueError):
+    pass
+
+
+# ==================== RECORD READERS ====================
+
+def iter_csv_records(path):
+    """One dict per row, keyed by the header row"""
+    with open(path, 'r', encoding='utf-8-sig', errors='replace', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def iter_json_array(f):
+    """Yield the elements of a top-level JSON array read block by block"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        # Skip whitespace and separators between elements
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError('Unterminated JSON array')
+            buffer = buffer[pos:] + f.read(READ_BLOCK_SIZE)
+            pos = 0
+            eof = pos >= len(buffer)
+            continue
+
+        if not started:
+            if buffer[pos] != '[':
+                raise ValueError('Expected a JSON array')
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == ']':
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+            # A number at the very end of the buffer may continue in the next block
+            if end < len(buffer) or eof:
+                yield value
+                pos = end
+                continue
+        except json.JSONDecodeError:
+            if eof:
+                raise
+        more = f.read(READ_BLOCK_SIZE)
+        eof = not more
+        buffer = buffer[pos:] + more
+        pos = 0
+
+
+def iter_json_records(path):
+    """Top-level array, newline-delimited JSON, or a single object"""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        head = f.read(READ_BLOCK_SIZE).lstrip()
+        f.seek(0)
+        if head.startswith('['):
+            yield from iter_json_array(f)
+            return
+
+        first_line = ''
+        while not first_line.strip():
+            first_line = f.readline()
+            if not first_line:
+                return
+        f.seek(0)
+        try:
+            json.loads(first_line)
+            is_ndjson = True
+        except ValueError:
+            # Pretty-printed single object
+            is_ndjson = False
+
+        if is_ndjson:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield json.load(f)
+
+
+def iter_parquet_records(path, batch_size):
+    """Row dicts from Parquet record batches (needs pyarrow)"""
+    if pq is None:
+        raise UnsupportedFileType('Parquet processing requires pyarrow')
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+def iter_records(path, file_type, batch_size=1000):
+    if file_type == 'csv':
+        return iter_csv_records(path)
+    if file_type == 'json':
+        return iter_json_records(path)
+    if file_type == 'parquet':
+        return iter_parquet_records(path, batch_size)
+    raise UnsupportedFileType(f'Cannot chunk .{file_type} files')
+
+
+def iter_batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ==================== CHUNK WRITER ====================
+
+def chunk_path(out_dir, number, chunk_format='json'):
+    return os.path.join(out_dir, f"{number}{CHUNK_SUFFIXES[chunk_format]}")
+
+
+def require_arrow():
+    if pa is None:
+        raise UnsupportedFileType('Arrow chunk storage requires pyarrow')
+
+
+def write_chunk(out_dir, number, records, compress_level, frame_records=FRAME_RECORDS):
+    """Encode and compress one chunk as gzip frames (runs in a pool worker); returns its stats"""
+    started = time.process_time()
+    members = []
+    raw_bytes = 0
+    for first in range(0, len(records), frame_records):
+        body = ','.join(json.dumps(record, default=str, separators=(',', ':'))
+                        for record in records[first:first + frame_records])
+        # Frames concatenate to one JSON array: "[a,b" ",c,d" ",e]"
+        text = ('[' if first == 0 else ',') + body
+        if first + frame_records >= len(records):
+            text += ']'
+        payload = text.encode('utf-8')
+        raw_bytes += len(payload)
+        # mtime=0 keeps the bytes deterministic for identical input
+        members.append(gzip.compress(payload, compresslevel=compress_level, mtime=0))
+
+    compressed = b''.join(members)
+    with open(chunk_path(out_dir, number), 'wb') as f:
+        f.write(compressed)
+    return {
+        'number': number,
+        'records': len(records),
+        'raw_bytes': raw_bytes,
+        'bytes': len(compressed),
+        'sha256': hashlib.sha256(compressed).hexdigest(),
+        'frames': [len(member) for member in members],
+        'cpu_seconds': time.process_time() - started
+    }
+
+
+def write_arrow_chunk(out_dir, number, records, compress_level, frame_records=FRAME_RECORDS):
+    """Write one chunk as an Arrow IPC file with one record batch per frame (runs in a pool worker)"""
+    started = time.process_time()
+    table = pa.Table.from_pylist(records)
+    path = chunk_path(out_dir, number, 'arrow')
+    options = pa.ipc.IpcWriteOptions(compression='zstd')
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+        writer.write_table(table, max_chunksize=frame_records)
+    with open(path, 'rb') as f:
+        checksum = hashlib.sha256(f.read()).hexdigest()
+    return {
+        'number': number,
+        'records': len(records),
+        'raw_bytes': table.nbytes,
+        'bytes': os.path.getsize(path),
+        'sha256': checksum,
+        'frames': None,
+        'cpu_seconds': time.process_time() - started
+    }
+
+
+CHUNK_WRITERS = {'json': write_chunk, 'arrow': write_arrow_chunk}
+
+
+def chunk_file(path, file_type, out_dir, chunk_size=1000, workers=None, compress_level=6, max_in_flight=None,
+               frame_records=FRAME_RECORDS, chunk_format='json', progress=None):
+    """
+    Stream ``path`` into ``out_dir``/<n>.json.gz chunks of ``chunk_size`` records.
+    ``workers`` <= 1 encodes inline; otherwise a spawn-based process pool is used
+    and at most ``max_in_flight`` batches (default 2 per worker) are pending.
+    ``progress(records_done)`` is called as chunks complete; an exception it
+    raises aborts the run. Returns per-chunk stats and throughput in MB/s
+    overall and per core.
+    """
+    if chunk_format == 'arrow':
+        require_arrow()
+    writer = CHUNK_WRITERS[chunk_format]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+    parent_cpu_started = time.process_time()
+    records = iter_records(path, file_type, batch_size=chunk_size)
+    chunks = []
+
+    def completed(new_chunks):
+        chunks.extend(new_chunks)
+        if progress is not None:
+            progress(sum(chunk['records'] for chunk in chunks))
+
+    if workers <= 1:
+        for number, batch in enumerate(iter_batches(records, chunk_size), 1):
+            completed([writer(out_dir, number, batch, compress_level, frame_records)])
+    else:
+        max_in_flight = max_in_flight or workers * 2
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            pending = set()
+            for number, batch in enumerate(iter_batches(records, chunk_size), 1):
+                pending.add(pool.submit(writer, out_dir, number, batch, compress_level, frame_records))
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    completed([future.result() for future in done])
+            completed([future.result() for future in pending])
+
+    chunks.sort(key=lambda chunk: chunk['number'])
+    first_record = 0
+    for chunk in chunks:
+        chunk['first_record'] = first_record
+        first_record += chunk['records']
+    elapsed = time.perf_counter() - started
+    # Parent CPU covers reading/parsing (and everything when inline); pool workers report their own
+    cpu_seconds = time.process_time() - parent_cpu_started
+    if workers > 1:
+        cpu_seconds += sum(chunk['cpu_seconds'] for chunk in chunks)
+    input_mb = os.path.getsize(path) / (1024 * 1024)
+    return {
+        'chunks': chunks,
+        'chunk_size': chunk_size,
+        'chunk_format': chunk_format,
+        'frame_records': frame_records,
+        'chunk_count': len(chunks),
+        'record_count': sum(chunk['records'] for chunk in chunks),
+        'input_bytes': os.path.getsize(path),
+        'output_bytes': sum(chunk['bytes'] for chunk in chunks),
+        'workers': max(workers, 1),
+        'elapsed_seconds': round(elapsed, 3),
+        'cpu_seconds': round(cpu_seconds, 3),
+        'mb_per_second': round(input_mb / elapsed, 2) if elapsed else None,
+        'mb_per_second_per_core': round(input_mb / cpu_seconds, 2) if cpu_seconds else None
+    }
+
+
+def open_arrow_chunk(out_dir, number, columns=None):
+    """IPC file reader over a memory-mapped Arrow chunk, limited to ``columns`` when given"""
+    require_arrow()
+    source = pa.memory_map(chunk_path(out_dir, number, 'arrow'))
+    if not columns:
+        return pa.ipc.open_file(source)
+    names = pa.ipc.open_file(source).schema.names
+    missing = [column for column in columns if column not in names]
+    if missing:
+        raise KeyError(f"Unknown column(s): {', '.join(missing)}")
+    # Only the selected columns' buffers are read and decompressed
+    options = pa.ipc.IpcReadOptions(included_fields=[names.index(column) for column in columns])
+    return pa.ipc.open_file(source, options=options)
+
+
+def read_chunk_table(out_dir, number, chunk_format='json', columns=None):
+    """One chunk as an Arrow table (Arrow chunks project columns without touching the others)"""
+    require_arrow()
+    if chunk_format == 'arrow':
+        table = open_arrow_chunk(out_dir, number, columns).read_all()
+        return table.select(columns) if columns else table
+    table = pa.Table.from_pylist(read_chunk(out_dir, number))
+    return table.select(columns) if columns else table
+
+
+def read_chunk(out_dir, number, chunk_format='json', columns=None):
+    """Decoded records of one chunk, optionally projected to ``columns``"""
+    if chunk_format == 'arrow':
+        return read_chunk_table(out_dir, number, 'arrow', columns).to_pylist()
+    with gzip.open(chunk_path(out_dir, number), 'rb') as f:
+        records = json.load(f)
+    if columns:
+        missing = [column for column in columns if records and column not in records[0]]
+        if missing:
+            raise KeyError(f"Unknown column(s): {', '.join(missing)}")
+        records = [{column: record.get(column) for column in columns} for record in records]
+    return records
+
+
+def arrow_stream_bytes(table):
+    """Serialize a table in the Arrow IPC streaming format"""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_frame(data, is_last):
+    """Records of one gzip frame (one member of a chunk)"""
+    text = gzip.decompress(data).decode('utf-8')
+    # Every frame opens with "[" or ","; the last one also closes the array
+    body = text[1:-1] if is_last else text[1:]
+    return json.loads('[' + body + ']')
+
+
+def iter_record_range(processing_dir, manifest, start, stop):
+    """
+    Yield lists of records covering global indexes [start, stop) in order,
+    seeking to and inflating only the frames that overlap the range.
+    """
+    out_dir = manifest.chunks_path(processing_dir)
+    if manifest.chunk_format == 'arrow':
+        yield from iter_arrow_record_range(out_dir, manifest, start, stop)
+        return
+    stop = min(stop, manifest.record_count)
+    location = manifest.locate(start)
+    if location is None or start >= stop:
+        return
+    number = location[0]
+    while number <= manifest.chunk_count:
+        chunk = manifest.chunk(number)
+        chunk_first = chunk['first_record']
+        if chunk_first >= stop:
+            return
+        spans = manifest.frame_spans(number)
+        if spans is None:
+            records = read_chunk(out_dir, number)
+            yield records[max(start - chunk_first, 0):stop - chunk_first]
+        else:
+            with open(chunk_path(out_dir, number), 'rb') as f:
+                for index, (offset, length, first, count) in enumerate(spans):
+                    frame_first = chunk_first + first
+                    if frame_first + count <= start:
+                        continue
+                    if frame_first >= stop:
+                        break
+                    f.seek(offset)
+                    records = decode_frame(f.read(length), index == len(spans) - 1)
+                    yield records[max(start - frame_first, 0):stop - frame_first]
+        number += 1
+
+
+def read_chunk_records(processing_dir, manifest, number, offsets):
+    """
+    {offset: record} for the given in-chunk offsets of chunk ``number``,
+    inflating (or, for Arrow, reading) only the frames that hold one of them.
+    """
+    out_dir = manifest.chunks_path(processing_dir)
+    wanted = set(offsets)
+    if manifest.chunk_format == 'arrow':
+        reader = open_arrow_chunk(out_dir, number)
+        found = {}
+        batch_first = 0
+        for index in range(reader.num_record_batches):
+            if not wanted:
+                break
+            batch = reader.get_batch(index)
+            hits = [offset for offset in wanted if batch_first <= offset < batch_first + batch.num_rows]
+            if hits:
+                records = batch.to_pylist()
+                found.update((offset, records[offset - batch_first]) for offset in hits)
+                wanted.difference_update(hits)
+            batch_first += batch.num_rows
+        return found
+    spans = manifest.frame_spans(number)
+    if spans is None:
+        records = read_chunk(out_dir, number)
+        return {offset: records[offset] for offset in wanted if offset < len(records)}
+    found = {}
+    with open(chunk_path(out_dir, number), 'rb') as f:
+        for index, (byte_offset, length, first, count) in enumerate(spans):
+            hits = [offset for offset in wanted if first <= offset < first + count]
+            if not hits:
+                continue
+            f.seek(byte_offset)
+            records = decode_frame(f.read(length), index == len(spans) - 1)
+            found.update((offset, records[offset - first]) for offset in hits)
+    return found
+
+
+def iter_arrow_record_range(out_dir, manifest, start, stop):
+    """iter_record_range() for Arrow chunks in ``out_dir``: only overlapping record batches are read"""
+    stop = min(stop, manifest.record_count)
+    location = manifest.locate(start)
+    if location is None or start >= stop:
+        return
+    for number in range(location[0], manifest.chunk_count + 1):
+        chunk_first = manifest.chunk(number)['first_record']
+        if chunk_first >= stop:
+            return
+        reader = open_arrow_chunk(out_dir, number)
+        batch_first = chunk_first
+        for index in range(reader.num_record_batches):
+            batch = reader.get_batch(index)
+            if batch_first + batch.num_rows > start and batch_first < stop:
+                records = batch.to_pylist()
+                yield records[max(start - batch_first, 0):stop - batch_first]
+            batch_first += batch.num_rows
+            if batch_first >= stop:
+                return
+
+
+# ==================== MANIFEST ====================
+
+class ChunkManifest:
+    """
+    Per-file index of the chunks: chunk n (1-based) starts at global record
+    ``first_record`` and holds ``records`` records in ``bytes`` compressed bytes.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.chunk_size = data.get('chunk_size')
+        self.chunk_format = data.get('chunk_format', 'json')
+        self.chunk_dir = data.get('chunk_dir')
+        # Version 1 manifests predate framed chunks
+        self.frame_records = data.get('frame_records')
+        self.record_count = data['record_count']
+        self.chunk_count = data['chunk_count']
+        self.chunks = [dict(zip(data['chunk_fields'], row)) for row in data['chunks']]
+        self.first_records = [chunk['first_record'] for chunk in self.chunks]
+
+    def chunks_path(self, processing_dir):
+        """Directory holding this manifest's chunk set"""
+        return os.path.join(processing_dir, self.chunk_dir) if self.chunk_dir else processing_dir
+
+    def chunk_path(self, processing_dir, number):
+        return chunk_path(self.chunks_path(processing_dir), number, self.chunk_format)
+
+    def has_chunk(self, number):
+        return 1 <= number <= self.chunk_count
+
+    def chunk(self, number):
+        """Entry for chunk ``number`` or None"""
+        if not self.has_chunk(number):
+            return None
+        return dict(self.chunks[number - 1], number=number)
+
+    def locate(self, record_index):
+        """(chunk_number, offset in chunk) holding a global record index, or None"""
+        if not 0 <= record_index < self.record_count:
+            return None
+        position = bisect.bisect_right(self.first_records, record_index) - 1
+        return position + 1, record_index - self.first_records[position]
+
+    def frame_spans(self, number):
+        """(byte offset, byte length, first record in chunk, record count) per frame, or None"""
+        chunk = self.chunk(number)
+        if not chunk or not chunk.get('frames') or not self.frame_records:
+            return None
+        spans = []
+        offset = 0
+        for index, length in enumerate(chunk['frames']):
+            first = index * self.frame_records
+            spans.append((offset, length, first, min(self.frame_records, chunk['records'] - first)))
+            offset += length
+        return spans
+
+
+def build_manifest(result, **extra):
+    """Manifest document for a chunk_file() result"""
+    return dict({
+        'version': MANIFEST_VERSION,
+        'chunk_size': result['chunk_size'],
+        'chunk_format': result['chunk_format'],
+        'frame_records': result['frame_records'],
+        'record_count': result['record_count'],
+        'chunk_count': result['chunk_count'],
+        'chunk_fields': MANIFEST_CHUNK_FIELDS,
+        'chunks': [[chunk[field] for field in MANIFEST_CHUNK_FIELDS] for chunk in result['chunks']],
+    }, **extra)
+
+
+def write_json_atomic(path, document):
+    """Write JSON via a temp file + rename so readers never see a partial document"""
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(document, f, default=str, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_manifest(processing_dir, manifest):
+    write_json_atomic(os.path.join(processing_dir, MANIFEST_NAME), manifest)
+
+
+def format_dir(processing_dir, chunk_format):
+    """
+    Directory holding the manifest, chunk sets and record index of one chunk
+    format. JSON keeps the top level of the processing directory; other formats
+    get a subdirectory, so copies filed in folders with different formats each
+    keep their own chunks.
+    """
+    if chunk_format == 'json':
+        return processing_dir
+    return os.path.join(processing_dir, chunk_format)
+
+
+def find_format_dir(processing_dir, chunk_format):
+    """format_dir() for readers: Arrow chunks written before per-format directories sit at the top level"""
+    path = format_dir(processing_dir, chunk_format)
+    if path != processing_dir and not os.path.exists(os.path.join(path, MANIFEST_NAME)):
+        legacy = load_manifest(processing_dir)
+        if legacy is not None and legacy.chunk_format == chunk_format:
+            return processing_dir
+    return path
+
+
+def publish_chunk_set(processing_dir, staging_dir, manifest):
+    """
+    Make the chunks written to ``staging_dir`` (inside ``processing_dir``) the
+    current set: move them to a chunks-<id>/ directory, point the manifest at
+    it and replace manifest.json, then remove every set older than the one it
+    replaced. Returns the new set's directory name.
+    """
+    previous = load_manifest(processing_dir)
+    chunk_dir = f"{CHUNK_SET_PREFIX}{uuid.uuid4().hex}"
+    os.replace(staging_dir, os.path.join(processing_dir, chunk_dir))
+    write_manifest(processing_dir, dict(manifest, chunk_dir=chunk_dir))
+
+    keep = {chunk_dir, previous.chunk_dir if previous is not None else None}
+    for name in os.listdir(processing_dir):
+        path = os.path.join(processing_dir, name)
+        if name.startswith(CHUNK_SET_PREFIX) and name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+        elif None not in keep and any(name.endswith(suffix) and name[:-len(suffix)].isdigit()
+                                      for suffix in CHUNK_SUFFIXES.values()):
+            # Chunks of a manifest from before chunk sets, now two sets old
+            os.remove(path)
+    return chunk_dir
+
+
+_manifest_cache = OrderedDict()
+_manifest_cache_lock = threading.Lock()
+
+
+def load_manifest(processing_dir):
+    """
+    Parsed ChunkManifest for a processing directory, or None if it has none.
+    Cached in memory; a stat of the file revalidates the cached copy.
+    """
+    path = os.path.join(processing_dir, MANIFEST_NAME)
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    key = (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+
+    with _manifest_cache_lock:
+        cached = _manifest_cache.get(path)
+        if cached and cached[0] == key:
+            _manifest_cache.move_to_end(path)
+            return cached[1]
+
+    try:
+        with open(path, 'r') as f:
+            manifest = ChunkManifest(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+
+    with _manifest_cache_lock:
+        _manifest_cache[path] = (key, manifest)
+        _manifest_cache.move_to_end(path)
+        while len(_manifest_cache) > MANIFEST_CACHE_SIZE:
+            _manifest_cache.popitem(last=False)
+    return manifest
+
+
+# ==================== PREVIEW SIDECAR ====================
+
+def build_preview(path, file_type, max_records=10):
+    """
+    First ``max_records`` records plus columns (and schema for Parquet) with
+    bounded work: CSV/JSON stop reading after the last previewed record, and
+    Parquet reads the footer and the start of the first row group only.
+    Unparseable content raises ValueError.
+    """
+    preview = {'version': PREVIEW_VERSION, 'file_type': file_type, 'total_records': None}
+    if file_type == 'parquet':
+        if pq is None:
+            raise UnsupportedFileType('Parquet preview requires pyarrow')
+        parquet_file = pq.ParquetFile(path)
+        metadata = parquet_file.metadata
+        schema = parquet_file.schema_arrow
+        records = []
+        if metadata.num_row_groups:
+            batch = next(parquet_file.iter_batches(batch_size=max_records, row_groups=[0]), None)
+            records = batch.to_pylist()[:max_records] if batch is not None else []
+            # Same rendering as the chunks (str() for timestamps, decimals, ...)
+            records = json.loads(json.dumps(records, default=str))
+        preview.update({
+            'columns': schema.names,
+            'schema': [{'name': field.name, 'type': str(field.type)} for field in schema],
+            'total_records': metadata.num_rows,
+            'row_groups': metadata.num_row_groups,
+            'records': records
+        })
+        return preview
+
+    try:
+        records = list(islice(iter_records(path, file_type), max_records))
+    except csv.Error as e:
+        # e.g. a field over csv.field_size_limit(); the callers handle ValueError
+        raise ValueError(f'Unreadable CSV: {e}') from e
+    columns = []
+    for record in records:
+        if isinstance(record, dict):
+            columns.extend(key for key in record if key not in columns)
+    if file_type == 'csv' and not records:
+        # Header-only file: the columns are still worth showing
+        with open(path, 'r', encoding='utf-8-sig', errors='replace', newline='') as f:
+            columns = next(csv.reader(f), [])
+    preview.update({'columns': columns, 'records': records})
+    return preview
+
+
+def write_preview(processing_dir, preview):
+    write_json_atomic(os.path.join(processing_dir, PREVIEW_NAME), preview)
+
+
+def load_preview(processing_dir):
+    """The preview sidecar, or None if it has not been generated"""
+    try:
+        with open(os.path.join(processing_dir, PREVIEW_NAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,154 @@
+"""
+Validators for conditional GET
+ETag / Last-Modified functions for django.views.decorators.http.condition().
+Each is computed from stored state (aggregates, the chunk manifest, a stat())
+without rendering the response, so a poll that changed nothing is answered
+with a 304 for the cost of a query or two.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from .chunking import ARROW_STREAM_CONTENT_TYPE, MANIFEST_NAME, chunk_path, find_format_dir, load_manifest
+from .downloads import file_etag
+from . import cache
+from .models import Folder, UploadedFile, resolve_chunk_format
+
+
+def digest_etag(*parts, weak=False):
+    """Quoted ETag from a hash of ``parts``"""
+    value = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    return f'W/"{value}"' if weak else f'"{value}"'
+
+
+def stat_or_none(path):
+    try:
+        return os.stat(path)
+    except (OSError, TypeError):
+        return None
+
+
+def mtime_datetime(stat_result):
+    return datetime.fromtimestamp(int(stat_result.st_mtime), tz=dt_timezone.utc)
+
+
+def cached_validators(request, key, compute):
+    """
+    condition() calls the ETag and Last-Modified functions separately; compute
+    both once per request and hand out the cached pair.
+    """
+    cached = getattr(request, '_conditional_validators', None)
+    if cached is None or cached[0] != key:
+        cached = (key, compute())
+        request._conditional_validators = cached
+    return cached[1]
+
+
+# ==================== FOLDER CONTENTS ====================
+
+def folder_contents_etag(request, folder_id):
+    """
+    Weak ETag over everything api_folder_contents renders: the folder row,
+    its files and subfolders (count, id sum, latest update) and the files of
+    the subfolders (for their file counts). No Last-Modified: deletions leave
+    no timestamp behind. With the response cache on, the folder's version
+    token covers the same state without a query.
+    """
+    token = cache.current_version_token(cache.folder_version(folder_id))
+    if token is not None:
+        return f'W/"{token}"'
+    folder = Folder.objects.filter(pk=folder_id).values('updated_at').first()
+    if folder is None:
+        return None
+    files = UploadedFile.objects.filter(folder_id=folder_id).aggregate(
+        count=Count('id'), ids=Sum('id'), updated=Max('updated_at')
+    )
+    subfolders = Folder.objects.filter(parent_id=folder_id).aggregate(
+        count=Count('id'), ids=Sum('id'), updated=Max('updated_at')
+    )
+    subfolder_files = UploadedFile.objects.filter(folder__parent_id=folder_id).aggregate(
+        count=Count('id'), folders=Sum('folder_id'), updated=Max('updated_at')
+    )
+    return digest_etag(folder['updated_at'], sorted(files.items()), sorted(subfolders.items()),
+                       sorted(subfolder_files.items()), weak=True)
+
+
+# ==================== CHUNKS ====================
+
+def get_chunks_dir(files):
+    """Chunk directory (see UploadedFile.get_chunks_dir) of the first of ``files``, without loading the row"""
+    row = files.values('processing_hash', 'chunk_format', 'folder__chunk_format').first()
+    if row is None or not row['processing_hash']:
+        return None
+    return find_format_dir(os.path.join(settings.MEDIA_ROOT, row['processing_hash']),
+                           resolve_chunk_format(row['chunk_format'], row['folder__chunk_format']))
+
+
+def get_chunk_validators(request, file_id, chunk_number):
+    """
+    (etag, last_modified) of one chunk, or (None, None) when it does not exist.
+    The strong ETag hashes the manifest's SHA-256 of the chunk with its record
+    range and the file's record count, and the requested projection and
+    format, since all of them change the body.
+    """
+    return cached_validators(request, ('chunk', file_id, chunk_number),
+                             lambda: compute_chunk_validators(request, file_id, chunk_number))
+
+
+def compute_chunk_validators(request, file_id, chunk_number):
+    validators = None, None
+    chunks_dir = get_chunks_dir(UploadedFile.objects.filter(pk=file_id, has_chunks=True))
+    if chunks_dir:
+        manifest = load_manifest(chunks_dir)
+        entry = manifest.chunk(chunk_number) if manifest is not None else None
+        stat_result = stat_or_none(manifest.chunk_path(chunks_dir, chunk_number) if manifest is not None
+                                   else chunk_path(chunks_dir, chunk_number))
+        if stat_result is not None and (manifest is None or entry is not None):
+            checksum = entry.get('sha256') if entry else None
+            wants_arrow = (request.GET.get('format') == 'arrow'
+                           or ARROW_STREAM_CONTENT_TYPE in request.META.get('HTTP_ACCEPT', ''))
+            representation = (request.GET.get('columns', ''), wants_arrow)
+            # The body also carries first_record and total_records, which change without the chunk bytes
+            position = (entry['first_record'], manifest.record_count) if entry else None
+            etag = digest_etag(checksum or file_etag(stat_result), position, representation)
+            validators = etag, mtime_datetime(stat_result)
+    return validators
+
+
+def chunk_etag(request, file_id, chunk_number):
+    return get_chunk_validators(request, file_id, chunk_number)[0]
+
+
+def chunk_last_modified(request, file_id, chunk_number):
+    return get_chunk_validators(request, file_id, chunk_number)[1]
+
+
+# ==================== PROCESSING SIDECARS ====================
+
+def get_sidecar_validators(request, file_id, name):
+    """(etag, last_modified) of a file in a file's processing directory, from one stat()"""
+    def compute():
+        files = UploadedFile.objects.filter(pk=file_id)
+        if name == MANIFEST_NAME:
+            # Each chunk format has its own manifest
+            directory = get_chunks_dir(files)
+        else:
+            processing_hash = files.values_list('processing_hash', flat=True).first()
+            directory = os.path.join(settings.MEDIA_ROOT, processing_hash) if processing_hash else None
+        if directory is None:
+            return None, None
+        stat_result = stat_or_none(os.path.join(directory, name))
+        if stat_result is None:
+            return None, None
+        return file_etag(stat_result), mtime_datetime(stat_result)
+    return cached_validators(request, ('sidecar', file_id, name), compute)
+
+
+def sidecar_etag(name):
+    """ETag function for ``name`` in the processing directory (config.json, manifest.json)"""
+    return lambda request, file_id: get_sidecar_validators(request, file_id, name)[0]
+
+
+def sidecar_last_modified(name):
+    return lambda request, file_id: get_sidecar_validators(request, file_id, name)[1]
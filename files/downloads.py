@@ -0,0 +1,236 @@
+"""
+Streaming download helpers for files served from MEDIA_ROOT
+Full downloads go through FileResponse (sendfile via wsgi.file_wrapper where the
+server supports it), byte ranges are streamed in bounded blocks, and an optional
+X-Accel-Redirect / X-Sendfile hand-off lets a front proxy serve the bytes.
+Folder archives are produced as a ZIP stream that is sent while it is written.
+"""
+import os
+import re
+import zipfile
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+RANGE_HEADER_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_download_settings():
+    """Download settings with defaults for anything not configured"""
+    download_settings = {
+        'BLOCK_SIZE': 64 * 1024,
+        'SENDFILE_BACKEND': None,
+        'X_ACCEL_REDIRECT_LOCATION': '/protected-media/',
+        'ZIP_STORED_EXTENSIONS': ['.parquet', '.gz', '.zip', '.pdf', '.png', '.jpg'],
+    }
+    download_settings.update(getattr(settings, 'DOWNLOAD_SETTINGS', {}))
+    return download_settings
+
+
+def file_etag(stat_result):
+    """Strong validator derived from size and mtime (no content read needed)"""
+    return '"%x-%x"' % (stat_result.st_size, stat_result.st_mtime_ns)
+
+
+def parse_range_header(range_header, size):
+    """
+    Parse a single-range ``Range`` header into an inclusive (start, end) tuple.
+    Returns None when the header should be ignored (absent, malformed or
+    multi-range) and raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header or size == 0:
+        return None
+    match = RANGE_HEADER_RE.match(range_header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        suffix_length = int(last)
+        if suffix_length == 0:
+            raise ValueError('Empty suffix range')
+        return max(0, size - suffix_length), size - 1
+    start = int(first)
+    if start >= size:
+        raise ValueError('Range starts beyond end of file')
+    end = int(last) if last else size - 1
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag, last_modified):
+    """Check the If-Range precondition; a stale validator means send the whole file"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def iter_file_range(file_path, start, length, block_size):
+    """Yield ``length`` bytes from ``file_path`` starting at ``start``"""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(block_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def sendfile_response(file_path, filename, content_type, download_settings):
+    """Hand the transfer off to a front proxy (nginx / Apache / lighttpd)"""
+    response = HttpResponse(content_type=content_type)
+    if download_settings['SENDFILE_BACKEND'] == 'nginx':
+        relative_path = os.path.relpath(file_path, settings.MEDIA_ROOT)
+        location = download_settings['X_ACCEL_REDIRECT_LOCATION'].rstrip('/')
+        response['X-Accel-Redirect'] = f'{location}/{relative_path}'
+    else:
+        response['X-Sendfile'] = file_path
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def serve_file(request, file_path, filename, content_type='application/octet-stream', etag=None):
+    """
+    Serve a file as an attachment without buffering it in worker memory.
+    ``etag`` overrides the size/mtime validator (e.g. a content digest);
+    If-None-Match / If-Modified-Since are answered with a 304 before the file is opened.
+    """
+    try:
+        stat_result = os.stat(file_path)
+    except OSError:
+        raise Http404('File not found on disk')
+
+    size = stat_result.st_size
+    etag = etag or file_etag(stat_result)
+    last_modified = stat_result.st_mtime
+    conditional_response = get_conditional_response(request, etag=etag, last_modified=int(last_modified))
+    if conditional_response is not None:
+        conditional_response['ETag'] = etag
+        conditional_response['Last-Modified'] = http_date(last_modified)
+        return conditional_response
+
+    download_settings = get_download_settings()
+    if download_settings['SENDFILE_BACKEND']:
+        return sendfile_response(file_path, filename, content_type, download_settings)
+
+    byte_range = None
+    if request.method in ('GET', 'HEAD') and if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range_header(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            response['Accept-Ranges'] = 'bytes'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open(file_path, 'rb'), as_attachment=True, filename=filename,
+                                content_type=content_type)
+        response.block_size = download_settings['BLOCK_SIZE']
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            iter_file_range(file_path, start, length, download_settings['BLOCK_SIZE']),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+# ==================== STREAMING ZIP ====================
+
+class ZipStreamBuffer:
+    """
+    Write-only sink for zipfile. It has no seek(), so zipfile writes data
+    descriptors instead of rewinding, and whatever has been written so far can
+    be drained and sent to the client.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._position = 0
+
+    def write(self, data):
+        self._pending.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._pending)
+        self._pending = []
+        return data
+
+
+def iter_zip_stream(entries, block_size=None, stored_extensions=None):
+    """
+    Yield a ZIP64-capable archive for ``entries`` as it is being built.
+    ``entries`` yields (file_path, arcname) tuples; a None file_path adds a
+    directory entry. Already-compressed formats are stored as-is.
+    """
+    download_settings = get_download_settings()
+    block_size = block_size or download_settings['BLOCK_SIZE']
+    if stored_extensions is None:
+        stored_extensions = download_settings['ZIP_STORED_EXTENSIONS']
+    stored_extensions = tuple(ext.lower() for ext in stored_extensions)
+
+    sink = ZipStreamBuffer()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for file_path, arcname in entries:
+            if file_path is None:
+                dir_info = zipfile.ZipInfo(arcname.rstrip('/') + '/')
+                dir_info.external_attr = (0o40755 << 16) | 0x10
+                zf.writestr(dir_info, b'')
+            else:
+                try:
+                    zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                except OSError:
+                    # Row exists but the bytes are gone; keep the rest of the archive usable
+                    continue
+                if arcname.lower().endswith(stored_extensions):
+                    zinfo.compress_type = zipfile.ZIP_STORED
+                else:
+                    zinfo.compress_type = zipfile.ZIP_DEFLATED
+                with open(file_path, 'rb') as src, zf.open(zinfo, 'w') as dest:
+                    while True:
+                        data = src.read(block_size)
+                        if not data:
+                            break
+                        dest.write(data)
+                        pending = sink.drain()
+                        if pending:
+                            yield pending
+            pending = sink.drain()
+            if pending:
+                yield pending
+    # Central directory (and ZIP64 end records when needed)
+    yield sink.drain()
+
+
+def zip_response(entries, filename):
+    """StreamingHttpResponse that sends a ZIP of ``entries`` as it is produced"""
+    response = StreamingHttpResponse(iter_zip_stream(entries), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
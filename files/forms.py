@@ -21,7 +21,7 @@ class FileUploadForm(forms.ModelForm):
 class FolderForm(forms.ModelForm):
     class Meta:
         model = Folder
-        fields = ['name', 'parent', 'allowed_type', 'description']  # Removed is_public
+        fields = ['name', 'parent', 'allowed_type', 'chunk_format', 'description']  # Removed is_public
         
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -30,6 +30,8 @@ class FolderForm(forms.ModelForm):
         # Make allowed_type not required and set default
         self.fields['allowed_type'].required = False
         self.fields['allowed_type'].initial = 'csv'
+        self.fields['chunk_format'].required = False
+        self.fields['chunk_format'].initial = 'json'
 
 class ConfigUploadForm(forms.Form):
     config_file = forms.FileField(
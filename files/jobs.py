@@ -0,0 +1,170 @@
+"""
+Database-backed processing queue
+Requests enqueue ProcessingJob rows and return immediately; workers started
+with `manage.py process_jobs` claim jobs, run them off the request path,
+report records done/total, retry failures with exponential backoff and stop
+cancelled jobs at their next progress report.
+"""
+import logging
+import os
+import socket
+import time
+from django.conf import settings
+from django.db import close_old_connections
+from .chunking import UnsupportedFileType, load_manifest, load_preview
+from .models import JOB_ACTIVE_STATUSES, ProcessingJob
+from .processing import (
+    CHUNKABLE_TYPES, ChunksNotReady, ProcessingCancelled, chunk_uploaded_file, ensure_preview, get_chunking_settings,
+    index_file_records
+)
+from .record_index import record_index_path
+
+logger = logging.getLogger(__name__)
+
+
+def get_job_settings():
+    job_settings = {
+        'MAX_ATTEMPTS': 3,
+        'RETRY_BACKOFF': 30,  # seconds; doubled after every failed attempt
+        'POLL_INTERVAL': 2,  # seconds between polls of an empty queue
+        'STALE_AFTER': 900,  # seconds without a heartbeat before a running job is requeued
+        'PROGRESS_INTERVAL': 1.0,  # minimum seconds between progress writes
+    }
+    job_settings.update(getattr(settings, 'JOB_SETTINGS', {}))
+    return job_settings
+
+
+def enqueue_job(file_obj, kind, **options):
+    """
+    Queue ``kind`` for ``file_obj``. An active job of the same kind for the
+    same processing directory (shared by copies) is returned instead of a duplicate.
+    """
+    active = ProcessingJob.objects.filter(kind=kind, options=options, status__in=JOB_ACTIVE_STATUSES,
+                                          cancel_requested=False)
+    if file_obj.get_processing_hash():
+        active = active.filter(file__processing_hash=file_obj.processing_hash)
+    else:
+        active = active.filter(file=file_obj)
+    job = active.order_by('id').first()
+    if job is None:
+        job = ProcessingJob.objects.create(
+            file=file_obj, kind=kind, options=options, max_attempts=get_job_settings()['MAX_ATTEMPTS']
+        )
+    return job
+
+
+def enqueue_file_processing(file_obj):
+    """
+    Queue the standard processing for a new upload: preview first (cheap), then
+    chunking. Identical content already processed (same content-keyed
+    directory) reuses its preview and, in the same chunk format, its chunks.
+    """
+    if file_obj.extension not in CHUNKABLE_TYPES:
+        return []
+    jobs = []
+    if load_preview(file_obj.get_processing_dir()) is None:
+        jobs.append(enqueue_job(file_obj, 'preview'))
+    chunk_format = file_obj.get_chunk_format()
+    manifest = load_manifest(file_obj.get_chunks_dir(chunk_format))
+    if manifest is None or manifest.chunk_format != chunk_format:
+        jobs.append(enqueue_job(file_obj, 'chunk', chunk_format=chunk_format))
+    return jobs
+
+
+def get_job_chunk_format(job):
+    """Chunk format a chunk or index job works on (jobs queued without one use the file's)"""
+    return job.options.get('chunk_format') or job.file.get_chunk_format()
+
+
+def run_chunk_job(job, progress):
+    chunk_format = get_job_chunk_format(job)
+    preview = load_preview(job.file.get_processing_dir())
+    if preview and preview.get('total_records') is not None:
+        # Parquet footers give the record count up front
+        job.report_progress(0, preview['total_records'])
+    # New chunks invalidate the record index: rebuild it if there was one
+    reindex = (os.path.exists(record_index_path(job.file.get_chunks_dir(chunk_format)))
+               or get_chunking_settings()['RECORD_INDEX_AUTO'])
+    stats = chunk_uploaded_file(job.file, chunk_format=chunk_format, progress=progress)
+    if reindex:
+        stats['index_job_id'] = enqueue_job(job.file, 'index', chunk_format=chunk_format).id
+    return stats, stats['record_count']
+
+
+def run_index_job(job, progress):
+    chunk_format = get_job_chunk_format(job)
+    manifest = load_manifest(job.file.get_chunks_dir(chunk_format))
+    if manifest is not None:
+        job.report_progress(0, manifest.record_count)
+    stats = index_file_records(job.file, chunk_format=chunk_format, progress=progress)
+    return stats, stats['record_count']
+
+
+def run_preview_job(job, progress):
+    preview = ensure_preview(job.file, refresh=True)
+    if preview is None:
+        # ensure_preview() logs the cause; a parse error will not go away on retry
+        raise UnsupportedFileType(f'Preview of file {job.file_id} could not be generated')
+    return {'columns': preview['columns'], 'total_records': preview['total_records']}, len(preview['records'])
+
+
+JOB_HANDLERS = {
+    'chunk': run_chunk_job,
+    'preview': run_preview_job,
+    'index': run_index_job,
+}
+
+
+def run_job(job):
+    """Run one claimed job to completion, failure (maybe retried) or cancellation"""
+    job_settings = get_job_settings()
+    last_report = [0.0]
+
+    def progress(records_done):
+        now = time.monotonic()
+        if now - last_report[0] < job_settings['PROGRESS_INTERVAL']:
+            return
+        last_report[0] = now
+        if not job.report_progress(records_done):
+            raise ProcessingCancelled(f'Job {job.id} cancelled')
+
+    logger.info("Job %s (%s) started for file %s, attempt %s", job.id, job.kind, job.file_id, job.attempts)
+    try:
+        result, records = JOB_HANDLERS[job.kind](job, progress)
+    except ProcessingCancelled:
+        job.finish('cancelled')
+    except ChunksNotReady as e:
+        # Chunking may still be queued or running: retried with backoff
+        job.fail(str(e), job_settings['RETRY_BACKOFF'])
+    except (UnsupportedFileType, FileNotFoundError) as e:
+        # Retrying cannot help
+        job.fail(str(e), job_settings['RETRY_BACKOFF'], retry=False)
+    except Exception as e:
+        job.fail(f'{type(e).__name__}: {e}', job_settings['RETRY_BACKOFF'])
+    else:
+        job.finish('succeeded', result=result, records_done=records,
+                   records_total=job.records_total if job.records_total is not None else records)
+    logger.info("Job %s (%s) %s", job.id, job.kind, job.status)
+    return job
+
+
+def work(worker_name=None, burst=False, poll_interval=None):
+    """
+    Worker loop: claim and run jobs until stopped. With ``burst`` the loop
+    exits once no job is runnable. Returns the number of jobs run.
+    """
+    job_settings = get_job_settings()
+    worker_name = worker_name or f'{socket.gethostname()}:{os.getpid()}'
+    poll_interval = poll_interval if poll_interval is not None else job_settings['POLL_INTERVAL']
+    count = 0
+    while True:
+        close_old_connections()
+        ProcessingJob.requeue_stale(job_settings['STALE_AFTER'])
+        job = ProcessingJob.claim_next(worker_name)
+        if job is None:
+            if burst:
+                return count
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        count += 1
@@ -0,0 +1,26 @@
+import os
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from files.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = "Abort resumable upload sessions that have been idle too long and remove their part files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24, help='Idle time before a session is aborted')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['hours'])
+        stale = UploadSession.objects.filter(status='active', updated_at__lt=cutoff)
+
+        count = 0
+        for session in stale.iterator():
+            part_path = session.get_part_path()
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            count += 1
+        stale.update(status='aborted')
+
+        self.stdout.write(self.style.SUCCESS(f"Aborted {count} stale upload session(s)"))
@@ -0,0 +1,34 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from files.blobs import ensure_blob
+from files.models import UploadedFile
+
+
+class Command(BaseCommand):
+    help = ("Move files uploaded before the blob store into it, deduplicating identical content, "
+            "and key every processing directory by its content digest")
+
+    def handle(self, *args, **options):
+        migrated = missing = 0
+        for file_id in UploadedFile.objects.filter(blob__isnull=True).values_list('id', flat=True):
+            # Re-read each row: an earlier file may already have moved it along with itself
+            file_obj = UploadedFile.objects.filter(id=file_id, blob__isnull=True).first()
+            if file_obj is None or not file_obj.file:
+                continue
+            try:
+                ensure_blob(file_obj)
+                migrated += 1
+            except FileNotFoundError:
+                missing += 1
+                self.stdout.write(self.style.WARNING(f"File {file_id}: {file_obj.file.name} is missing on disk"))
+
+        self.stdout.write(self.style.SUCCESS(f"Moved {migrated} file(s) into the blob store ({missing} missing)"))
+
+        # Blob-backed rows still keyed by the old file-name hash
+        by_digest = defaultdict(list)
+        stale_keys = UploadedFile.objects.filter(blob__isnull=False).exclude(processing_hash=F('blob__digest'))
+        for file_id, digest in stale_keys.values_list('id', 'blob__digest'):
+            by_digest[digest].append(file_id)
+        rekeyed = sum(UploadedFile.rekey_processing(file_ids, digest) for digest, file_ids in by_digest.items())
+        self.stdout.write(self.style.SUCCESS(f"Keyed {rekeyed} file(s) by content digest"))
@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+import socket
+from django.core.management.base import BaseCommand
+from django.db import connections
+from files.jobs import work
+
+
+def run_worker(index, burst, poll_interval):
+    # Connections inherited from the parent must not be shared across processes
+    for connection in connections.all():
+        connection.close()
+    work(f'{socket.gethostname()}:{os.getpid()}:{index}', burst=burst, poll_interval=poll_interval)
+
+
+class Command(BaseCommand):
+    help = "Run background processing workers that claim ProcessingJob rows from the database queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help="Seconds between polls of an empty queue (default: JOB_SETTINGS['POLL_INTERVAL'])")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        if workers == 1:
+            count = work(burst=options['burst'], poll_interval=options['poll_interval'])
+            self.stdout.write(self.style.SUCCESS(f"Processed {count} job(s)"))
+            return
+
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            # Not daemonic: chunking may start its own process pool
+            context.Process(target=run_worker, args=(index, options['burst'], options['poll_interval']))
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {workers} worker processes")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+        self.stdout.write(self.style.SUCCESS("Workers stopped"))
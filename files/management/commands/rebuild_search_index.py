@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand, CommandError
+from files.search import rebuild_index, search_available
+
+
+class Command(BaseCommand):
+    help = "Rebuild the metadata search index (files_search_index) from the folder and file tables"
+
+    def handle(self, *args, **options):
+        if not search_available():
+            raise CommandError("Search index table not found (SQLite with FTS5 required); search uses icontains instead")
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} file(s) and folder(s)"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from files.models import UploadedFile
+
+
+class Command(BaseCommand):
+    help = ("Re-sync stored processing flags (chunks, config, inference, record index) and the inference index "
+            "from the processing directories")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file-id', type=int, action='append', help='Only refresh these files (repeatable)')
+
+    def handle(self, *args, **options):
+        files = UploadedFile.objects.all()
+        if options['file_id']:
+            files = files.filter(id__in=options['file_id'])
+
+        count = 0
+        for file_obj in files.iterator():
+            file_obj.update_processing_status()
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Refreshed processing state for {count} file(s)"))
@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from files.models import UserStorageStats
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user storage statistics rollup (run periodically, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, action='append', help='Only refresh these users (repeatable)')
+        parser.add_argument('--stale-only', action='store_true', help='Only refresh rollups flagged as stale')
+
+    def handle(self, *args, **options):
+        if options['stale_only']:
+            user_ids = UserStorageStats.objects.filter(is_stale=True).values_list('user_id', flat=True)
+        elif options['user_id']:
+            user_ids = options['user_id']
+        else:
+            user_ids = User.objects.values_list('id', flat=True)
+
+        count = 0
+        for user_id in list(user_ids):
+            UserStorageStats.refresh_for_user(user_id)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Refreshed storage stats for {count} user(s)"))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0010_uploadsession_uploadsessionchunk'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadedfile',
+            name='processing_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=128, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0011_uploadedfile_processing_hash_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['uploaded_at', 'id'], name='file_uploaded_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['folder', 'uploaded_at', 'id'], name='file_folder_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['uploaded_by', 'uploaded_at', 'id'], name='file_user_keyset_idx'),
+        ),
+    ]
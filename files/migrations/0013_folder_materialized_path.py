@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:08
+
+from django.db import migrations, models
+
+
+def backfill_folder_paths(apps, schema_editor):
+    Folder = apps.get_model('files', 'Folder')
+    parents = dict(Folder.objects.values_list('id', 'parent_id'))
+    paths = {}
+
+    def resolve(folder_id):
+        # Walk up to the first folder with a known path (or the root), then fill in downwards
+        chain = []
+        while folder_id in parents and folder_id not in paths:
+            chain.append(folder_id)
+            folder_id = parents[folder_id]
+        prefix = paths.get(folder_id, '/')
+        for chain_id in reversed(chain):
+            prefix = f"{prefix}{chain_id}/"
+            paths[chain_id] = prefix
+        return prefix
+
+    folders = list(Folder.objects.only('id', 'path', 'depth'))
+    for folder in folders:
+        folder.path = resolve(folder.id)
+        folder.depth = folder.path.count('/') - 2
+    Folder.objects.bulk_update(folders, ['path', 'depth'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0012_uploadedfile_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='depth',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=1024),
+        ),
+        migrations.RunPython(backfill_folder_paths, migrations.RunPython.noop),
+    ]
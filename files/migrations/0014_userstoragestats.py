@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('files', '0013_folder_materialized_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStorageStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='storage_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('folders_created', models.IntegerField(default=0)),
+                ('files_uploaded', models.IntegerField(default=0)),
+                ('files_processed', models.IntegerField(default=0)),
+                ('files_with_inference', models.IntegerField(default=0)),
+                ('files_with_config', models.IntegerField(default=0)),
+                ('total_chunks', models.BigIntegerField(default=0)),
+                ('total_storage_bytes', models.BigIntegerField(default=0)),
+                ('is_stale', models.BooleanField(default=False)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
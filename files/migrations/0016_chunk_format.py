@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0015_blob_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='chunk_format',
+            field=models.CharField(choices=[('json', 'JSON (gzip frames)'), ('arrow', 'Arrow IPC (columnar)')], default='json', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='chunk_format',
+            field=models.CharField(blank=True, choices=[('json', 'JSON (gzip frames)'), ('arrow', 'Arrow IPC (columnar)')], default='', max_length=10),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0016_chunk_format'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InferenceRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processing_hash', models.CharField(max_length=128)),
+                ('filename', models.CharField(max_length=255)),
+                ('timestamp', models.DateTimeField()),
+                ('file_size', models.BigIntegerField(default=0)),
+                ('has_config', models.BooleanField(default=False)),
+                ('has_inference', models.BooleanField(default=False)),
+                ('indexed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['processing_hash', 'timestamp', 'id'], name='inference_hash_time_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='inferencerecord',
+            constraint=models.UniqueConstraint(fields=('processing_hash', 'filename'), name='inference_record_unique'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:41
+
+import logging
+from django.db import migrations, OperationalError
+
+logger = logging.getLogger(__name__)
+
+# Frozen copies of files.search as of this migration (the module may change later)
+CREATE_TABLE_SQL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS files_search_index USING fts5(
+        name, description, folder_path, file_type,
+        kind UNINDEXED, object_id UNINDEXED, folder_id UNINDEXED,
+        tokenize = "unicode61 remove_diacritics 2", prefix = '2 3'
+    )
+"""
+
+FOLDER_PATHS_CTE = """
+    WITH RECURSIVE folder_paths(id, name_path) AS (
+        SELECT id, name FROM files_folder WHERE parent_id IS NULL
+        UNION ALL
+        SELECT f.id, fp.name_path || '/' || f.name FROM files_folder f JOIN folder_paths fp ON f.parent_id = fp.id
+    )
+"""
+
+REBUILD_FOLDERS_SQL = FOLDER_PATHS_CTE + """
+    INSERT INTO files_search_index (rowid, kind, object_id, folder_id, name, description, folder_path, file_type)
+    SELECT f.id * 2 + 1, 'folder', f.id, f.parent_id, f.name, COALESCE(f.description, ''), fp.name_path,
+           f.allowed_type
+    FROM files_folder f JOIN folder_paths fp ON fp.id = f.id
+"""
+
+REBUILD_FILES_SQL = FOLDER_PATHS_CTE + """
+    , names(id, folder_id, description, name) AS (
+        SELECT id, folder_id, description,
+               REPLACE(COALESCE(NULLIF(original_name, ''), file), RTRIM(COALESCE(NULLIF(original_name, ''), file),
+                       REPLACE(COALESCE(NULLIF(original_name, ''), file), '/', '')), '')
+        FROM files_uploadedfile
+    )
+    INSERT INTO files_search_index (rowid, kind, object_id, folder_id, name, description, folder_path, file_type)
+    SELECT n.id * 2, 'file', n.id, n.folder_id, n.name, COALESCE(n.description, ''), COALESCE(fp.name_path, ''),
+           CASE WHEN INSTR(n.name, '.') > 0
+                THEN LOWER(REPLACE(n.name, RTRIM(n.name, REPLACE(n.name, '.', '')), ''))
+                ELSE '' END
+    FROM names n LEFT JOIN folder_paths fp ON fp.id = n.folder_id
+"""
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5 is SQLite-only; elsewhere (or without FTS5) search falls back to icontains queries
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_TABLE_SQL)
+        except OperationalError as e:
+            logger.warning("FTS5 unavailable, search index not created: %s", e)
+            return
+        cursor.execute(REBUILD_FOLDERS_SQL)
+        cursor.execute(REBUILD_FILES_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS files_search_index")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0018_processing_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
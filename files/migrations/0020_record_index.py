@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0019_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='has_record_index',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='processingjob',
+            name='kind',
+            field=models.CharField(choices=[('chunk', 'Chunk records'), ('preview', 'Build preview'), ('index', 'Build record index')], max_length=20),
+        ),
+    ]
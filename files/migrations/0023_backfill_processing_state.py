@@ -0,0 +1,101 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:10
+
+import hashlib
+import json
+import os
+from django.conf import settings
+from django.db import migrations
+from werkzeug.utils import secure_filename
+
+# Frozen copies of the layout at the time of this migration (files.chunking may change)
+CHUNK_SUFFIXES = {'json': '.json.gz', 'arrow': '.arrow'}
+BATCH_SIZE = 500  # Keeps pk__in under SQLite's bound-parameter limit
+STATE_FIELDS = ['processing_hash', 'has_chunks', 'chunk_count', 'has_inference', 'has_config', 'config_added',
+                'processing_status']
+
+
+def read_chunk_count(directory, chunk_format):
+    """Chunk count from the manifest in ``directory``, or None when it has none for ``chunk_format``"""
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('chunk_format', 'json') != chunk_format:
+        return None
+    return manifest.get('chunk_count', 0)
+
+
+def scan_processing_dir(processing_dir):
+    """Stored flags of one processing directory: chunk counts per format, inference and config"""
+    chunk_counts = {}
+    for chunk_format, suffix in CHUNK_SUFFIXES.items():
+        count = read_chunk_count(processing_dir, chunk_format)
+        if count is None and chunk_format != 'json':
+            count = read_chunk_count(os.path.join(processing_dir, chunk_format), chunk_format)
+        if count is None and chunk_format == 'json' and os.path.isdir(processing_dir):
+            # Chunks written before manifests existed
+            count = len([name for name in os.listdir(processing_dir) if name.endswith(suffix)])
+        chunk_counts[chunk_format] = count or 0
+    inference_dir = os.path.join(processing_dir, 'inference')
+    return {
+        'chunk_counts': chunk_counts,
+        'has_inference': os.path.isdir(inference_dir) and any(
+            name.endswith('.json') for name in os.listdir(inference_dir)
+        ),
+        'has_config': os.path.exists(os.path.join(processing_dir, 'config.json')),
+    }
+
+
+def backfill_processing_state(apps, schema_editor):
+    """
+    Give rows from before stored processing state their processing_hash and
+    the flags listings read, so no listing has to compute or write them.
+    """
+    UploadedFile = apps.get_model('files', 'UploadedFile')
+    scans = {}
+    file_ids = list(UploadedFile.objects.exclude(file='').order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(file_ids), BATCH_SIZE):
+        batch = list(UploadedFile.objects.filter(pk__in=file_ids[start:start + BATCH_SIZE]).select_related(
+            'blob', 'folder'
+        ))
+        for file_obj in batch:
+            backfill_row(file_obj, scans)
+        UploadedFile.objects.bulk_update(batch, STATE_FIELDS)
+
+
+def backfill_row(file_obj, scans):
+    """The processing key and flags of one row (UploadedFile.get_processing_hash / update_processing_status)"""
+    if not file_obj.processing_hash:
+        if file_obj.blob_id:
+            file_obj.processing_hash = file_obj.blob.digest
+        else:
+            sec_filename = secure_filename(os.path.basename(file_obj.file.name))
+            file_obj.processing_hash = hashlib.sha512(bytes(sec_filename, "utf-8")).hexdigest()
+    if file_obj.processing_hash not in scans:
+        scans[file_obj.processing_hash] = scan_processing_dir(
+            os.path.join(settings.MEDIA_ROOT, file_obj.processing_hash)
+        )
+    scan = scans[file_obj.processing_hash]
+
+    chunk_format = file_obj.chunk_format or (file_obj.folder.chunk_format if file_obj.folder_id else '') or 'json'
+    file_obj.chunk_count = scan['chunk_counts'].get(chunk_format, 0)
+    file_obj.has_chunks = file_obj.chunk_count > 0
+    if file_obj.has_chunks and file_obj.processing_status == 'raw':
+        file_obj.processing_status = 'processed'
+    elif not file_obj.has_chunks and file_obj.processing_status == 'processed':
+        file_obj.processing_status = 'raw'
+    file_obj.has_inference = scan['has_inference']
+    file_obj.has_config = scan['has_config']
+    file_obj.config_added = scan['has_config']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0022_uploadsession_finalizing'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_processing_state, migrations.RunPython.noop),
+    ]
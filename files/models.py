@@ -1,10 +1,55 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
 import os
+import math
+import uuid
 import hashlib
+import json
 import shutil
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
 from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from werkzeug.utils import secure_filename
+from .chunking import CHUNK_SUFFIXES, find_format_dir, load_manifest
+from .record_index import RecordIndex
+from . import cache, search
+
+# Keeps every ``id__in`` list under SQLite's bound-parameter limit
+BULK_BATCH_SIZE = 500
+
+
+def batched(items, size=BULK_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def remove_paths(paths):
+    """Unlink files and processing directories; anything already gone is ignored"""
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            print(f"DEBUG: Deleted processing directory: {path}")
+        elif os.path.exists(path):
+            os.remove(path)
+            print(f"DEBUG: Deleted physical file: {path}")
+
+
+def remove_paths_on_commit(paths):
+    """Defer removal until the surrounding transaction commits, as one batch"""
+    paths = [path for path in paths if path]
+    if paths:
+        transaction.on_commit(lambda: remove_paths(paths))
+
+
+CHUNK_FORMAT_CHOICES = [('json', 'JSON (gzip frames)'), ('arrow', 'Arrow IPC (columnar)')]
+# File types a folder can hold (every upload into a folder has one of these extensions)
+ALLOWED_TYPE_CHOICES = [('pdf', 'PDF'), ('csv', 'CSV'), ('json', 'JSON'), ('parquet', 'PARQUET')]
+
 
 def get_upload_path(instance, filename):
     """Generate upload path based on folder structure"""
@@ -19,11 +64,7 @@ def get_upload_path(instance, filename):
 class Folder(models.Model):
     name = models.CharField(max_length=255)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subfolders')
-    allowed_type = models.CharField(
-        max_length=10,
-        choices=[('pdf', 'PDF'), ('csv', 'CSV'), ('json', 'JSON'), ('parquet', 'PARQUET')],
-        default='csv'
-    )
+    allowed_type = models.CharField(max_length=10, choices=ALLOWED_TYPE_CHOICES, default='csv')
 
     # Integration fields
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='created_folders')
@@ -31,17 +72,341 @@ class Folder(models.Model):
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     description = models.TextField(blank=True, null=True)
     is_public = models.BooleanField(default=True)  # Changed to True - all folders are public
+    # Storage format for processed chunks of files in this folder
+    chunk_format = models.CharField(max_length=10, choices=CHUNK_FORMAT_CHOICES, default='json')
+
+    # Materialized path of ancestor ids, e.g. "/1/5/9/" (ids, so renames never touch it)
+    path = models.CharField(max_length=1024, blank=True, default='', db_index=True)
+    depth = models.PositiveIntegerField(default=0)
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            parent_path = '/'
+            if self.parent_id:
+                parent_path = Folder.objects.values_list('path', flat=True).get(pk=self.parent_id)
+                if self.path and parent_path.startswith(self.path):
+                    raise ValueError('Cannot move a folder into itself or one of its subfolders')
+
+            super().save(*args, **kwargs)
+
+            new_path = f"{parent_path}{self.pk}/"
+            new_depth = new_path.count('/') - 2
+            if new_path != self.path:
+                if self.path:
+                    # Moved: rewrite the whole subtree (including this row) in one statement
+                    Folder.objects.filter(path__startswith=self.path).update(
+                        path=Concat(Value(new_path), Substr('path', len(self.path) + 1)),
+                        depth=F('depth') + (new_depth - self.depth)
+                    )
+                else:
+                    Folder.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+                self.path = new_path
+                self.depth = new_depth
+
+        if adding:
+            UserStorageStats.mark_stale(self.created_by_id)
+
+    def ensure_subfolder_paths(self, dir_paths, **defaults):
+        """
+        Create the subfolders named by ``dir_paths`` (tuples of names relative to
+        this folder, ancestors implied) level by level: one lookup, one bulk
+        INSERT and one path UPDATE per depth. Existing subfolders are reused.
+        Returns {dir_path: Folder}, with () mapping to this folder.
+        """
+        wanted = {()}
+        for dir_path in dir_paths:
+            wanted.update(tuple(dir_path[:i]) for i in range(1, len(dir_path) + 1))
+        folders = {(): self}
+        max_depth = max(len(dir_path) for dir_path in wanted)
+        with transaction.atomic():
+            for level in range(1, max_depth + 1):
+                level_paths = [dir_path for dir_path in wanted if len(dir_path) == level]
+                parent_ids = {folders[dir_path[:-1]].pk for dir_path in level_paths}
+                existing = {}
+                for parent_batch in batched(parent_ids):
+                    for folder in Folder.objects.filter(parent_id__in=parent_batch):
+                        existing.setdefault((folder.parent_id, folder.name), folder)
+                new_folders = []
+                for dir_path in level_paths:
+                    parent = folders[dir_path[:-1]]
+                    folder = existing.get((parent.pk, dir_path[-1]))
+                    if folder is None:
+                        folder = Folder(name=dir_path[-1], parent=parent, depth=parent.depth + 1, **defaults)
+                        new_folders.append(folder)
+                    folders[dir_path] = folder
+                # bulk_create skips save(), so the materialized paths are filled in afterwards
+                Folder.objects.bulk_create(new_folders, batch_size=BULK_BATCH_SIZE)
+                for folder in new_folders:
+                    folder.path = f"{folder.parent.path}{folder.pk}/"
+                Folder.objects.bulk_update(new_folders, ['path'], batch_size=BULK_BATCH_SIZE)
+                search.index_folders([folder.pk for folder in new_folders])
+                cache.invalidate_folders({folder.parent_id for folder in new_folders}, folders=True)
+            UserStorageStats.mark_stale(defaults.get('created_by_id'))
+        return folders
+
+    def get_descendants(self, include_self=False):
+        """Whole subtree in one query"""
+        descendants = Folder.objects.filter(path__startswith=self.path)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+
+    def get_ancestor_ids(self):
+        return [int(part) for part in self.path.strip('/').split('/')[:-1] if part]
+
+    def get_ancestors(self):
+        """Ancestors from the root down, in one query"""
+        return Folder.objects.filter(id__in=self.get_ancestor_ids()).order_by('depth')
+
+    def get_subtree_files(self):
+        """Files in this folder and every descendant folder"""
+        return UploadedFile.objects.filter(folder__path__startswith=self.path)
+
+    def get_subtree_stats(self):
+        """Descendant folder count and file count/size, aggregated in the database"""
+        file_stats = self.get_subtree_files().aggregate(file_count=Count('id'), total_size=Sum('file_size'))
+        return {
+            'folder_count': self.get_descendants().count(),
+            'file_count': file_stats['file_count'],
+            'total_size': file_stats['total_size'] or 0
+        }
+
+    @staticmethod
+    def build_tree(folders):
+        """Link an already-fetched subtree into nodes with a ``children`` list; returns the top nodes"""
+        folders = sorted(folders, key=lambda folder: (folder.depth, folder.name))
+        by_id = {folder.id: folder for folder in folders}
+        roots = []
+        for folder in folders:
+            folder.children = []
+            parent = by_id.get(folder.parent_id)
+            if parent is not None:
+                parent.children.append(folder)
+            else:
+                roots.append(folder)
+        return roots
+
+    def delete(self, *args, **kwargs):
+        """Delete the subtree's files set-based first so their blob references are released"""
+        with transaction.atomic():
+            self.get_subtree_files().delete()
+            search.unindex_folders(self.get_descendants(include_self=True).values_list('id', flat=True))
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
+
+def get_blob_storage_name(digest):
+    """blobs/ab/cd/abcd... - two fan-out levels keep directories small"""
+    return os.path.join('blobs', digest[:2], digest[2:4], digest)
+
+
+class Blob(models.Model):
+    """Content-addressed bytes shared by every UploadedFile with identical content"""
+    digest = models.CharField(max_length=64, unique=True)  # SHA-256 hex
+    size = models.BigIntegerField()
+    storage_name = models.CharField(max_length=255)
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def path(self):
+        return os.path.join(settings.MEDIA_ROOT, self.storage_name)
+
+    @classmethod
+    def acquire(cls, digest):
+        """Add a reference to an existing blob; returns None if there is no blob with this digest"""
+        if cls.objects.filter(digest=digest).update(ref_count=F('ref_count') + 1):
+            return cls.objects.get(digest=digest)
+        return None
+
+    @classmethod
+    def adjust_refs(cls, counts, sign):
+        """Apply {blob_id: n} reference changes with one UPDATE per distinct n"""
+        by_amount = defaultdict(list)
+        for blob_id, amount in counts.items():
+            if blob_id:
+                by_amount[amount].append(blob_id)
+        for amount, blob_ids in by_amount.items():
+            for batch in batched(blob_ids):
+                cls.objects.filter(pk__in=batch).update(ref_count=F('ref_count') + sign * amount)
+
+    @classmethod
+    def acquire_many(cls, counts):
+        cls.adjust_refs(counts, 1)
+
+    @classmethod
+    def release(cls, blob_id):
+        return cls.release_many(Counter([blob_id]))
+
+    @classmethod
+    def release_many(cls, counts):
+        """
+        Drop {blob_id: n} references. Blobs left unreferenced are deleted and
+        their bytes removed after commit; returns how many were orphaned.
+        """
+        with transaction.atomic():
+            cls.adjust_refs(counts, -1)
+            orphans = []
+            for batch in batched(blob_id for blob_id in counts if blob_id):
+                # Never trust the counter alone to delete bytes that a row still points at
+                orphans.extend(cls.objects.filter(pk__in=batch, ref_count__lte=0, files__isnull=True))
+            for batch in batched(orphans):
+                cls.objects.filter(pk__in=[blob.pk for blob in batch]).delete()
+            if orphans:
+                transaction.on_commit(lambda: cls.delete_orphaned_bytes(orphans))
+        return len(orphans)
+
+    @classmethod
+    def delete_orphaned_bytes(cls, blobs):
+        """Remove stored bytes unless the digest was re-ingested meanwhile"""
+        reingested = set()
+        for batch in batched(blob.digest for blob in blobs):
+            reingested.update(cls.objects.filter(digest__in=batch).values_list('digest', flat=True))
+        remove_paths([blob.path for blob in blobs if blob.digest not in reingested])
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.ref_count} refs)"
+
+
+# Stored processing flags, shared by every row with the same processing_hash
+PROCESSING_STATE_FIELDS = ('has_chunks', 'chunk_count', 'has_inference', 'has_config', 'config_added',
+                           'processing_status', 'has_record_index')
+# ...except those describing chunks, which are kept per chunk format (see chunking.format_dir)
+CHUNK_STATE_FIELDS = ('has_chunks', 'chunk_count', 'processing_status', 'has_record_index')
+SHARED_STATE_FIELDS = tuple(field for field in PROCESSING_STATE_FIELDS if field not in CHUNK_STATE_FIELDS)
+UNPROCESSED_STATE = {'has_chunks': False, 'chunk_count': 0, 'has_inference': False, 'has_config': False,
+                     'config_added': False, 'processing_status': 'raw', 'has_record_index': False}
+
+
+def resolve_chunk_format(file_format, folder_format):
+    """A file's own chunk format, else its folder's, else JSON"""
+    return file_format or folder_format or 'json'
+
+
+def chunk_format_filter(chunk_format):
+    """Q matching the files whose effective chunk format (see resolve_chunk_format) is ``chunk_format``"""
+    inherited = models.Q(chunk_format='', folder__chunk_format=chunk_format)
+    if chunk_format == 'json':
+        inherited |= models.Q(chunk_format='', folder__isnull=True) | models.Q(chunk_format='', folder__chunk_format='')
+    return models.Q(chunk_format=chunk_format) | inherited
+
+
+# resolve_chunk_format() in SQL, for grouping files by the chunks they use
+EFFECTIVE_CHUNK_FORMAT = Case(
+    When(~models.Q(chunk_format=''), then=F('chunk_format')),
+    When(folder__chunk_format__gt='', then=F('folder__chunk_format')),
+    default=Value('json'), output_field=models.CharField()
+)
+
+
+def read_processing_state(rows, chunk_format):
+    """
+    Stored flags of ``rows`` (sharing one processing_hash) as seen by a file
+    using ``chunk_format``: chunk flags come from rows with the same format.
+    Empty when there are no rows.
+    """
+    state = rows.values(*SHARED_STATE_FIELDS).first()
+    if state is None:
+        return {}
+    state.update(rows.filter(chunk_format_filter(chunk_format)).values(*CHUNK_STATE_FIELDS).first() or {})
+    return state
+
+
+def scan_chunk_state(processing_dir, chunk_format):
+    """Chunk flags of ``chunk_format`` as found in ``processing_dir`` (see UploadedFile.update_processing_status)"""
+    # Chunk count from the manifest; listing only for chunks written before manifests existed
+    chunks_dir = find_format_dir(processing_dir, chunk_format)
+    manifest = load_manifest(chunks_dir)
+    if manifest is not None and manifest.chunk_format == chunk_format:
+        chunk_count = manifest.chunk_count
+    elif manifest is None and os.path.isdir(chunks_dir):
+        chunk_count = len([f for f in os.listdir(chunks_dir) if f.endswith(CHUNK_SUFFIXES[chunk_format])])
+    else:
+        chunk_count = 0
+
+    # A record index only counts while it matches the current chunks
+    has_record_index = False
+    record_index = RecordIndex.open(chunks_dir)
+    if record_index is not None:
+        with record_index:
+            has_record_index = record_index.matches(manifest)
+    return {'has_chunks': chunk_count > 0, 'chunk_count': chunk_count,
+            'processing_status': 'processed' if chunk_count > 0 else 'raw', 'has_record_index': has_record_index}
+
+
+def relocated_chunk_state(files, folder):
+    """
+    {file id: chunk flags} of ``files`` once filed in ``folder``, whose chunk
+    format may change their effective format: the flags of a row with the same
+    processing_hash and the new format, else whatever chunks of that format
+    the processing directory holds. Read before any row moves; files without
+    a processing_hash are left out.
+    """
+    folder_format = folder.chunk_format if folder else ''
+    states = {}
+    hashes = {file_obj.processing_hash for file_obj in files if file_obj.processing_hash}
+    for batch in batched(hashes):
+        for state in UploadedFile.objects.filter(processing_hash__in=batch).annotate(
+                effective_chunk_format=EFFECTIVE_CHUNK_FORMAT).values(
+                'processing_hash', 'effective_chunk_format', *CHUNK_STATE_FIELDS):
+            states.setdefault((state.pop('processing_hash'), state.pop('effective_chunk_format')), state)
+
+    relocated = {}
+    for file_obj in files:
+        if not file_obj.processing_hash:
+            continue
+        key = (file_obj.processing_hash, resolve_chunk_format(file_obj.chunk_format, folder_format))
+        if key not in states:
+            # No row uses that format (yet): chunks written for it earlier may still be on disk
+            states[key] = scan_chunk_state(os.path.join(settings.MEDIA_ROOT, key[0]), key[1])
+        relocated[file_obj.pk] = states[key]
+    return relocated
+
+
+class UploadedFileQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Set-based delete: blob references are released in bulk and legacy files
+        and no-longer-shared processing directories are unlinked after commit.
+        """
+        with transaction.atomic():
+            rows = list(self.values_list('id', 'blob_id', 'file', 'processing_hash', 'uploaded_by_id', 'folder_id'))
+            result = super().delete()
+            search.unindex_files([file_id for file_id, _, _, _, _, _ in rows])
+            cache.invalidate_file_folders({folder_id for _, _, _, _, _, folder_id in rows})
+
+            Blob.release_many(Counter(blob_id for _, blob_id, _, _, _, _ in rows if blob_id))
+
+            legacy_paths = [os.path.join(settings.MEDIA_ROOT, name) for _, blob_id, name, _, _, _ in rows
+                            if not blob_id and name]
+            # Copies share the processing directory; keep it while any of them remain
+            hashes = {processing_hash for _, _, _, processing_hash, _, _ in rows if processing_hash}
+            for batch in batched(hashes):
+                hashes.difference_update(
+                    UploadedFile.objects.filter(processing_hash__in=batch).values_list('processing_hash', flat=True)
+                )
+            for batch in batched(hashes):
+                InferenceRecord.objects.filter(processing_hash__in=batch).delete()
+            remove_paths_on_commit(legacy_paths + [os.path.join(settings.MEDIA_ROOT, h) for h in hashes])
+
+            UserStorageStats.mark_stale(*{user_id for _, _, _, _, user_id, _ in rows})
+        return result
+
+
 class UploadedFile(models.Model):
     file = models.FileField(upload_to=get_upload_path)
     folder = models.ForeignKey(Folder, on_delete=models.CASCADE, null=True, blank=True, related_name='files')
-    
+    # Content-addressed storage; None for rows uploaded before the blob store
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='files')
+
     # Integration fields
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='uploaded_files')
     uploaded_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    # Also set by the queryset update() paths (processing state, moves); feeds the conditional-GET validators
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     file_size = models.BigIntegerField(null=True, blank=True)
     original_name = models.CharField(max_length=255, blank=True)
     description = models.TextField(blank=True, null=True)
@@ -49,7 +414,7 @@ class UploadedFile(models.Model):
     config_added = models.BooleanField(default=False)
     
     # Enhanced processing fields (Flask reference pattern)
-    processing_hash = models.CharField(max_length=128, blank=True, null=True)
+    processing_hash = models.CharField(max_length=128, blank=True, null=True, db_index=True)
     has_chunks = models.BooleanField(default=False)
     has_inference = models.BooleanField(default=False)
     has_config = models.BooleanField(default=False)
@@ -64,49 +429,174 @@ class UploadedFile(models.Model):
         default='raw'
     )
     chunk_count = models.IntegerField(default=0)
+    # Inverted index over the chunk contents (records.idx.sqlite3) is built and current
+    has_record_index = models.BooleanField(default=False)
+    # Blank inherits the folder's chunk format
+    chunk_format = models.CharField(max_length=10, choices=CHUNK_FORMAT_CHOICES, blank=True, default='')
+
+    objects = UploadedFileQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination on (uploaded_at, id), optionally scoped by folder or uploader
+            models.Index(fields=['uploaded_at', 'id'], name='file_uploaded_keyset_idx'),
+            models.Index(fields=['folder', 'uploaded_at', 'id'], name='file_folder_keyset_idx'),
+            models.Index(fields=['uploaded_by', 'uploaded_at', 'id'], name='file_user_keyset_idx'),
+        ]
 
     def get_processing_hash(self):
-        """Generate hash-based directory like Flask reference"""
+        """
+        Processing key, stored on the row once: the blob's SHA-256, so identical
+        content shares one processing directory and reuses its chunks and
+        inference results. Files not yet in the blob store fall back to the
+        Flask reference's hash of the file name until migrate_to_blobs moves them.
+        """
         if not self.processing_hash and self.file:
-            filename = os.path.basename(self.file.name)
-            sec_filename = secure_filename(filename)
-            m = hashlib.sha512()
-            m.update(bytes(sec_filename, "utf-8"))
-            self.processing_hash = m.hexdigest()
-            self.save()
+            if self.blob_id:
+                self.processing_hash = self.blob.digest
+            else:
+                sec_filename = secure_filename(os.path.basename(self.file.name))
+                self.processing_hash = hashlib.sha512(bytes(sec_filename, "utf-8")).hexdigest()
+            if self.pk:
+                state = self.inherit_processing_state()
+                UploadedFile.objects.filter(pk=self.pk).update(processing_hash=self.processing_hash,
+                                                               updated_at=timezone.now(), **state)
+                if state:
+                    cache.invalidate_folders([self.folder_id])
         return self.processing_hash
 
+    def inherit_processing_state(self):
+        """
+        Copy the stored processing flags of another row with the same processing
+        key (identical content already processed); chunk flags only from rows
+        with this file's chunk format. Returns the copied fields.
+        """
+        state = read_processing_state(
+            UploadedFile.objects.filter(processing_hash=self.processing_hash).exclude(pk=self.pk),
+            self.get_chunk_format()
+        )
+        for field, value in state.items():
+            setattr(self, field, value)
+        return state
+
+    @classmethod
+    def rekey_processing(cls, file_ids, new_hash):
+        """
+        Move rows to the processing key ``new_hash`` (e.g. from a name-based key
+        to their content digest). Artifacts move along when the old directory is
+        not shared with other content and none exists under the new key yet;
+        otherwise the rows take the new key's state, or start unprocessed.
+        """
+        with transaction.atomic():
+            rows = list(cls.objects.filter(pk__in=file_ids).exclude(processing_hash=new_hash).values_list(
+                'id', 'processing_hash', 'folder_id'
+            ))
+            if not rows:
+                return 0
+            moved_ids = [file_id for file_id, _, _ in rows]
+            old_hashes = {old_hash for _, old_hash, _ in rows}
+            new_dir = os.path.join(settings.MEDIA_ROOT, new_hash)
+            # The key whose stored flags the rows take
+            state_hash = new_hash if cls.objects.filter(processing_hash=new_hash).exists() else None
+            for old_hash in old_hashes - {None}:
+                old_dir = os.path.join(settings.MEDIA_ROOT, old_hash)
+                if cls.objects.filter(processing_hash=old_hash).exclude(pk__in=moved_ids).exists():
+                    continue  # Still used by other content: its artifacts are not ours to take
+                if state_hash is None and os.path.isdir(old_dir) and not os.path.exists(new_dir):
+                    # The artifacts come along, and so do their flags
+                    state_hash = old_hash
+                    InferenceRecord.objects.filter(processing_hash=old_hash).update(processing_hash=new_hash)
+                    transaction.on_commit(lambda old_dir=old_dir: os.replace(old_dir, new_dir))
+                else:
+                    InferenceRecord.objects.filter(processing_hash=old_hash).delete()
+                    remove_paths_on_commit([old_dir])
+            # Chunk flags differ per format: read them all before any row moves
+            states = {}
+            for chunk_format, _ in CHUNK_FORMAT_CHOICES:
+                states[chunk_format] = dict(UNPROCESSED_STATE)
+                if state_hash:
+                    states[chunk_format].update(read_processing_state(
+                        cls.objects.filter(processing_hash=state_hash), chunk_format
+                    ))
+            now = timezone.now()
+            for chunk_format, state in states.items():
+                cls.objects.filter(chunk_format_filter(chunk_format), pk__in=moved_ids).update(
+                    processing_hash=new_hash, updated_at=now, **state
+                )
+            cache.invalidate_folders({folder_id for _, _, folder_id in rows})
+        return len(moved_ids)
+
+    def get_chunk_format(self):
+        return resolve_chunk_format(self.chunk_format, self.folder.chunk_format if self.folder_id else '')
+
     def get_processing_dir(self):
         """Get processing directory path"""
         if self.get_processing_hash():
             return os.path.join(settings.MEDIA_ROOT, self.processing_hash)
         return None
 
+    def get_chunks_dir(self, chunk_format=None):
+        """Directory with the manifest and chunks of ``chunk_format`` (default: this file's format)"""
+        processing_dir = self.get_processing_dir()
+        if processing_dir is None:
+            return None
+        return find_format_dir(processing_dir, chunk_format or self.get_chunk_format())
+
+    def set_processing_state(self, chunk_format=None, **state):
+        """
+        Persist processing flags (the source of truth for listings).
+        The processing directory is shared by every row with the same
+        processing_hash, so all of them are updated together; chunk flags
+        only on the rows using ``chunk_format`` (default: this file's format).
+        """
+        if 'has_config' in state:
+            state.setdefault('config_added', state['has_config'])
+        if 'chunk_count' in state:
+            state.setdefault('has_chunks', state['chunk_count'] > 0)
+            state.setdefault('processing_status', 'processed' if state['chunk_count'] > 0 else 'raw')
+        chunk_state = {field: state.pop(field) for field in CHUNK_STATE_FIELDS if field in state}
+        chunk_format = chunk_format or self.get_chunk_format()
+
+        with transaction.atomic():
+            rows = UploadedFile.objects.filter(pk=self.pk)
+            if self.get_processing_hash():
+                rows = UploadedFile.objects.filter(models.Q(pk=self.pk) | models.Q(processing_hash=self.processing_hash))
+            now = timezone.now()
+            if state:
+                rows.update(updated_at=now, **state)
+            if chunk_state:
+                rows.filter(chunk_format_filter(chunk_format)).update(updated_at=now, **chunk_state)
+            # Listings show the flags of every row sharing the directory, wherever it is filed
+            cache.invalidate_folders(rows.values_list('folder_id', flat=True).distinct())
+
+        if chunk_format == self.get_chunk_format():
+            state.update(chunk_state)
+        for field, value in state.items():
+            setattr(self, field, value)
+        UserStorageStats.mark_stale(*rows.values_list('uploaded_by_id', flat=True).distinct())
+
     def update_processing_status(self):
-        """Update processing status based on directory contents"""
+        """Reconcile the stored processing flags with the directory contents"""
         processing_dir = self.get_processing_dir()
         if processing_dir and os.path.exists(processing_dir):
-            # Check for chunks
-            chunk_files = [f for f in os.listdir(processing_dir) if f.endswith('.json.gz')]
-            self.has_chunks = len(chunk_files) > 0
-            self.chunk_count = len(chunk_files)
-            
-            # Check for inference
+            chunk_state = scan_chunk_state(processing_dir, self.get_chunk_format())
+
+            # Check for inference results (and index any written outside the app)
             inference_dir = os.path.join(processing_dir, "inference")
-            self.has_inference = os.path.exists(inference_dir)
-            
+            InferenceRecord.sync_dir(self.processing_hash, inference_dir)
+            has_inference = os.path.isdir(inference_dir) and any(
+                f.endswith('.json') for f in os.listdir(inference_dir)
+            )
+
             # Check for config
             config_file = os.path.join(processing_dir, "config.json")
-            self.has_config = os.path.exists(config_file)
-            self.config_added = self.has_config
-            
-            # Update status
-            if self.has_chunks:
-                self.processing_status = 'processed'
-            else:
-                self.processing_status = 'raw'
-            
-            self.save()
+
+            self.set_processing_state(
+                chunk_count=chunk_state['chunk_count'],
+                has_inference=has_inference,
+                has_config=os.path.exists(config_file),
+                has_record_index=chunk_state['has_record_index']
+            )
 
     def save(self, *args, **kwargs):
         if self.file and hasattr(self.file, 'size'):
@@ -114,35 +604,345 @@ class UploadedFile(models.Model):
         if not self.original_name and self.file:
             self.original_name = self.file.name
         super().save(*args, **kwargs)
+        # Stored once so status lookups never need to hash
+        if not self.processing_hash:
+            self.get_processing_hash()
+        UserStorageStats.mark_stale(self.uploaded_by_id)
     
+    @property
+    def display_name(self):
+        """Name shown and downloaded as (blob storage names are digests)"""
+        return os.path.basename(self.original_name or self.file.name)
+
+    @property
+    def extension(self):
+        return os.path.splitext(self.display_name)[1].lstrip('.').lower()
+
     def delete(self, *args, **kwargs):
-        """Override delete to remove physical file from storage"""
-        # Store the file path before deletion
-        file_path = None
-        if self.file:
-            try:
-                file_path = self.file.path
-            except ValueError:
-                # File field has no file associated with it
-                pass
-        
-        # Store processing directory path
-        processing_dir = None
-        if self.processing_hash:
-            processing_dir = os.path.join(settings.MEDIA_ROOT, self.processing_hash)
-        
-        # Call the parent delete method first to remove from database
-        super().delete(*args, **kwargs)
-        
-        # Now delete the physical file after database deletion
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"DEBUG: Deleted physical file: {file_path}")
-        
-        # Delete processing directory if it exists
-        if processing_dir and os.path.exists(processing_dir):
-            shutil.rmtree(processing_dir)
-            print(f"DEBUG: Deleted processing directory: {processing_dir}")
+        """Delete through the queryset so blob release and file cleanup live in one place"""
+        return UploadedFile.objects.filter(pk=self.pk).delete()
 
     def __str__(self):
         return self.original_name or str(self.file.name) if self.file else f"File {self.id}"
+
+
+INFERENCE_FILE_PREFIX = 'conf_and_inf_'
+
+
+def parse_inference_timestamp(value):
+    """Timestamp of an inference result: ISO 8601 string or Unix seconds; None if unusable"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return datetime.fromtimestamp(value, tz=timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            # Out of the platform's range, or NaN
+            return None
+    if isinstance(value, str):
+        try:
+            parsed = parse_datetime(value)
+        except ValueError:
+            return None
+        if parsed is not None and timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, timezone.utc)
+        return parsed
+    return None
+
+
+class InferenceRecord(models.Model):
+    """
+    Index of the conf_and_inf_*.json results in a processing directory, so
+    inference history is listed and filtered without opening result files.
+    Keyed by processing_hash because copies share the directory.
+    """
+    processing_hash = models.CharField(max_length=128)
+    filename = models.CharField(max_length=255)
+    timestamp = models.DateTimeField()
+    file_size = models.BigIntegerField(default=0)
+    has_config = models.BooleanField(default=False)
+    has_inference = models.BooleanField(default=False)
+    indexed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['processing_hash', 'filename'], name='inference_record_unique'),
+        ]
+        indexes = [
+            # Newest-first keyset pagination and time-range filters per directory
+            models.Index(fields=['processing_hash', 'timestamp', 'id'], name='inference_hash_time_idx'),
+        ]
+
+    @classmethod
+    def index_file(cls, processing_hash, file_path, data=None):
+        """Create or refresh the row for one result file (read once unless ``data`` is given)"""
+        stat = os.stat(file_path)
+        if data is None:
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+        timestamp = parse_inference_timestamp(data.get('timestamp')) if isinstance(data, dict) else None
+        record, _ = cls.objects.update_or_create(
+            processing_hash=processing_hash,
+            filename=os.path.basename(file_path),
+            defaults={
+                'timestamp': timestamp or datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+                'file_size': stat.st_size,
+                'has_config': isinstance(data, dict) and 'config' in data,
+                'has_inference': isinstance(data, dict) and 'inference' in data,
+            }
+        )
+        return record
+
+    @classmethod
+    def sync_dir(cls, processing_hash, inference_dir):
+        """
+        Reconcile the index with the directory: index results it has not seen
+        (or that changed size) and drop rows whose files are gone. Returns the
+        number of files indexed.
+        """
+        if not processing_hash:
+            return 0
+        sizes = {}
+        if os.path.isdir(inference_dir):
+            for entry in os.scandir(inference_dir):
+                if entry.name.startswith(INFERENCE_FILE_PREFIX) and entry.name.endswith('.json'):
+                    sizes[entry.name] = entry.stat().st_size
+        indexed = dict(cls.objects.filter(processing_hash=processing_hash).values_list('filename', 'file_size'))
+
+        gone = [name for name in indexed if name not in sizes]
+        for batch in batched(gone):
+            cls.objects.filter(processing_hash=processing_hash, filename__in=batch).delete()
+
+        count = 0
+        for name, size in sizes.items():
+            if indexed.get(name) == size:
+                continue
+            try:
+                cls.index_file(processing_hash, os.path.join(inference_dir, name))
+                count += 1
+            except (OSError, ValueError) as e:
+                print(f"DEBUG: Skipping inference result {name}: {e}")
+        return count
+
+    def __str__(self):
+        return f"{self.filename} ({self.processing_hash[:12]})"
+
+
+JOB_KIND_CHOICES = [('chunk', 'Chunk records'), ('preview', 'Build preview'), ('index', 'Build record index')]
+JOB_STATUS_CHOICES = [
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('succeeded', 'Succeeded'),
+    ('failed', 'Failed'),
+    ('cancelled', 'Cancelled')
+]
+JOB_ACTIVE_STATUSES = ('queued', 'running')
+
+
+class ProcessingJob(models.Model):
+    """
+    One unit of background processing for a file. Requests enqueue jobs and
+    return; `manage.py process_jobs` workers claim them with a conditional
+    UPDATE (no broker, no row locks) and report progress as they go.
+    """
+    file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name='processing_jobs')
+    kind = models.CharField(max_length=20, choices=JOB_KIND_CHOICES)
+    options = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=JOB_STATUS_CHOICES, default='queued')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    records_done = models.BigIntegerField(default=0)
+    records_total = models.BigIntegerField(null=True, blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers poll for the oldest runnable queued job
+            models.Index(fields=['status', 'run_after', 'id'], name='job_queue_idx'),
+        ]
+
+    @classmethod
+    def claim_next(cls, worker):
+        """Atomically move the next runnable job to 'running'; None when the queue is empty"""
+        now = timezone.now()
+        candidates = cls.objects.filter(status='queued', run_after__lte=now).order_by('run_after', 'id')
+        for job_id in candidates.values_list('id', flat=True)[:10]:
+            # Only one worker's UPDATE can match while the row is still queued
+            claimed = cls.objects.filter(pk=job_id, status='queued').update(
+                status='running', worker=worker, attempts=F('attempts') + 1,
+                started_at=now, heartbeat_at=now, error=''
+            )
+            if claimed:
+                return cls.objects.select_related('file').get(pk=job_id)
+        return None
+
+    @classmethod
+    def requeue_stale(cls, stale_after):
+        """Return jobs whose worker stopped heartbeating to the queue (or fail them if out of attempts)"""
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        stale = cls.objects.filter(status='running', heartbeat_at__lt=cutoff)
+        failed = stale.filter(attempts__gte=F('max_attempts')).update(
+            status='failed', error='Worker stopped responding', finished_at=timezone.now()
+        )
+        requeued = stale.update(status='queued', run_after=timezone.now(), error='Worker stopped responding')
+        return requeued + failed
+
+    def report_progress(self, records_done, records_total=None):
+        """Store progress and heartbeat; False once cancellation was requested (or the job is gone)"""
+        fields = {'records_done': records_done, 'heartbeat_at': timezone.now()}
+        if records_total is not None:
+            fields['records_total'] = records_total
+        updated = ProcessingJob.objects.filter(pk=self.pk, cancel_requested=False).update(**fields)
+        for field, value in fields.items():
+            setattr(self, field, value)
+        return bool(updated)
+
+    def finish(self, status, **fields):
+        fields.update(status=status, finished_at=timezone.now())
+        ProcessingJob.objects.filter(pk=self.pk).update(**fields)
+        for field, value in fields.items():
+            setattr(self, field, value)
+
+    def fail(self, error, retry_backoff, retry=True):
+        """Requeue with exponential backoff while attempts remain, else mark failed"""
+        if retry and self.attempts < self.max_attempts:
+            delay = retry_backoff * 2 ** (self.attempts - 1)
+            fields = {'status': 'queued', 'error': error, 'run_after': timezone.now() + timedelta(seconds=delay)}
+            ProcessingJob.objects.filter(pk=self.pk).update(**fields)
+            for field, value in fields.items():
+                setattr(self, field, value)
+        else:
+            self.finish('failed', error=error)
+
+    def request_cancel(self):
+        """Queued jobs are cancelled at once; running ones stop at their next progress report"""
+        if ProcessingJob.objects.filter(pk=self.pk, status='queued').update(
+                status='cancelled', cancel_requested=True, finished_at=timezone.now()):
+            self.refresh_from_db()
+            return True
+        cancelled = ProcessingJob.objects.filter(pk=self.pk, status='running').update(cancel_requested=True)
+        self.refresh_from_db()
+        return bool(cancelled)
+
+    @property
+    def progress(self):
+        if not self.records_total:
+            return 1.0 if self.status == 'succeeded' else None
+        return round(min(self.records_done / self.records_total, 1.0), 4)
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} for file {self.file_id} ({self.status})"
+
+
+class UserStorageStats(models.Model):
+    """Per-user rollup behind api_user_stats, recomputed with database aggregates when stale"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='storage_stats')
+    folders_created = models.IntegerField(default=0)
+    files_uploaded = models.IntegerField(default=0)
+    files_processed = models.IntegerField(default=0)
+    files_with_inference = models.IntegerField(default=0)
+    files_with_config = models.IntegerField(default=0)
+    total_chunks = models.BigIntegerField(default=0)
+    total_storage_bytes = models.BigIntegerField(default=0)
+    is_stale = models.BooleanField(default=False)
+    refreshed_at = models.DateTimeField()
+
+    @classmethod
+    def refresh_for_user(cls, user_id):
+        """Recompute the rollup with two aggregate queries"""
+        totals = UploadedFile.objects.filter(uploaded_by_id=user_id).aggregate(
+            files_uploaded=Count('id'),
+            files_processed=Count('id', filter=models.Q(has_chunks=True)),
+            files_with_inference=Count('id', filter=models.Q(has_inference=True)),
+            files_with_config=Count('id', filter=models.Q(has_config=True)),
+            total_chunks=Sum('chunk_count', filter=models.Q(has_chunks=True)),
+            total_storage_bytes=Sum('file_size')
+        )
+        totals['total_chunks'] = totals['total_chunks'] or 0
+        totals['total_storage_bytes'] = totals['total_storage_bytes'] or 0
+        totals['folders_created'] = Folder.objects.filter(created_by_id=user_id).count()
+
+        stats, _ = cls.objects.update_or_create(
+            user_id=user_id,
+            defaults=dict(totals, is_stale=False, refreshed_at=timezone.now())
+        )
+        return stats
+
+    @classmethod
+    def get_for_user(cls, user_id, fresh=False):
+        """Return the rollup, recomputing it if forced, flagged stale or older than ROLLUP_MAX_AGE"""
+        max_age = getattr(settings, 'STATS_SETTINGS', {}).get('ROLLUP_MAX_AGE', 300)
+        stats = cls.objects.filter(user_id=user_id).first()
+        if (fresh or stats is None or stats.is_stale
+                or stats.refreshed_at < timezone.now() - timedelta(seconds=max_age)):
+            stats = cls.refresh_for_user(user_id)
+        return stats
+
+    @classmethod
+    def mark_stale(cls, *user_ids):
+        user_ids = [user_id for user_id in user_ids if user_id]
+        if user_ids:
+            cls.objects.filter(user_id__in=user_ids, is_stale=False).update(is_stale=True)
+
+    def __str__(self):
+        return f"Storage stats for user {self.user_id}"
+
+class UploadSession(models.Model):
+    """Resumable upload: chunks are written in place into one part file, then renamed on finalize"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    folder = models.ForeignKey(Folder, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='upload_sessions')
+    original_name = models.CharField(max_length=255)
+    description = models.TextField(blank=True, null=True)
+    is_public = models.BooleanField(default=True)
+    process_file = models.BooleanField(default=False)
+    total_size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('active', 'Active'),
+            ('finalizing', 'Finalizing'),
+            ('completed', 'Completed'),
+            ('aborted', 'Aborted')
+        ],
+        default='active'
+    )
+    uploaded_file = models.ForeignKey(UploadedFile, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def total_chunks(self):
+        return math.ceil(self.total_size / self.chunk_size) if self.total_size else 0
+
+    def expected_chunk_size(self, chunk_number):
+        """Every chunk is chunk_size bytes except possibly the last one"""
+        return min(self.chunk_size, self.total_size - chunk_number * self.chunk_size)
+
+    def get_part_path(self):
+        """Part file lives under MEDIA_ROOT so finalize is a rename, not a copy"""
+        return os.path.join(settings.MEDIA_ROOT, 'uploads', '.sessions', f"{self.id}.part")
+
+    def __str__(self):
+        return f"{self.original_name} ({self.status})"
+
+
+class UploadSessionChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    number = models.IntegerField()
+    size = models.IntegerField()
+    checksum = models.CharField(max_length=64)
+    received_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('session', 'number')
+
+    def __str__(self):
+        return f"Chunk {self.number} of {self.session_id}"
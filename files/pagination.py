@@ -0,0 +1,101 @@
+"""
+Keyset (cursor) pagination for the listing APIs
+Pages are ordered by (field, id) and the cursor carries the last row's values,
+so every page is a single bounded indexed query no matter how deep it is.
+"""
+import base64
+import json
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def get_page_limit(request):
+    """Read ?limit= clamped to API_PAGINATION['MAX_LIMIT']"""
+    pagination = getattr(settings, 'API_PAGINATION', {})
+    default_limit = pagination.get('DEFAULT_LIMIT', 100)
+    max_limit = pagination.get('MAX_LIMIT', 1000)
+    try:
+        limit = int(request.GET.get('limit', default_limit))
+    except (TypeError, ValueError):
+        limit = default_limit
+    return max(1, min(limit, max_limit))
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(values, list) or not values:
+        raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def keyset_queryset(queryset, cursor, field=None, descending=False):
+    """
+    ``queryset`` ordered by (field, id) ascending, or by id alone when no field
+    is given, and filtered to the rows after ``cursor``. Nulls in ``field``
+    sort first. With ``descending`` the order (nulls included) is reversed.
+    """
+    after = 'lt' if descending else 'gt'
+    if field:
+        if descending:
+            queryset = queryset.order_by(F(field).desc(nulls_last=True), '-id')
+        else:
+            queryset = queryset.order_by(F(field).asc(nulls_first=True), 'id')
+    else:
+        queryset = queryset.order_by('-id' if descending else 'id')
+
+    if cursor:
+        values = decode_cursor(cursor)
+        try:
+            last_id = int(values[-1])
+        except (TypeError, ValueError):
+            raise InvalidCursor('Invalid cursor')
+        if not field:
+            queryset = queryset.filter(**{f'id__{after}': last_id})
+        elif values[0] is None:
+            # Past the last non-null row: nulls come first ascending, last descending
+            nulls_after = Q(**{f'{field}__isnull': True, f'id__{after}': last_id})
+            queryset = queryset.filter(nulls_after if descending else nulls_after | Q(**{f'{field}__isnull': False}))
+        else:
+            try:
+                last_value = parse_datetime(values[0]) if isinstance(values[0], str) else None
+            except ValueError:  # Well formed but out of range, e.g. month 13
+                last_value = None
+            if last_value is None:
+                raise InvalidCursor('Invalid cursor')
+            rest = Q(**{f'{field}__{after}': last_value}) | Q(**{field: last_value, f'id__{after}': last_id})
+            if descending:
+                rest |= Q(**{f'{field}__isnull': True})
+            queryset = queryset.filter(rest)
+    return queryset
+
+
+def paginate_keyset(queryset, cursor, limit, field=None, descending=False):
+    """
+    Return (rows, next_cursor) for one page in keyset_queryset() order:
+    (field, id) ascending, or newest first with ``descending``.
+    """
+    queryset = keyset_queryset(queryset, cursor, field=field, descending=descending)
+    rows = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if field:
+            value = getattr(last, field)
+            next_cursor = encode_cursor([value.isoformat() if value else None, last.id])
+        else:
+            next_cursor = encode_cursor([last.id])
+    return rows, next_cursor
@@ -0,0 +1,174 @@
+"""
+Dataset processing: chunk an uploaded file into its processing directory,
+store inference results next to it, and record the outcome on every row
+sharing that directory.
+"""
+import logging
+import os
+import shutil
+import tempfile
+from django.conf import settings
+from django.utils import timezone
+from .chunking import (
+    UnsupportedFileType, build_manifest, build_preview, chunk_file, format_dir, load_manifest, load_preview,
+    publish_chunk_set, write_json_atomic, write_preview
+)
+from .models import INFERENCE_FILE_PREFIX, InferenceRecord
+from .record_index import build_record_index, remove_record_index
+
+logger = logging.getLogger(__name__)
+
+CHUNKABLE_TYPES = ('csv', 'json', 'parquet')
+
+
+def get_chunking_settings():
+    """PROCESSING_SETTINGS with defaults for the chunker"""
+    chunking_settings = {
+        'CHUNK_SIZE': 1000,
+        'CHUNK_WORKERS': None,  # None = one per CPU
+        'CHUNK_COMPRESSION_LEVEL': 6,
+        'CHUNK_FRAME_RECORDS': 100,
+        'RECORDS_MAX_LIMIT': 10000,
+        'PREVIEW_RECORDS': 10,
+        'PARALLEL_MIN_BYTES': 8 * 1024 * 1024,
+        'RECORD_INDEX_AUTO': False,
+        'RECORD_INDEX_FIELDS': None,  # None = every field
+        'RECORD_INDEX_MAX_VALUE_LENGTH': 256,
+    }
+    chunking_settings.update(getattr(settings, 'PROCESSING_SETTINGS', {}))
+    return chunking_settings
+
+
+class ProcessingCancelled(Exception):
+    """Raised from a progress callback to stop processing; earlier results stay in place"""
+
+
+class ChunksNotReady(Exception):
+    """The file has no current chunks to index yet (chunking may still be running)"""
+
+
+def chunk_uploaded_file(file_obj, chunk_format=None, progress=None):
+    """
+    Stream ``file_obj`` into CHUNK_SIZE-record chunks in ``chunk_format``
+    (default: the file's or its folder's; <n>.json.gz, or <n>.arrow for the
+    columnar format, under its own format directory). The new set is
+    written to a staging directory and published with the manifest in one
+    rename (see chunking.publish_chunk_set), so readers never mix two sets.
+    ``progress`` is passed to chunk_file(). Returns the chunker's stats
+    (without the per-chunk list).
+    """
+    file_type = file_obj.extension
+    if file_type not in CHUNKABLE_TYPES:
+        raise UnsupportedFileType(f'Cannot chunk .{file_type} files')
+
+    chunk_format = chunk_format or file_obj.get_chunk_format()
+    chunking_settings = get_chunking_settings()
+    source_path = file_obj.file.path
+    workers = chunking_settings['CHUNK_WORKERS']
+    if os.path.getsize(source_path) < chunking_settings['PARALLEL_MIN_BYTES']:
+        # Spawning a pool costs more than compressing a small file
+        workers = 1
+
+    chunks_dir = format_dir(file_obj.get_processing_dir(), chunk_format)
+    os.makedirs(chunks_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix='.chunks-', dir=chunks_dir)
+    file_obj.set_processing_state(chunk_format=chunk_format, processing_status='processing')
+    try:
+        result = chunk_file(
+            source_path, file_type, staging_dir,
+            chunk_size=chunking_settings['CHUNK_SIZE'],
+            workers=workers,
+            compress_level=chunking_settings['CHUNK_COMPRESSION_LEVEL'],
+            frame_records=chunking_settings['CHUNK_FRAME_RECORDS'],
+            chunk_format=chunk_format,
+            progress=progress
+        )
+        publish_chunk_set(chunks_dir, staging_dir, build_manifest(result, source_name=file_obj.display_name))
+        # The record index pointed into the old chunks
+        remove_record_index(chunks_dir)
+    except ProcessingCancelled:
+        # Nothing was replaced yet: the previous chunks (if any) are still valid
+        previous = load_manifest(file_obj.get_chunks_dir(chunk_format))
+        has_chunks = previous is not None and previous.chunk_format == chunk_format
+        file_obj.set_processing_state(chunk_format=chunk_format,
+                                      processing_status='processed' if has_chunks else 'raw')
+        raise
+    except Exception:
+        file_obj.set_processing_state(chunk_format=chunk_format, processing_status='error')
+        raise
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    file_obj.set_processing_state(chunk_format=chunk_format, chunk_count=result['chunk_count'], has_record_index=False)
+    ensure_preview(file_obj, refresh=True)
+    logger.info("Chunked file %s: %s records in %s chunks, %s MB/s (%s MB/s per core)", file_obj.id,
+                result['record_count'], result['chunk_count'], result['mb_per_second'],
+                result['mb_per_second_per_core'])
+    return {key: value for key, value in result.items() if key != 'chunks'}
+
+
+def index_file_records(file_obj, chunk_format=None, progress=None):
+    """
+    Build the inverted index over the current ``chunk_format`` chunks (default:
+    the file's format; see record_index.py). ``progress`` is called with
+    records done; returns the index stats.
+    """
+    if file_obj.extension not in CHUNKABLE_TYPES:
+        raise UnsupportedFileType(f'Cannot index .{file_obj.extension} files')
+    chunk_format = chunk_format or file_obj.get_chunk_format()
+    chunks_dir = file_obj.get_chunks_dir(chunk_format)
+    manifest = load_manifest(chunks_dir)
+    if manifest is None or manifest.chunk_format != chunk_format:
+        raise ChunksNotReady(f'File {file_obj.id} has no current {chunk_format} chunks to index')
+    chunking_settings = get_chunking_settings()
+    stats = build_record_index(
+        chunks_dir, manifest,
+        fields=chunking_settings['RECORD_INDEX_FIELDS'],
+        max_value_length=chunking_settings['RECORD_INDEX_MAX_VALUE_LENGTH'],
+        progress=progress
+    )
+    file_obj.set_processing_state(chunk_format=chunk_format, has_record_index=True)
+    logger.info("Indexed file %s: %s postings over %s records, %s bytes", file_obj.id, stats['posting_count'],
+                stats['record_count'], stats['index_bytes'])
+    return stats
+
+
+def ensure_preview(file_obj, refresh=False):
+    """
+    Load the preview sidecar (<processing_hash>/preview.json), generating it on
+    first use. Returns None for types without a record preview or on failure.
+    """
+    if file_obj.extension not in CHUNKABLE_TYPES or not file_obj.file:
+        return None
+    processing_dir = file_obj.get_processing_dir()
+    if not refresh:
+        preview = load_preview(processing_dir)
+        if preview is not None:
+            return preview
+    try:
+        preview = build_preview(file_obj.file.path, file_obj.extension,
+                                get_chunking_settings()['PREVIEW_RECORDS'])
+        os.makedirs(processing_dir, exist_ok=True)
+        write_preview(processing_dir, preview)
+    except (OSError, ValueError) as e:
+        logger.warning("Preview for file %s not generated: %s", file_obj.id, e)
+        return None
+    return preview
+
+
+def save_inference_result(file_obj, result):
+    """
+    Store one inference result as inference/conf_and_inf_<timestamp>.json,
+    make it the current inference.json, and index it. Returns the InferenceRecord.
+    """
+    inference_dir = os.path.join(file_obj.get_processing_dir(), 'inference')
+    os.makedirs(inference_dir, exist_ok=True)
+    now = timezone.now()
+    result.setdefault('timestamp', now.isoformat())
+    filename = f"{INFERENCE_FILE_PREFIX}{now.strftime('%Y%m%dT%H%M%S%f')}.json"
+    result_path = os.path.join(inference_dir, filename)
+    write_json_atomic(result_path, result)
+    write_json_atomic(os.path.join(inference_dir, 'inference.json'), result)
+    record = InferenceRecord.index_file(file_obj.processing_hash, result_path, data=result)
+    file_obj.set_processing_state(has_inference=True)
+    return record
@@ -0,0 +1,211 @@
+"""
+Per-file inverted index over processed records
+An optional SQLite database next to the chunks (<processing_hash>/records.idx.sqlite3)
+maps every (field, value) pair to the chunk numbers and in-chunk offsets of
+the records holding it. Values are normalized (str(), stripped, lowercased,
+truncated), so lookups are exact or prefix matches on that form. The index
+records the manifest it was built from; a re-chunked file invalidates it.
+
+Like chunking.py this module has no Django imports.
+"""
+import hashlib
+import heapq
+import json
+import os
+import sqlite3
+import tempfile
+from .chunking import iter_record_range, read_chunk_records
+
+RECORD_INDEX_NAME = 'records.idx.sqlite3'
+RECORD_INDEX_VERSION = 1
+INSERT_BATCH_SIZE = 50000
+
+
+def record_index_path(processing_dir):
+    return os.path.join(processing_dir, RECORD_INDEX_NAME)
+
+
+def normalize_value(value, max_length=256):
+    """Index form of a field value, or None for values that are not indexed (null, empty)"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        value = 'true' if value else 'false'
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value, sort_keys=True, default=str)
+    value = str(value).strip().lower()
+    return value[:max_length] or None
+
+
+def manifest_key(manifest):
+    """Identifies the chunk set an index was built from"""
+    return hashlib.sha256(json.dumps([manifest.chunk_format, manifest.data['chunks']]).encode()).hexdigest()
+
+
+def build_record_index(processing_dir, manifest, fields=None, max_value_length=256, progress=None):
+    """
+    Index the chunks described by ``manifest`` (all fields, or only ``fields``).
+    Postings are collected unsorted, then copied into the clustered table in key
+    order, and the finished database replaces the old one atomically.
+    ``progress(records_done)`` is called after every chunk. Returns stats.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix='.sqlite3', dir=processing_dir)
+    os.close(fd)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            PRAGMA temp_store = FILE;
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE postings (
+                field INTEGER NOT NULL, value TEXT NOT NULL, chunk INTEGER NOT NULL, "offset" INTEGER NOT NULL,
+                PRIMARY KEY (field, value, chunk, "offset")
+            ) WITHOUT ROWID;
+            CREATE TEMP TABLE unsorted (field INTEGER, value TEXT, chunk INTEGER, "offset" INTEGER);
+        """)
+        wanted = set(fields) if fields else None
+        # Postings store a field's position in this list (meta 'fields') instead of its name
+        field_ids = {}
+        records_done = 0
+        for number in range(1, manifest.chunk_count + 1):
+            chunk = manifest.chunk(number)
+            rows = []
+            offset = 0
+            for records in iter_record_range(processing_dir, manifest, chunk['first_record'],
+                                             chunk['first_record'] + chunk['records']):
+                for record in records:
+                    if isinstance(record, dict):
+                        for field, value in record.items():
+                            if wanted is not None and field not in wanted:
+                                continue
+                            value = normalize_value(value, max_value_length)
+                            if value is not None:
+                                field_id = field_ids.setdefault(field, len(field_ids))
+                                rows.append((field_id, value, number, offset))
+                    offset += 1
+                if len(rows) >= INSERT_BATCH_SIZE:
+                    connection.executemany("INSERT INTO unsorted VALUES (?, ?, ?, ?)", rows)
+                    rows = []
+            connection.executemany("INSERT INTO unsorted VALUES (?, ?, ?, ?)", rows)
+            records_done += offset
+            if progress is not None:
+                progress(records_done)
+
+        connection.execute('INSERT INTO postings SELECT * FROM unsorted ORDER BY field, value, chunk, "offset"')
+        posting_count = connection.execute("SELECT COUNT(*) FROM unsorted").fetchone()[0]
+        connection.execute("DROP TABLE unsorted")
+        connection.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ('version', str(RECORD_INDEX_VERSION)),
+            ('manifest_key', manifest_key(manifest)),
+            ('record_count', str(records_done)),
+            ('fields', json.dumps(list(field_ids))),
+        ])
+        connection.commit()
+        connection.close()
+        os.replace(tmp_path, record_index_path(processing_dir))
+    except BaseException:
+        connection.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return {
+        'record_count': records_done,
+        'posting_count': posting_count,
+        'fields': list(field_ids),
+        'index_bytes': os.path.getsize(record_index_path(processing_dir))
+    }
+
+
+def remove_record_index(processing_dir):
+    """Delete a file's index; returns whether one existed"""
+    try:
+        os.remove(record_index_path(processing_dir))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+class RecordIndex:
+    """Read-only view of one file's index; use as a context manager"""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        self.meta = dict(self.connection.execute("SELECT key, value FROM meta"))
+        self.fields = json.loads(self.meta.get('fields', '[]'))
+
+    @classmethod
+    def open(cls, processing_dir):
+        """The index of a processing directory, or None if it has none (or an unreadable one)"""
+        path = record_index_path(processing_dir)
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except sqlite3.Error:
+            return None
+
+    def matches(self, manifest):
+        """True when the index describes the chunks of ``manifest``"""
+        return (manifest is not None and self.meta.get('version') == str(RECORD_INDEX_VERSION)
+                and self.meta.get('manifest_key') == manifest_key(manifest))
+
+    def lookup(self, value, field=None, prefix=False, after=None, limit=None, max_value_length=256):
+        """
+        (chunk, offset) of records whose ``field`` (any field when None) equals,
+        or with ``prefix`` starts with, ``value``; ascending and after ``after``.
+        Every field is one range scan of the clustered (field, value) key.
+        """
+        value = normalize_value(value, max_value_length)
+        if value is None:
+            return []
+        if field is not None and field not in self.fields:
+            return []
+        field_ids = [self.fields.index(field)] if field else range(len(self.fields))
+        condition = 'value >= ? AND value < ?' if prefix else 'value = ?'
+        value_params = [value, value + '\U0010ffff'] if prefix else [value]
+        after_condition = ''
+        after_params = []
+        if after is not None:
+            after_condition = ' AND (chunk > ? OR (chunk = ? AND "offset" > ?))'
+            after_params = [after[0], after[0], after[1]]
+        # A record holds one value per field, so positions are unique within a field
+        sql = (f'SELECT chunk, "offset" FROM postings WHERE field = ? AND {condition}{after_condition} '
+               f'ORDER BY chunk, "offset"')
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        streams = [self.connection.execute(sql, [field_id] + value_params + after_params) for field_id in field_ids]
+        positions = []
+        for position in heapq.merge(*streams):
+            if not positions or positions[-1] != position:
+                positions.append(position)
+                if limit is not None and len(positions) >= limit:
+                    break
+        return positions
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def find_records(processing_dir, manifest, index, value, field=None, prefix=False, after=None, limit=None,
+                 max_value_length=256):
+    """
+    [(chunk, offset, record)] matching a lookup, reading only the chunks (and
+    within them only the frames) that hold a hit.
+    """
+    positions = index.lookup(value, field=field, prefix=prefix, after=after, limit=limit,
+                             max_value_length=max_value_length)
+    by_chunk = {}
+    for number, offset in positions:
+        by_chunk.setdefault(number, []).append(offset)
+    records = {}
+    for number, offsets in by_chunk.items():
+        for offset, record in read_chunk_records(processing_dir, manifest, number, offsets).items():
+            records[number, offset] = record
+    return [(number, offset, records[number, offset]) for number, offset in positions if (number, offset) in records]
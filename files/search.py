@@ -0,0 +1,262 @@
+"""
+Metadata search over files and folders
+An SQLite FTS5 table (files_search_index, created by migration 0019) holds one
+row per file and per folder: name, description, folder path and type. Rows are
+kept in sync by the model signals (single saves) and by explicit calls from
+the bulk paths (bulk_create, queryset update/delete). Other databases, or an
+SQLite without FTS5, fall back to icontains queries.
+"""
+import re
+from django.db import connection
+from django.db.models import Q
+# Module import: models.py imports this module for its bulk paths
+from . import models
+
+SEARCH_TABLE = 'files_search_index'
+# bm25 column weights: name, description, folder_path, file_type
+RANK_WEIGHTS = (10.0, 2.0, 4.0, 1.0)
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_available = None
+
+
+def search_available():
+    """True when the FTS5 index table exists (checked once per process, again after migrate)"""
+    global _available
+    if _available is None:
+        _available = connection.vendor == 'sqlite' and SEARCH_TABLE in connection.introspection.table_names()
+    return _available
+
+
+def reset_search_available():
+    global _available
+    _available = None
+
+
+def file_rowid(file_id):
+    return file_id * 2
+
+
+def folder_rowid(folder_id):
+    return folder_id * 2 + 1
+
+
+def get_folder_paths(folders):
+    """{folder_id: 'root/sub/name'} for ``folders``, with one query for all ancestors"""
+    ancestor_ids = set()
+    for folder in folders:
+        ancestor_ids.update(folder.get_ancestor_ids())
+    names = {folder.id: folder.name for folder in folders}
+    missing = ancestor_ids - set(names)
+    for batch in models.batched(missing):
+        names.update(models.Folder.objects.filter(id__in=batch).values_list('id', 'name'))
+    return {
+        folder.id: '/'.join(names.get(ancestor_id, '') for ancestor_id in folder.get_ancestor_ids() + [folder.id])
+        for folder in folders
+    }
+
+
+def delete_rows(rowids):
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        for batch in models.batched(rowids):
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(batch))})", batch
+            )
+
+
+def insert_rows(rows):
+    """(rowid, kind, object_id, folder_id, name, description, folder_path, file_type) tuples, replacing old ones"""
+    if not search_available() or not rows:
+        return
+    delete_rows([row[0] for row in rows])
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, folder_id, name, description, folder_path, "
+            f"file_type) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            rows
+        )
+
+
+def index_files(file_ids):
+    """(Re)index files by id; ids that no longer exist are dropped from the index"""
+    if not search_available():
+        return
+    file_ids = list(file_ids)
+    for batch in models.batched(file_ids):
+        files = list(models.UploadedFile.objects.filter(id__in=batch).select_related('folder').only(
+            'id', 'original_name', 'description', 'file', 'folder__id', 'folder__name', 'folder__path'
+        ))
+        folder_paths = get_folder_paths({file_obj.folder for file_obj in files if file_obj.folder_id})
+        delete_rows([file_rowid(file_id) for file_id in set(batch) - {file_obj.id for file_obj in files}])
+        insert_rows([
+            (file_rowid(file_obj.id), 'file', file_obj.id, file_obj.folder_id, file_obj.display_name,
+             file_obj.description or '', folder_paths.get(file_obj.folder_id, ''), file_obj.extension)
+            for file_obj in files
+        ])
+
+
+def index_folders(folder_ids):
+    if not search_available():
+        return
+    for batch in models.batched(folder_ids):
+        folders = list(models.Folder.objects.filter(id__in=batch).only(
+            'id', 'name', 'description', 'parent_id', 'allowed_type', 'path'
+        ))
+        folder_paths = get_folder_paths(folders)
+        delete_rows([folder_rowid(folder_id) for folder_id in set(batch) - {folder.id for folder in folders}])
+        insert_rows([
+            (folder_rowid(folder.id), 'folder', folder.id, folder.parent_id, folder.name, folder.description or '',
+             folder_paths[folder.id], folder.allowed_type)
+            for folder in folders
+        ])
+
+
+def index_subtree(folder):
+    """Reindex a folder, its descendants and their files (after a rename or move changes their paths)"""
+    if not search_available():
+        return
+    index_folders(folder.get_descendants(include_self=True).values_list('id', flat=True))
+    index_files(folder.get_subtree_files().values_list('id', flat=True))
+
+
+def index_folder_change(folder):
+    """
+    Reindex a saved folder. Only a rename or move changes the paths below it,
+    so the subtree is reindexed only when the indexed name or parent differs.
+    """
+    if not search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT name, folder_id FROM {SEARCH_TABLE} WHERE rowid = %s", [folder_rowid(folder.pk)])
+        indexed = cursor.fetchone()
+    if indexed is not None and tuple(indexed) != (folder.name, folder.parent_id):
+        index_subtree(folder)
+    else:
+        index_folders([folder.pk])
+
+
+def unindex_files(file_ids):
+    delete_rows([file_rowid(file_id) for file_id in file_ids])
+
+
+def unindex_folders(folder_ids):
+    delete_rows([folder_rowid(folder_id) for folder_id in folder_ids])
+
+
+CREATE_TABLE_SQL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        name, description, folder_path, file_type,
+        kind UNINDEXED, object_id UNINDEXED, folder_id UNINDEXED,
+        tokenize = "unicode61 remove_diacritics 2", prefix = '2 3'
+    )
+"""
+
+
+def rebuild_index():
+    """Repopulate the whole index with two INSERT ... SELECT statements; returns the row count"""
+    if not search_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(REBUILD_FOLDERS_SQL)
+        cursor.execute(REBUILD_FILES_SQL)
+        cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE}")
+        return cursor.fetchone()[0]
+
+
+FOLDER_PATHS_CTE = """
+    WITH RECURSIVE folder_paths(id, name_path) AS (
+        SELECT id, name FROM files_folder WHERE parent_id IS NULL
+        UNION ALL
+        SELECT f.id, fp.name_path || '/' || f.name FROM files_folder f JOIN folder_paths fp ON f.parent_id = fp.id
+    )
+"""
+
+REBUILD_FOLDERS_SQL = FOLDER_PATHS_CTE + f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, folder_id, name, description, folder_path, file_type)
+    SELECT f.id * 2 + 1, 'folder', f.id, f.parent_id, f.name, COALESCE(f.description, ''), fp.name_path,
+           f.allowed_type
+    FROM files_folder f JOIN folder_paths fp ON fp.id = f.id
+"""
+
+# Display name: the original name's base name (blob storage names are digests)
+REBUILD_FILES_SQL = FOLDER_PATHS_CTE + f"""
+    , names(id, folder_id, description, name) AS (
+        SELECT id, folder_id, description,
+               REPLACE(COALESCE(NULLIF(original_name, ''), file), RTRIM(COALESCE(NULLIF(original_name, ''), file),
+                       REPLACE(COALESCE(NULLIF(original_name, ''), file), '/', '')), '')
+        FROM files_uploadedfile
+    )
+    INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, folder_id, name, description, folder_path, file_type)
+    SELECT n.id * 2, 'file', n.id, n.folder_id, n.name, COALESCE(n.description, ''), COALESCE(fp.name_path, ''),
+           CASE WHEN INSTR(n.name, '.') > 0
+                THEN LOWER(REPLACE(n.name, RTRIM(n.name, REPLACE(n.name, '.', '')), ''))
+                ELSE '' END
+    FROM names n LEFT JOIN folder_paths fp ON fp.id = n.folder_id
+"""
+
+
+def build_match_query(query):
+    """Each word becomes a quoted prefix term; all must match (FTS5 implicit AND)"""
+    tokens = TOKEN_RE.findall(query)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search(query, kind=None, limit=20, offset=0):
+    """
+    Ranked matches for ``query`` (prefix match on every word): a list of
+    {'type', 'id', 'name', 'folder_id', 'path', 'file_type', 'score'}.
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+    if not search_available():
+        return fallback_search(query, kind, limit, offset)
+    sql = (f"SELECT kind, object_id, folder_id, name, folder_path, file_type, bm25({SEARCH_TABLE}, "
+           f"{', '.join(str(weight) for weight in RANK_WEIGHTS)}) AS score "
+           f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s")
+    params = [match]
+    if kind:
+        sql += " AND kind = %s"
+        params.append(kind)
+    sql += " ORDER BY score LIMIT %s OFFSET %s"
+    params += [limit, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return [
+        {'type': row_kind, 'id': object_id, 'name': name, 'folder_id': folder_id, 'path': folder_path,
+         'file_type': file_type, 'score': round(-score, 4)}
+        for row_kind, object_id, folder_id, name, folder_path, file_type, score in rows
+    ]
+
+
+def fallback_search(query, kind=None, limit=20, offset=0):
+    """Unranked icontains search when the FTS index is unavailable"""
+    tokens = TOKEN_RE.findall(query)
+    results = []
+    if kind in (None, 'folder'):
+        folders = models.Folder.objects.all()
+        for token in tokens:
+            folders = folders.filter(Q(name__icontains=token) | Q(description__icontains=token))
+        folders = list(folders.order_by('id')[:offset + limit])
+        folder_paths = get_folder_paths(folders)
+        results += [
+            {'type': 'folder', 'id': folder.id, 'name': folder.name, 'folder_id': folder.parent_id,
+             'path': folder_paths[folder.id], 'file_type': folder.allowed_type, 'score': None}
+            for folder in folders
+        ]
+    if kind in (None, 'file'):
+        files = models.UploadedFile.objects.select_related('folder')
+        for token in tokens:
+            files = files.filter(Q(original_name__icontains=token) | Q(description__icontains=token))
+        files = list(files.order_by('id')[:offset + limit])
+        folder_paths = get_folder_paths({file_obj.folder for file_obj in files if file_obj.folder_id})
+        results += [
+            {'type': 'file', 'id': file_obj.id, 'name': file_obj.display_name, 'folder_id': file_obj.folder_id,
+             'path': folder_paths.get(file_obj.folder_id, ''), 'file_type': file_obj.extension, 'score': None}
+            for file_obj in files
+        ]
+    return results[offset:offset + limit]
@@ -0,0 +1,39 @@
+"""
+Keep the metadata search index and the folder response cache in step with
+single-row saves and deletes. Bulk paths (bulk_create, queryset update/delete)
+bypass these and call files.search and files.cache directly.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from .models import Folder, UploadedFile
+from . import cache, search
+
+
+@receiver(post_save, sender=UploadedFile)
+def index_saved_file(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_files([instance.pk])
+        cache.invalidate_file_folders([instance.folder_id])
+
+
+@receiver(post_save, sender=Folder)
+def index_saved_folder(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # Folder.save() fills in the materialized path after this signal, inside its transaction
+        transaction.on_commit(lambda: search.index_folder_change(instance))
+        # ...so the path still names the parent before a move
+        old_parent_ids = instance.get_ancestor_ids()[-1:]
+        cache.invalidate_folders([instance.pk, instance.parent_id, *old_parent_ids], folders=True)
+
+
+@receiver(post_delete, sender=Folder)
+def uncache_deleted_folder(sender, instance, **kwargs):
+    # Also sent for every subfolder the delete cascades to; their files went first (Folder.delete)
+    cache.invalidate_folders([instance.pk, instance.parent_id], folders=True)
+
+
+@receiver(post_migrate)
+def recheck_search_index(sender, **kwargs):
+    # The index table may have just been created (or dropped)
+    search.reset_search_available()
@@ -65,7 +65,133 @@ function handleFolderDrop(e, folderId) {
     method: 'POST',
     headers: { 'X-CSRFToken': getCSRFToken() },
     body: formData
-  }).then(() => location.reload());
+  })
+    .then(resp => resp.json())
+    .then(data => {
+      const rejected = data.rejected || [];
+      if (rejected.length) {
+        alert('Not uploaded:\n' + rejected.map(r => r.name + ': ' + r.reason).join('\n'));
+      }
+    })
+    .finally(() => location.reload());
+}
+
+// Lazy folder tree: load a folder's subfolders the first time it is expanded
+function toggleFolderChildren(toggle) {
+  const folderId = toggle.getAttribute('data-folder-id');
+  const item = toggle.closest('.folder-list-item');
+  let children = item.nextElementSibling;
+  if (children && children.matches('.folder-children[data-parent-id="' + folderId + '"]')) {
+    const isOpen = children.style.display !== 'none';
+    children.style.display = isOpen ? 'none' : 'flex';
+    toggle.textContent = isOpen ? '▶' : '▼';
+    return;
+  }
+  children = document.createElement('div');
+  children.className = 'folder-children';
+  children.setAttribute('data-parent-id', folderId);
+  item.insertAdjacentElement('afterend', children);
+  toggle.textContent = '▼';
+  fetch(`/folder-children/${folderId}/?files=0`)
+    .then(resp => resp.json())
+    .then(data => {
+      children.innerHTML = (data.subfolders || []).map(sub =>
+        `<div class="folder-list-item" data-folder-id="${sub.id}">` +
+        (sub.has_children ? `<span class="folder-toggle" data-folder-id="${sub.id}">▶</span>` : '') +
+        `${escapeHtml(sub.name)}</div>`
+      ).join('');
+    })
+    .catch(() => {
+      children.innerHTML = '<div style="color:#888;">Could not load subfolders.</div>';
+    });
+}
+
+// Virtualized file list: rows are fetched page by page and only the visible slice is rendered
+const FILE_ROW_HEIGHT = 44;
+const FILE_ROW_OVERSCAN = 10;
+const fileListStates = {};
+
+function escapeHtml(value) {
+  return String(value).replace(/[&<>"']/g, c => ({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c]));
+}
+
+function initFileList(viewport) {
+  const folderId = viewport.getAttribute('data-folder-id');
+  const state = {
+    folderId: folderId,
+    url: viewport.getAttribute('data-children-url'),
+    viewport: viewport,
+    files: [],
+    selected: new Set(),
+    nextCursor: null,
+    hasMore: true,
+    loading: false
+  };
+  fileListStates[folderId] = state;
+  viewport.addEventListener('scroll', function() {
+    renderFileRows(state);
+    maybeLoadMoreFiles(state);
+  });
+  viewport.addEventListener('change', function(e) {
+    if (!e.target.matches('.file-checkbox')) return;
+    const fileId = e.target.getAttribute('data-file-id');
+    if (e.target.checked) state.selected.add(fileId);
+    else state.selected.delete(fileId);
+  });
+  loadMoreFiles(state);
+}
+
+function loadMoreFiles(state) {
+  if (state.loading || !state.hasMore) return;
+  state.loading = true;
+  const url = state.url + (state.nextCursor ? `?cursor=${encodeURIComponent(state.nextCursor)}` : '');
+  fetch(url)
+    .then(resp => resp.json())
+    .then(data => {
+      state.files.push(...data.files);
+      state.nextCursor = data.next_cursor;
+      state.hasMore = data.has_more;
+      state.loading = false;
+      const empty = document.querySelector('.file-list-empty[data-folder-id="' + state.folderId + '"]');
+      if (empty) empty.style.display = state.files.length ? 'none' : 'block';
+      state.viewport.style.display = state.files.length ? 'block' : 'none';
+      renderFileRows(state);
+      maybeLoadMoreFiles(state);
+    })
+    .catch(() => { state.loading = false; });
+}
+
+function maybeLoadMoreFiles(state) {
+  const viewport = state.viewport;
+  const loadedHeight = state.files.length * FILE_ROW_HEIGHT;
+  if (viewport.scrollTop + viewport.clientHeight >= loadedHeight - FILE_ROW_HEIGHT * FILE_ROW_OVERSCAN) {
+    loadMoreFiles(state);
+  }
+}
+
+function fileRowHtml(state, file, index) {
+  const checked = state.selected.has(String(file.id)) ? 'checked' : '';
+  return `<div class="file-row" draggable="true" data-file-id="${file.id}" ondragstart="onDragStart(event)" style="top:${index * FILE_ROW_HEIGHT}px;">
+    <input type="checkbox" class="file-checkbox" data-file-id="${file.id}" data-folder-id="${state.folderId}" ${checked}>
+    <span style="flex:1; overflow-wrap: anywhere; font-size:0.97em;">${escapeHtml(file.name)}
+      ${file.config_added ? '<span style="color:red;font-weight:bold;">CONFIG ADDED!</span>' : ''}
+    </span>
+    <span style="display: flex; flex-direction: row; gap: 0.7em; align-items: center; min-width: 180px;">
+      <a href="${file.download_url}" style="font-size:0.97em;">Download</a>
+      <button data-delete-file="${file.id}" class="btn btn-danger btn-sm" style="font-size:0.97em; padding:0.2em 0.7em;">Delete</button>
+      <button data-copy-file="${file.id}" class="btn btn-secondary btn-sm" style="font-size:0.97em; padding:0.2em 0.7em;">Copy</button>
+      <button data-move-file="${file.id}" class="btn btn-secondary btn-sm" style="font-size:0.97em; padding:0.2em 0.7em;">Move</button>
+    </span>
+  </div>`;
+}
+
+function renderFileRows(state) {
+  const viewport = state.viewport;
+  const spacer = viewport.querySelector('.file-list-spacer');
+  spacer.style.height = `${state.files.length * FILE_ROW_HEIGHT}px`;
+  const first = Math.max(0, Math.floor(viewport.scrollTop / FILE_ROW_HEIGHT) - FILE_ROW_OVERSCAN);
+  const last = Math.min(state.files.length, Math.ceil((viewport.scrollTop + viewport.clientHeight) / FILE_ROW_HEIGHT) + FILE_ROW_OVERSCAN);
+  spacer.innerHTML = state.files.slice(first, last).map((file, i) => fileRowHtml(state, file, first + i)).join('');
 }
 
 // Wait for DOM to be ready before attaching event listeners
@@ -135,9 +261,16 @@ window.addEventListener('DOMContentLoaded', function() {
     // Select All checkbox
     if (e.target.matches('.select-all-files')) {
       const folderId = e.target.getAttribute('data-folder-id');
-      const checkboxes = document.querySelectorAll('.file-checkbox[data-folder-id="' + folderId + '"]');
-      for (const cb of checkboxes) {
-        cb.checked = e.target.checked;
+      const state = fileListStates[folderId];
+      if (state) {
+        // Virtualized list: selection lives in state, covering every loaded row
+        state.selected = e.target.checked ? new Set(state.files.map(f => String(f.id))) : new Set();
+        renderFileRows(state);
+      } else {
+        const checkboxes = document.querySelectorAll('.file-checkbox[data-folder-id="' + folderId + '"]');
+        for (const cb of checkboxes) {
+          cb.checked = e.target.checked;
+        }
       }
     }
     // Delete selected files in a folder
@@ -168,6 +301,11 @@ window.addEventListener('DOMContentLoaded', function() {
   const folderDetailPanel = document.getElementById('folder-detail-panel');
   if (folderListPanel && folderDetailPanel) {
     folderListPanel.addEventListener('click', function(e) {
+      const toggle = e.target.closest('.folder-toggle');
+      if (toggle) {
+        toggleFolderChildren(toggle);
+        return;
+      }
       const item = e.target.closest('.folder-list-item');
       if (!item) return;
       // Highlight selected
@@ -184,6 +322,10 @@ window.addEventListener('DOMContentLoaded', function() {
           if (newDropzone) {
             attachDropzoneListeners(newDropzone);
           }
+          const viewport = folderDetailPanel.querySelector('.file-list-viewport');
+          if (viewport) {
+            initFileList(viewport);
+          }
         })
         .catch(() => {
           folderDetailPanel.innerHTML = '<div style="color:#888;">Could not load folder details.</div>';
@@ -318,6 +460,9 @@ function deleteFile(fileId) {
 
 // Utility: Get all selected file IDs (optionally for a specific folder)
 function getSelectedFileIds(folderId = null) {
+  if (folderId && fileListStates[folderId]) {
+    return Array.from(fileListStates[folderId].selected);
+  }
   const selector = folderId ? `.file-checkbox[data-folder-id="${folderId}"]` : '.file-checkbox';
   return Array.from(document.querySelectorAll(selector))
     .filter(cb => cb.checked)
@@ -0,0 +1,108 @@
+"""
+Incremental JSON / NDJSON responses for large listings
+Rows are pulled from a queryset .iterator() (a server-side cursor where the
+database has one) and encoded as they arrive, so the first bytes go out before
+the query has finished and memory stays bounded by one fetch batch plus one
+output buffer, whatever the number of rows. orjson is used for encoding when
+installed.
+"""
+import json
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+try:
+    import orjson
+except ImportError:  # The standard library encoder is the fallback
+    orjson = None
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+
+def get_streaming_settings():
+    streaming_settings = {
+        'FETCH_SIZE': 2000,  # Rows per database fetch
+        'BUFFER_BYTES': 64 * 1024,  # Encoded rows are sent in blocks of about this size
+    }
+    streaming_settings.update(getattr(settings, 'STREAMING_SETTINGS', {}))
+    return streaming_settings
+
+
+def encode_json(value):
+    """Compact UTF-8 JSON bytes; values the encoder does not know are sent as str()"""
+    if orjson is not None:
+        return orjson.dumps(value, default=str)
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=str).encode()
+
+
+def get_stream_format(request):
+    """'ndjson' for ?format=ndjson, 'json' for ?stream=1, else None (a regular paginated response)"""
+    if request.GET.get('format') == 'ndjson':
+        return 'ndjson'
+    if request.GET.get('stream') in ('1', 'true'):
+        return 'json'
+    return None
+
+
+def iter_queryset(queryset):
+    return queryset.iterator(chunk_size=get_streaming_settings()['FETCH_SIZE'])
+
+
+class StreamedList:
+    """A JSON array member emitted item by item; ``count`` is final once it has been streamed"""
+
+    def __init__(self, items):
+        self.items = items
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.items:
+            self.count += 1
+            yield item
+
+
+def iter_buffered(encoded_items, separator=b''):
+    """
+    Join encoded items with ``separator`` into blocks of about BUFFER_BYTES;
+    the first item goes out on its own so the client sees data at once
+    """
+    buffer_bytes = get_streaming_settings()['BUFFER_BYTES']
+    buffer = bytearray()
+    first = True
+    for encoded in encoded_items:
+        if not first:
+            buffer += separator
+        buffer += encoded
+        if first or len(buffer) >= buffer_bytes:
+            yield bytes(buffer)
+            buffer.clear()
+        first = False
+    if buffer:
+        yield bytes(buffer)
+
+
+def iter_json_object(members):
+    """
+    Encode an object from (key, value) pairs. StreamedList values are emitted
+    incrementally; callables are called when their member is reached, so a
+    count can follow the list it counts.
+    """
+    yield b'{'
+    for position, (key, value) in enumerate(members):
+        prefix = (b',' if position else b'') + encode_json(key) + b':'
+        if isinstance(value, StreamedList):
+            yield prefix + b'['
+            yield from iter_buffered((encode_json(item) for item in value), separator=b',')
+            yield b']'
+        else:
+            yield prefix + encode_json(value() if callable(value) else value)
+    yield b'}'
+
+
+def streaming_json_response(members):
+    return StreamingHttpResponse(iter_json_object(members), content_type='application/json')
+
+
+def streaming_ndjson_response(items):
+    """One JSON document per line"""
+    lines = (encode_json(item) + b'\n' for item in items)
+    return StreamingHttpResponse(iter_buffered(lines), content_type=NDJSON_CONTENT_TYPE)
@@ -1,2 +1,412 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .blobs import save_upload
+from .jobs import work
+from .models import Blob, Folder, UploadedFile, UploadSession
+from .pagination import InvalidCursor, encode_cursor, paginate_keyset
 
+
+class MediaTestCase(TestCase):
+    """Runs against a throwaway MEDIA_ROOT (blob store and processing directories)"""
+
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp()
+        media_override = override_settings(MEDIA_ROOT=media_root)
+        media_override.enable()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        cls.addClassCleanup(media_override.disable)
+        super().setUpClass()
+
+    def setUp(self):
+        # Cached responses are keyed by ids the test database reuses
+        cache.clear()
+
+    def create_file(self, name, content, folder=None):
+        return save_upload(UploadedFile(folder=folder, original_name=name), SimpleUploadedFile(name, content))
+
+
+# ==================== DOWNLOADS ====================
+
+class DownloadFileTests(MediaTestCase):
+    content = b'0123456789abcdef'
+
+    def setUp(self):
+        super().setUp()
+        self.file_obj = self.create_file('data.csv', self.content)
+        self.url = f'/download/file/{self.file_obj.id}/'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        self.addCleanup(response.close)
+        return response
+
+    def test_full_download(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], f'"{self.file_obj.blob.digest}"')
+        self.assertIn('data.csv', response['Content-Disposition'])
+
+    def test_byte_range(self):
+        response = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], f'bytes 2-5/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '4')
+
+    def test_open_and_suffix_ranges(self):
+        self.assertEqual(b''.join(self.get(HTTP_RANGE='bytes=12-').streaming_content), b'cdef')
+        self.assertEqual(b''.join(self.get(HTTP_RANGE='bytes=-3').streaming_content), b'def')
+        # An end past the file is clamped
+        response = self.get(HTTP_RANGE='bytes=10-1000')
+        self.assertEqual(response['Content-Range'], f'bytes 10-15/{len(self.content)}')
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_malformed_or_multi_range_sends_whole_file(self):
+        for header in ('bytes=5-2', 'bytes=0-1,4-5', 'items=0-1'):
+            with self.subTest(header=header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        # A stale validator means the client's partial copy is outdated: send everything
+        response = self.get(HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_if_none_match(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_missing_file(self):
+        self.assertEqual(self.client.get('/download/file/999999/').status_code, 404)
+
+
+# ==================== RESUMABLE UPLOADS ====================
+
+class UploadSessionTests(MediaTestCase):
+    content = b'id,name\n' + b'1,a\n' * 6  # 32 bytes: four chunks of at most 10
+
+    def setUp(self):
+        super().setUp()
+        small_chunks = override_settings(ENCRYPTION_SETTINGS=dict(settings.ENCRYPTION_SETTINGS, MAX_CHUNK_SIZE=10))
+        small_chunks.enable()
+        self.addCleanup(small_chunks.disable)
+        response = self.client.post('/api/uploads/', json.dumps({'filename': 'data.csv', 'size': len(self.content)}),
+                                    content_type='application/json')
+        self.session_id = response.json()['session']['session_id']
+
+    def put_chunk(self, number):
+        return self.client.put(f'/api/uploads/{self.session_id}/chunks/{number}/',
+                               self.content[number * 10:(number + 1) * 10], content_type='application/octet-stream')
+
+    def complete(self):
+        return self.client.post(f'/api/uploads/{self.session_id}/complete/')
+
+    def test_chunks_in_any_order_then_finalize(self):
+        for number in (3, 0, 2, 1):
+            self.assertEqual(self.put_chunk(number).status_code, 200)
+        response = self.complete()
+        self.assertEqual(response.json()['status'], 'success')
+        file_obj = UploadedFile.objects.get(pk=response.json()['file']['id'])
+        with file_obj.file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        session = UploadSession.objects.get(pk=self.session_id)
+        self.assertEqual(session.status, 'completed')
+        self.assertFalse(os.path.exists(session.get_part_path()))
+
+    def test_finalize_reports_missing_chunks(self):
+        self.put_chunk(0)
+        self.put_chunk(2)
+        response = self.complete()
+        self.assertEqual(response.json()['missing_chunks'], [1, 3])
+        self.assertEqual(UploadSession.objects.get(pk=self.session_id).status, 'active')
+
+    def test_second_finalize_conflicts(self):
+        for number in range(4):
+            self.put_chunk(number)
+        self.assertEqual(self.complete().json()['status'], 'success')
+        self.assertEqual(self.complete().status_code, 409)
+        self.assertEqual(self.put_chunk(0).status_code, 409)
+        self.assertEqual(UploadedFile.objects.count(), 1)
+
+    def test_concurrent_finalize_only_one_claims(self):
+        for number in range(4):
+            self.put_chunk(number)
+
+        def claimed_elsewhere(session):
+            # Another finalize claims the session between our checks and our claim
+            UploadSession.objects.filter(pk=session.pk).update(status='finalizing')
+            return None
+
+        with mock.patch('files.api.get_incomplete_upload_response', side_effect=claimed_elsewhere):
+            response = self.complete()
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(UploadedFile.objects.exists())
+        self.assertTrue(os.path.exists(UploadSession.objects.get(pk=self.session_id).get_part_path()))
+
+
+# ==================== KEYSET PAGINATION ====================
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        # Two rows share a timestamp (ties break on id) and one has none (nulls sort first)
+        stamps = [now, now - timedelta(days=1), now, None, now - timedelta(days=2)]
+        self.files = [UploadedFile.objects.create(original_name=f'{n}.csv') for n in range(len(stamps))]
+        for file_obj, stamp in zip(self.files, stamps):
+            UploadedFile.objects.filter(pk=file_obj.pk).update(uploaded_at=stamp)
+        self.expected = [f.pk for f in sorted(
+            UploadedFile.objects.all(), key=lambda f: (f.uploaded_at is not None, f.uploaded_at or now, f.pk)
+        )]
+
+    def walk(self, limit, descending=False):
+        ids, cursor = [], None
+        while True:
+            rows, cursor = paginate_keyset(UploadedFile.objects.all(), cursor, limit, field='uploaded_at',
+                                           descending=descending)
+            ids.extend(row.pk for row in rows)
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_every_row_once_in_order(self):
+        for limit in (1, 2, 3, 10):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.walk(limit), self.expected)
+
+    def test_descending(self):
+        self.assertEqual(self.walk(2, descending=True), self.expected[::-1])
+
+    def test_id_only(self):
+        rows, cursor = paginate_keyset(UploadedFile.objects.all(), None, 3)
+        rest, last_cursor = paginate_keyset(UploadedFile.objects.all(), cursor, 3)
+        self.assertEqual([row.pk for row in rows + rest], sorted(f.pk for f in self.files))
+        self.assertIsNone(last_cursor)
+
+    def test_invalid_cursors(self):
+        cursors = ['not-base64!', encode_cursor({'a': 1}), encode_cursor([]), encode_cursor([{'a': 1}, 5]),
+                   encode_cursor([12, 5]), encode_cursor(['2024-13-45T00:00:00', 5]), encode_cursor(['x', 'y'])]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(InvalidCursor):
+                    paginate_keyset(UploadedFile.objects.all(), cursor, 2, field='uploaded_at')
+
+    def test_listing_endpoint(self):
+        response = self.client.get('/api/files/', {'limit': 2, 'fields': 'id'})
+        self.assertEqual([row['id'] for row in response.json()['files']], self.expected[:2])
+        self.assertTrue(response.json()['has_more'])
+        response = self.client.get('/api/files/', {'limit': 2, 'cursor': response.json()['next_cursor']})
+        self.assertEqual([row['id'] for row in response.json()['files']], self.expected[2:4])
+        self.assertEqual(self.client.get('/api/files/', {'cursor': encode_cursor([[1], 2])}).status_code, 400)
+
+
+# ==================== BLOB STORE ====================
+
+class BlobStoreTests(MediaTestCase):
+    content = b'id,name\n1,a\n'
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.create_file('a.csv', self.content)
+        second = self.create_file('b.csv', self.content)
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertEqual(first.file.name, second.file.name)
+
+    def test_copy_adds_a_reference(self):
+        file_obj = self.create_file('a.csv', self.content)
+        folder = Folder.objects.create(name='dest')
+        self.assertEqual(self.post('/copy-file/', {'file_id': file_obj.id, 'folder_id': folder.id}).json()['status'],
+                         'success')
+        copy = UploadedFile.objects.get(folder=folder)
+        self.assertEqual(copy.blob_id, file_obj.blob_id)
+        self.assertEqual(copy.processing_hash, file_obj.processing_hash)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+    def test_delete_releases_and_last_reference_removes_bytes(self):
+        first = self.create_file('a.csv', self.content)
+        second = self.create_file('b.csv', self.content)
+        blob_path = first.blob.path
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post('/delete-file/', {'file_id': first.id})
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(blob_path))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/files/{second.id}/delete/')
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(blob_path))
+
+    def test_bulk_and_folder_deletes_release_every_reference(self):
+        folder = Folder.objects.create(name='top')
+        sub = Folder.objects.create(name='sub', parent=folder)
+        in_tree = [self.create_file('a.csv', self.content, folder), self.create_file('b.csv', self.content, sub)]
+        loose = [self.create_file('c.csv', self.content), self.create_file('d.csv', self.content)]
+        blob_path = loose[0].blob.path
+        with self.captureOnCommitCallbacks(execute=True):
+            folder.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post('/delete-multiple-files/', {'file_ids': [f.id for f in loose + in_tree]})
+        self.assertEqual(response.json()['summary'], {'deleted': 2, 'not_found': 2})
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(blob_path))
+
+
+# ==================== CHUNK FORMATS ====================
+
+class ChunkFormatRelocationTests(MediaTestCase):
+    content = b'id,name\n' + b''.join(b'%d,n%d\n' % (i, i) for i in range(50))
+
+    def setUp(self):
+        super().setUp()
+        self.json_folder = Folder.objects.create(name='json', chunk_format='json')
+        self.arrow_folder = Folder.objects.create(name='arrow', chunk_format='arrow')
+        self.file_obj = self.create_file('data.csv', self.content, self.json_folder)
+        self.client.post(f'/api/files/{self.file_obj.id}/process/')
+        work(burst=True)
+        self.file_obj.refresh_from_db()
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def assertUnchunked(self, file_obj):
+        file_obj.refresh_from_db()
+        self.assertEqual((file_obj.has_chunks, file_obj.chunk_count, file_obj.processing_status), (False, 0, 'raw'))
+        self.assertEqual(self.client.get(f'/api/files/{file_obj.id}/chunks/1/').json()['status'], 'error')
+
+    def assertChunked(self, file_obj):
+        file_obj.refresh_from_db()
+        self.assertEqual((file_obj.has_chunks, file_obj.chunk_count), (True, self.file_obj.chunk_count))
+        self.assertEqual(self.client.get(f'/api/files/{file_obj.id}/chunks/1/').status_code, 200)
+
+    def test_processed(self):
+        self.assertTrue(self.file_obj.has_chunks)
+        self.assertEqual(self.file_obj.processing_status, 'processed')
+
+    def test_copy_into_other_format_is_unchunked(self):
+        self.post('/copy-file/', {'file_id': self.file_obj.id, 'folder_id': self.arrow_folder.id})
+        self.assertUnchunked(UploadedFile.objects.get(folder=self.arrow_folder))
+        self.assertChunked(self.file_obj)
+
+    def test_copy_into_same_format_shares_chunks(self):
+        other = Folder.objects.create(name='other', chunk_format='json')
+        self.post('/copy-multiple-files/', {'file_ids': [self.file_obj.id], 'folder_id': other.id})
+        self.assertChunked(UploadedFile.objects.get(folder=other))
+
+    def test_move_follows_the_destination_format(self):
+        self.post('/move-file/', {'file_id': self.file_obj.id, 'folder_id': self.arrow_folder.id})
+        self.assertUnchunked(self.file_obj)
+        # The JSON chunks are still on disk: moving back finds them
+        self.post('/move-multiple-files/', {'file_ids': [self.file_obj.id], 'folder_id': self.json_folder.id})
+        self.assertChunked(self.file_obj)
+        self.post('/move-multiple-files/', {'file_ids': [self.file_obj.id], 'folder_id': self.arrow_folder.id})
+        self.assertUnchunked(self.file_obj)
+
+    def test_own_chunk_format_wins_over_the_folder(self):
+        UploadedFile.objects.filter(pk=self.file_obj.pk).update(chunk_format='json')
+        self.post('/move-file/', {'file_id': self.file_obj.id, 'folder_id': self.arrow_folder.id})
+        self.assertChunked(self.file_obj)
+
+    def test_missing_chunk_is_not_found(self):
+        response = self.client.get(f'/api/files/{self.file_obj.id}/chunks/{self.file_obj.chunk_count + 5}/')
+        self.assertEqual(response.status_code, 404)
+
+
+# ==================== FOLDER UPLOADS ====================
+
+class FolderUploadTests(MediaTestCase):
+    def upload(self, entries, allowed_type='csv'):
+        """POST a directory upload: ``entries`` is [(relative path, content)]"""
+        return self.client.post('/', {
+            'folder_upload': [SimpleUploadedFile(path.rsplit('/', 1)[-1], content) for path, content in entries],
+            'folder_upload_paths': json.dumps([path for path, _ in entries]),
+            'folder_allowed_type': allowed_type,
+        })
+
+    def test_hierarchy_is_recreated(self):
+        response = self.upload([('top/a.csv', b'a\n1\n'), ('top/s1/b.csv', b'b\n2\n'),
+                                ('top/s1/s2/c.csv', b'c\n3\n')])
+        self.assertEqual(response.status_code, 302)
+        top = Folder.objects.get(name='top', parent=None)
+        s1 = Folder.objects.get(name='s1', parent=top)
+        s2 = Folder.objects.get(name='s2', parent=s1)
+        placed = dict(UploadedFile.objects.values_list('original_name', 'folder_id'))
+        self.assertEqual(placed, {'a.csv': top.id, 'b.csv': s1.id, 'c.csv': s2.id})
+
+    def test_rejected_parts_keep_the_other_paths_aligned(self):
+        # README.txt is refused by the upload handler and never reaches request.FILES
+        self.upload([('top/README.txt', b'read me'), ('top/s1/b.csv', b'b\n2\n'), ('top/s1/s2/c.csv', b'c\n3\n')])
+        self.assertEqual(list(Folder.objects.filter(parent=None).values_list('name', flat=True)), ['top'])
+        s1 = Folder.objects.get(name='s1', parent__name='top')
+        placed = dict(UploadedFile.objects.values_list('original_name', 'folder_id'))
+        self.assertEqual(placed, {'b.csv': s1.id, 'c.csv': Folder.objects.get(name='s2', parent=s1).id})
+
+    def test_bad_magic_bytes_are_dropped_by_position(self):
+        self.upload([('top/bad.pdf', b'not a pdf'), ('top/sub/good.pdf', b'%PDF-1.4 body')], allowed_type='pdf')
+        sub = Folder.objects.get(name='sub', parent__name='top')
+        self.assertEqual(list(UploadedFile.objects.values_list('original_name', 'folder_id')), [('good.pdf', sub.id)])
+
+    def test_without_paths_nothing_is_created(self):
+        response = self.client.post('/', {'folder_upload': [SimpleUploadedFile('b.csv', b'b\n2\n')]})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'relative paths', response.content)
+        self.assertFalse(Folder.objects.exists())
+        self.assertFalse(UploadedFile.objects.exists())
+
+
+# ==================== RECORD SEARCH ====================
+
+class RecordSearchTests(MediaTestCase):
+    content = b'id,name\n' + b''.join(b'%d,n%d\n' % (i, i) for i in range(50))
+
+    def setUp(self):
+        super().setUp()
+        self.folder = Folder.objects.create(name='data')
+        self.file_obj = self.create_file('data.csv', self.content, self.folder)
+        self.client.post(f'/api/files/{self.file_obj.id}/process/')
+        work(burst=True)
+        self.client.post(f'/api/files/{self.file_obj.id}/record-index/')
+        work(burst=True)
+
+    def search(self, **params):
+        return self.client.get('/api/records/search/', dict({'value': 'n7', 'field': 'name'}, **params))
+
+    def test_search(self):
+        for params in ({}, {'folder_id': self.folder.id}, {'file_id': f'{self.file_obj.id},999'}):
+            with self.subTest(**params):
+                results = self.search(**params).json()['results']
+                self.assertEqual([(r['file_id'], r['record_index']) for r in results], [(self.file_obj.id, 7)])
+
+    def test_malformed_ids_are_rejected(self):
+        cases = [({'folder_id': 'abc'}, 'folder_id must be an integer'),
+                 ({'file_id': '1,x'}, 'file_id must be a comma-separated list of integers'),
+                 ({'cursor': 'garbage!'}, 'Invalid cursor')]
+        for params, message in cases:
+            with self.subTest(**params):
+                response = self.search(**params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['message'], message)
+        self.assertEqual(self.search(folder_id=999999).status_code, 404)
@@ -0,0 +1,180 @@
+"""
+Streaming upload handler
+Each uploaded file is written once, straight into a staging file inside the
+blob store (same filesystem, so ingesting it is a rename), while its SHA-256
+and size are computed. Disallowed extensions are rejected from the part
+headers and PDF/Parquet files whose magic bytes do not match are dropped,
+before the body is stored.
+"""
+import hashlib
+import logging
+import os
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.utils.deprecation import MiddlewareMixin
+from .blobs import create_staging_file
+
+logger = logging.getLogger(__name__)
+
+# Leading (and for Parquet trailing) signatures checked while streaming
+MAGIC_BYTES = {
+    'pdf': (b'%PDF-', None),
+    'parquet': (b'PAR1', b'PAR1'),
+}
+
+
+def restrict_upload_types(request, allowed_types):
+    """
+    Limit the file extensions accepted for the rest of this request. Must be
+    called before request.POST/FILES is first accessed; parts with another
+    extension are skipped unread and listed in request.rejected_uploads.
+    """
+    request.allowed_upload_types = {t.lower() for t in allowed_types if t}
+
+
+def upload_types(allowed_types):
+    """
+    View decorator for views that are not csrf_exempt: CsrfViewMiddleware reads
+    request.POST before the view runs, so UploadTypeMiddleware applies the
+    restriction from the resolved view instead.
+    """
+    def decorator(view_func):
+        view_func.allowed_upload_types = list(allowed_types)
+        return view_func
+    return decorator
+
+
+class UploadTypeMiddleware(MiddlewareMixin):
+    """Apply @upload_types restrictions; must come before CsrfViewMiddleware"""
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        allowed_types = getattr(view_func, 'allowed_upload_types', None)
+        if allowed_types is not None and request.method == 'POST':
+            restrict_upload_types(request, allowed_types)
+        return None
+
+
+def get_rejected_uploads(request):
+    """
+    [{'name', 'reason', 'field', 'index'}] for parts the handler refused;
+    ``index`` is the part's position among the files sent in ``field``.
+    """
+    return getattr(request, 'rejected_uploads', [])
+
+
+class StagedUploadedFile(UploadedFile):
+    """
+    An upload already on disk inside the blob store, with its digest. The file
+    is opened lazily (large directory uploads would otherwise hold one open
+    descriptor per file) and removed on close unless it was ingested.
+    """
+
+    def __init__(self, path, name, content_type, size, charset, content_type_extra, sha256):
+        self._file = None
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.path = path
+        self.sha256 = sha256
+
+    @property
+    def file(self):
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        return self._file
+
+    @file.setter
+    def file(self, value):
+        self._file = value
+
+    @property
+    def closed(self):
+        return self._file is None or self._file.closed
+
+    def temporary_file_path(self):
+        return self.path
+
+    def open(self, mode=None):
+        if self.closed:
+            self._file = open(self.path, mode or 'rb')
+        else:
+            self.seek(0)
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            # Already moved into the store
+            pass
+
+
+class StreamingBlobUploadHandler(FileUploadHandler):
+    """Validate, hash and stage uploads in one pass (see module docstring)"""
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        # Position among the field's parts, so callers can line up per-part data sent alongside
+        if not hasattr(self.request, 'upload_part_counts'):
+            self.request.upload_part_counts = {}
+        self.part_index = self.request.upload_part_counts.get(field_name, 0)
+        self.request.upload_part_counts[field_name] = self.part_index + 1
+        self.extension = os.path.splitext(file_name)[1].lstrip('.').lower()
+        allowed_types = getattr(self.request, 'allowed_upload_types', None)
+        if allowed_types is not None and self.extension not in allowed_types:
+            self.reject(f'.{self.extension} files are not allowed here (allowed: '
+                        f'{", ".join("." + t for t in sorted(allowed_types))})')
+        self.head, self.trailer = MAGIC_BYTES.get(self.extension, (None, None))
+        self.head_buffer = b''
+        self.tail = b''
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        fd, self.staging_path = create_staging_file()
+        self.staging_file = os.fdopen(fd, 'wb')
+
+    def reject(self, reason):
+        if getattr(self, 'staging_file', None) is not None:
+            self.discard()
+        if not hasattr(self.request, 'rejected_uploads'):
+            self.request.rejected_uploads = []
+        self.request.rejected_uploads.append({'name': self.file_name, 'reason': reason,
+                                              'field': self.field_name, 'index': self.part_index})
+        logger.info("Rejected upload %s: %s", self.file_name, reason)
+        raise SkipFile()
+
+    def discard(self):
+        self.staging_file.close()
+        self.staging_file = None
+        os.remove(self.staging_path)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.head is not None and len(self.head_buffer) < len(self.head):
+            self.head_buffer += raw_data[:len(self.head) - len(self.head_buffer)]
+            if not self.head.startswith(self.head_buffer[:len(self.head)]):
+                self.reject(f'Content is not a valid .{self.extension} file')
+        if self.trailer is not None:
+            self.tail = (self.tail + raw_data)[-len(self.trailer):]
+        self.hasher.update(raw_data)
+        self.staging_file.write(raw_data)
+        self.size += len(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if (self.head is not None and self.head_buffer != self.head) or (
+                self.trailer is not None and self.tail != self.trailer):
+            try:
+                self.reject(f'Content is not a valid .{self.extension} file')
+            except SkipFile:
+                # Too late to skip: dropping the file leaves it out of request.FILES
+                return None
+        self.staging_file.close()
+        self.staging_file = None
+        return StagedUploadedFile(
+            self.staging_path, self.file_name, self.content_type, self.size, self.charset,
+            self.content_type_extra, self.hasher.hexdigest()
+        )
+
+    def upload_interrupted(self):
+        if getattr(self, 'staging_file', None) is not None:
+            self.discard()
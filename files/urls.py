@@ -3,7 +3,8 @@ from django.urls import path, include
 from .views import (
     upload_page, move_file, rename_folder, delete_folder, delete_file, copy_file,
     download_file, download_folder, delete_multiple_files, move_multiple_files,
-    copy_multiple_files, folder_detail, folder_list_json, upload_to_folder
+    copy_multiple_files, folder_detail, folder_list_json, upload_to_folder,
+    folder_children_json
 )
 
 from .api_urls import api_urlpatterns
@@ -23,6 +24,7 @@ urlpatterns = [
     path('copy-multiple-files/', copy_multiple_files, name='copy_multiple_files'),
     path('folder-detail/<int:folder_id>/', folder_detail, name='folder_detail'),
     path('folder-list-json/', folder_list_json, name='folder_list_json'),
+    path('folder-children/<int:folder_id>/', folder_children_json, name='folder_children_json'),
     path('upload-to-folder/<int:folder_id>/', upload_to_folder, name='upload_to_folder'),
     
 ] + api_urlpatterns  # Include API endpoints
@@ -1,16 +1,51 @@
 # type: ignore
-import json, zipfile, os
-from io import BytesIO
+import json, os
 from django.http import JsonResponse, HttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Folder, UploadedFile
+from . import cache, search
+from .models import ALLOWED_TYPE_CHOICES, Folder, UploadedFile, batched, relocated_chunk_state
 from .forms import FolderForm, FileUploadForm
+from .downloads import serve_file, zip_response
+from .blobs import bulk_clone_files, bulk_save_uploads, clone_file, ensure_blob, save_upload
+from .uploadhandlers import get_rejected_uploads, restrict_upload_types, upload_types
 from django.views.decorators.csrf import csrf_exempt
 from django.template.loader import render_to_string
+from django.db import transaction
+from django.db.models import Count
+from django.urls import reverse
+from django.utils import timezone
+from .pagination import InvalidCursor, get_page_limit, paginate_keyset
 
 
+def get_relative_paths(request, files):
+    """
+    Path parts of each folder-upload file. Django keeps only the base name of
+    multipart file names, so the page sends the browser's webkitRelativePath
+    list as ``folder_upload_paths``, one per part sent; the paths of parts the
+    upload handler refused are dropped. Without it every file is top-level.
+    """
+    try:
+        paths = json.loads(request.POST.get('folder_upload_paths') or '[]')
+    except ValueError:
+        paths = []
+    if isinstance(paths, list):
+        rejected = {r['index'] for r in get_rejected_uploads(request) if r['field'] == 'folder_upload'}
+        paths = [path for index, path in enumerate(paths) if index not in rejected]
+    if not isinstance(paths, list) or len(paths) != len(files):
+        return [[f.name] for f in files]
+    relative_paths = []
+    for f, path in zip(files, paths):
+        # Only the directory names come from the client; empty and dot segments are dropped
+        parts = [part for part in str(path).replace('\\', '/').split('/') if part not in ('', '.', '..')]
+        relative_paths.append(parts[:-1] + [f.name])
+    return relative_paths
+
+
+# Everything uploaded here lands in a folder, so other types are refused while streaming
+@upload_types([t for t, _ in ALLOWED_TYPE_CHOICES])
 def upload_page(request):
-    folders = Folder.objects.filter(parent=None).prefetch_related('subfolders', 'files')  # type: ignore
+    # Only root folders are rendered; children and files are loaded on expand via folder_children_json
+    folders = Folder.objects.filter(parent=None).annotate(subfolder_count=Count('subfolders'))  # type: ignore
     file_form = FileUploadForm()
     folder_form = FolderForm()
     message = None
@@ -26,25 +61,33 @@ def upload_page(request):
         # If folder_upload is present and has files, handle folder upload only
         if request.FILES.getlist('folder_upload'):
             files = request.FILES.getlist('folder_upload')
-            # Try to extract the top-level folder name from the first file's relative path
-            first_file = files[0]
-            rel_path = first_file.name
-            top_folder_name = rel_path.split('/')[0] if '/' in rel_path else rel_path
+            relative_paths = get_relative_paths(request, files)
             # Get the allowed type from the form
             allowed_type = request.POST.get('folder_allowed_type', 'csv')
-            # Check if a root folder with this name exists
-            folder_obj, created = Folder.objects.get_or_create(name=top_folder_name, parent=None)  # type: ignore
-            # Always update allowed_type to the selected value
-            folder_obj.allowed_type = allowed_type
-            folder_obj.save()
-            for f in files:
-                ext = f.name.split('.')[-1].lower()
-                if allowed_type and ext != allowed_type:
-                    continue  # skip files with wrong extension
-                # Remove the top folder from the file name for storage
-                f.name = '/'.join(f.name.split('/')[1:]) if '/' in f.name else f.name
-                UploadedFile.objects.create(file=f, folder=folder_obj)  # type: ignore
-            return redirect('upload_page')
+            # The top-level directory becomes (or reuses) a root folder; a file name never names it
+            top_folder_name = next((rel_path[0] for rel_path in relative_paths if len(rel_path) > 1), None)
+            if top_folder_name is None:
+                message = 'Folder upload failed: the relative paths of the files are missing'
+            else:
+                folder_obj, created = Folder.objects.get_or_create(name=top_folder_name, parent=None)  # type: ignore
+                # Always update allowed_type to the selected value
+                folder_obj.allowed_type = allowed_type
+                folder_obj.save()
+                accepted = [
+                    (f, rel_path) for f, rel_path in zip(files, relative_paths)
+                    if not allowed_type or f.name.split('.')[-1].lower() == allowed_type  # skip files with wrong extension
+                ]
+                # Subdirectories below the top one are recreated as subfolders
+                folders = folder_obj.ensure_subfolder_paths(
+                    {tuple(rel_path[1:-1]) for _, rel_path in accepted}, allowed_type=allowed_type
+                )
+                bulk_save_uploads([
+                    (UploadedFile(folder=folders[tuple(rel_path[1:-1])], original_name=f.name), f)
+                    for f, rel_path in accepted
+                ])
+                print(f"DEBUG: Folder upload '{top_folder_name}': {len(accepted)} of {len(files)} files, "
+                      f"{len(folders)} folders")
+                return redirect('upload_page')
         # If a file is uploaded (and not a folder), handle single file upload
         elif request.FILES.get('file'):
             file_form = FileUploadForm(request.POST, request.FILES)
@@ -55,8 +98,10 @@ def upload_page(request):
                 if allowed and ext != allowed:
                     message = f"Cannot upload .{ext} to folder '{f.folder.name}' (allowed: .{allowed})"
                 else:
-                    f.save()
+                    save_upload(f, request.FILES['file'])
                     return redirect('upload_page')
+        elif get_rejected_uploads(request):
+            message = '; '.join(f"{r['name']}: {r['reason']}" for r in get_rejected_uploads(request))
         # If folder form is submitted for creating a new folder
         elif request.POST.get('create_folder'):
             print(f"DEBUG: =================== FOLDER FORM SUBMISSION ===================")
@@ -96,11 +141,17 @@ def move_file(request):
             file = UploadedFile.objects.get(id=file_id)  # type: ignore
             folder = Folder.objects.get(id=folder_id)  # type: ignore
             # Only allow move if file extension matches folder.allowed_type
-            ext = file.file.name.split('.')[-1].lower()
+            ext = file.extension
             if folder.allowed_type and ext != folder.allowed_type:
                 return JsonResponse({'status': 'error', 'message': f'Cannot move .{ext} file to folder (allowed: .{folder.allowed_type})'})
+            old_folder_id = file.folder_id
+            # The folder's chunk format may change the file's, and with it the chunks it has
+            for field, value in relocated_chunk_state([file], folder).get(file.id, {}).items():
+                setattr(file, field, value)
             file.folder = folder
             file.save()
+            # The save signal covers the destination
+            cache.invalidate_file_folders([old_folder_id])
             return JsonResponse({'status': 'success'})
         except (UploadedFile.DoesNotExist, Folder.DoesNotExist):  # type: ignore
             return JsonResponse({'status': 'error', 'message': 'File or folder not found'})
@@ -130,14 +181,7 @@ def delete_folder(request):
 
         try:
             folder = Folder.objects.get(id=folder_id)  # type: ignore
-            
-            # First delete all physical files in this folder
-            for file_obj in folder.files.all():
-                if file_obj.file and os.path.exists(file_obj.file.path):
-                    os.remove(file_obj.file.path)
-                    print(f"DEBUG: Deleted physical file: {file_obj.file.path}")
-            
-            # Delete the folder (this will cascade delete all file records)
+            # Folder.delete() releases every file in the subtree (shared blobs survive)
             folder.delete()
             return JsonResponse({'status': 'success'})
         except Folder.DoesNotExist:  # type: ignore
@@ -145,24 +189,41 @@ def delete_folder(request):
 
 
 def download_file(request, file_id):
-    file_obj = get_object_or_404(UploadedFile, id=file_id)  # type: ignore
-    file_path = file_obj.file.path
-    with open(file_path, 'rb') as f:
-        response = HttpResponse(f.read(), content_type='application/octet-stream')
-        response['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
-        return response
+    file_obj = get_object_or_404(UploadedFile.objects.select_related('blob'), id=file_id)  # type: ignore
+    # Blob contents never change, so the digest is a strong validator across copies and re-uploads
+    etag = f'"{file_obj.blob.digest}"' if file_obj.blob_id else None
+    # Streamed (or handed off to the front proxy) so worker memory stays flat
+    return serve_file(request, file_obj.file.path, file_obj.display_name, etag=etag)
+
+
+def iter_folder_archive_entries(folder):
+    """Yield (file_path, arcname) for a whole folder tree using two queries"""
+    relative_paths = {folder.id: ''}
+    for sub in folder.get_descendants().only('id', 'name', 'parent_id', 'depth').order_by('depth', 'name'):
+        relative_paths[sub.id] = f"{relative_paths[sub.parent_id]}{sub.name.replace('/', '_')}/"
+        yield None, relative_paths[sub.id]
+
+    used_names = {}
+    files = folder.get_subtree_files().only('file', 'original_name', 'folder_id').order_by('id')
+    for uf in files.iterator():
+        if not uf.file:
+            continue
+        folder_path = relative_paths[uf.folder_id]
+        names = used_names.setdefault(folder_path, set())
+        name = uf.display_name
+        stem, ext = os.path.splitext(name)
+        counter = 1
+        while name in names:
+            name = f"{stem} ({counter}){ext}"
+            counter += 1
+        names.add(name)
+        yield uf.file.path, f"{folder_path}{name}"
 
 
 def download_folder(request, folder_id):
     folder = get_object_or_404(Folder, id=folder_id)
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w') as zf:
-        for uf in folder.files.all():
-            zf.write(uf.file.path, arcname=os.path.basename(uf.file.name))
-    zip_buffer.seek(0)
-    response = HttpResponse(zip_buffer.read(), content_type='application/zip')
-    response['Content-Disposition'] = f'attachment; filename="{folder.name}.zip"'
-    return response
+    # Streamed as it is built: subfolders keep their relative paths
+    return zip_response(iter_folder_archive_entries(folder), f"{folder.name}.zip")
 # views.py
 @csrf_exempt
 def delete_file(request):
@@ -173,11 +234,7 @@ def delete_file(request):
         # Get the file object before deleting to access the file path
         try:
             file_obj = UploadedFile.objects.get(id=file_id)
-            # Delete the physical file from storage
-            if file_obj.file and os.path.exists(file_obj.file.path):
-                os.remove(file_obj.file.path)
-                print(f"DEBUG: Deleted physical file: {file_obj.file.path}")
-            # Now delete the database record
+            # The model releases the blob; the bytes go only with the last reference
             file_obj.delete()
             return JsonResponse({'status':'ok'})
         except UploadedFile.DoesNotExist:
@@ -192,53 +249,100 @@ def copy_file(request):
         try:
             file = UploadedFile.objects.get(id=file_id)
             folder = Folder.objects.get(id=folder_id)
-            ext = file.file.name.split('.')[-1].lower()
+            ext = file.extension
             if folder.allowed_type and ext != folder.allowed_type:
                 return JsonResponse({'status': 'error', 'message': f'Cannot copy .{ext} file to folder (allowed: .{folder.allowed_type})'})
-            new_file = UploadedFile.objects.get(id=file.id)
-            new_file.pk = None
-            new_file.folder = folder
-            new_file.file.name = f"copies/{os.path.basename(file.file.name)}"
-            new_file.save()
+            # Metadata-only: the copy references the same blob
+            clone_file(file, folder)
             return JsonResponse({'status': 'success'})
         except (UploadedFile.DoesNotExist, Folder.DoesNotExist):
             return JsonResponse({'status': 'error', 'message': 'File or folder not found'})
 
 
+def parse_file_ids(data):
+    """Distinct integer ids from a JSON body, in request order"""
+    file_ids = []
+    for file_id in data.get('file_ids', []):
+        try:
+            file_id = int(file_id)
+        except (TypeError, ValueError):
+            continue
+        if file_id not in file_ids:
+            file_ids.append(file_id)
+    return file_ids
+
+
+def fetch_files(file_ids, *fields):
+    """{id: UploadedFile} for the ids that exist, fetched in id__in batches (all columns unless ``fields``)"""
+    files = {}
+    for batch in batched(file_ids):
+        queryset = UploadedFile.objects.filter(id__in=batch)
+        if fields:
+            queryset = queryset.only('id', *fields)
+        files.update((f.id, f) for f in queryset)
+    return files
+
+
+def bulk_results(file_ids, outcomes):
+    """Per-id outcomes in request order plus a count per outcome"""
+    results = [dict({'id': file_id}, **outcomes.get(file_id, {'status': 'not_found'})) for file_id in file_ids]
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return {'status': 'success', 'results': results, 'summary': summary}
+
+
 @csrf_exempt
 def delete_multiple_files(request):
     if request.method == 'POST':
-        import json
         data = json.loads(request.body)
-        file_ids = data.get('file_ids', [])
-        
-        # Get all file objects and delete physical files first
-        files_to_delete = UploadedFile.objects.filter(id__in=file_ids)
-        for file_obj in files_to_delete:
-            if file_obj.file and os.path.exists(file_obj.file.path):
-                os.remove(file_obj.file.path)
-                print(f"DEBUG: Deleted physical file: {file_obj.file.path}")
-        
-        # Now delete the database records
-        files_to_delete.delete()
-        return JsonResponse({'status': 'ok'})
+        file_ids = parse_file_ids(data)
+
+        # One transaction; blob references are released in bulk and bytes unlinked after commit
+        outcomes = {}
+        with transaction.atomic():
+            for batch in batched(file_ids):
+                files = UploadedFile.objects.filter(id__in=batch)
+                outcomes.update((file_id, {'status': 'deleted'}) for file_id in files.values_list('id', flat=True))
+                files.delete()
+        return JsonResponse(bulk_results(file_ids, outcomes))
 
 @csrf_exempt
 def move_multiple_files(request):
     if request.method == 'POST':
         data = json.loads(request.body)
-        file_ids = data.get('file_ids', [])
+        file_ids = parse_file_ids(data)
         folder_id = data.get('folder_id')
         try:
             folder = Folder.objects.get(id=folder_id)
-            files = UploadedFile.objects.filter(id__in=file_ids)
-            for file in files:
-                ext = file.file.name.split('.')[-1].lower()
+            outcomes = {}
+            movable = []
+            source_folder_ids = set()
+            files = fetch_files(file_ids, 'file', 'original_name', 'folder_id', 'chunk_format', 'processing_hash')
+            for file_id, file in files.items():
+                ext = file.extension
                 if folder.allowed_type and ext != folder.allowed_type:
-                    continue  # skip files with wrong extension
-                file.folder = folder
-                file.save()
-            return JsonResponse({'status': 'success'})
+                    # skip files with wrong extension
+                    outcomes[file_id] = {'status': 'skipped', 'message': f'.{ext} not allowed (allowed: .{folder.allowed_type})'}
+                else:
+                    movable.append(file_id)
+                    source_folder_ids.add(file.folder_id)
+
+            with transaction.atomic():
+                # Chunk flags follow the destination's chunk format: one UPDATE per distinct state
+                chunk_states = relocated_chunk_state([files[file_id] for file_id in movable], folder)
+                by_state = {}
+                for file_id in movable:
+                    by_state.setdefault(tuple(chunk_states.get(file_id, {}).items()), []).append(file_id)
+                now = timezone.now()
+                for state, state_ids in by_state.items():
+                    for batch in batched(state_ids):
+                        UploadedFile.objects.filter(id__in=batch).update(folder=folder, updated_at=now, **dict(state))
+                search.index_files(movable)
+                if movable:
+                    cache.invalidate_file_folders(source_folder_ids | {folder.id})
+            outcomes.update((file_id, {'status': 'moved'}) for file_id in movable)
+            return JsonResponse(bulk_results(file_ids, outcomes))
         except Folder.DoesNotExist:
             return JsonResponse({'status': 'error', 'message': 'Folder not found'})
 
@@ -246,44 +350,98 @@ def move_multiple_files(request):
 def copy_multiple_files(request):
     if request.method == 'POST':
         data = json.loads(request.body)
-        file_ids = data.get('file_ids', [])
+        file_ids = parse_file_ids(data)
         folder_id = data.get('folder_id')
         try:
             folder = Folder.objects.get(id=folder_id)
-            files = UploadedFile.objects.filter(id__in=file_ids)
-            for file in files:
-                ext = file.file.name.split('.')[-1].lower()
+            outcomes = {}
+            to_copy = []
+            for file_id, file in fetch_files(file_ids).items():
+                ext = file.extension
                 if folder.allowed_type and ext != folder.allowed_type:
-                    continue  # skip files with wrong extension
-                new_file = UploadedFile.objects.get(id=file.id)
-                new_file.pk = None
-                new_file.folder = folder
-                new_file.file.name = f"copies/{os.path.basename(file.file.name)}"
-                new_file.save()
-            return JsonResponse({'status': 'success'})
+                    # skip files with wrong extension
+                    outcomes[file_id] = {'status': 'skipped', 'message': f'.{ext} not allowed (allowed: .{folder.allowed_type})'}
+                    continue
+                try:
+                    # Legacy files move into the blob store first so the copy can share them
+                    ensure_blob(file)
+                except FileNotFoundError:
+                    outcomes[file_id] = {'status': 'error', 'message': 'File missing on disk'}
+                    continue
+                to_copy.append(file)
+
+            # Metadata-only: one bulk INSERT, blob reference counts bumped in bulk
+            new_files = bulk_clone_files(to_copy, folder)
+            for file, new_file in zip(to_copy, new_files):
+                outcomes[file.id] = {'status': 'copied', 'new_id': new_file.id}
+            return JsonResponse(bulk_results(file_ids, outcomes))
         except Folder.DoesNotExist:
             return JsonResponse({'status': 'error', 'message': 'Folder not found'})
 
 
 def folder_detail(request, folder_id):
-    folder = Folder.objects.prefetch_related('files').get(id=folder_id)
-    html = render_to_string('folder_detail_panel.html', {'folder': folder})
-    return HttpResponse(html)
+    def build():
+        folder = Folder.objects.get(id=folder_id)
+        html = render_to_string('folder_detail_panel.html', {'folder': folder})
+        return HttpResponse(html)
+    return cache.cached_response('folder_detail', [cache.folder_version(folder_id)], build, folder_id)
+
+
+def folder_children_json(request, folder_id):
+    """Subfolders (first page only) and one keyset page of files for lazy tree loading"""
+    folder = get_object_or_404(Folder, id=folder_id)
+    cursor = request.GET.get('cursor')
+    data = {'folder_id': folder.id}
+
+    if not cursor:
+        subfolders = folder.subfolders.annotate(subfolder_count=Count('subfolders')).order_by('name')
+        data['subfolders'] = [{
+            'id': sub.id,
+            'name': sub.name,
+            'allowed_type': sub.allowed_type,
+            'has_children': sub.subfolder_count > 0
+        } for sub in subfolders]
+
+    # Tree expansion only needs subfolders (?files=0)
+    if request.GET.get('files') == '0':
+        return JsonResponse(data)
+
+    files = folder.files.only('id', 'file', 'original_name', 'config_added', 'uploaded_at')
+    try:
+        page, next_cursor = paginate_keyset(files, cursor, get_page_limit(request), field='uploaded_at')
+    except InvalidCursor as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    data['files'] = [{
+        'id': f.id,
+        'name': f.display_name,
+        'config_added': f.config_added,
+        'download_url': reverse('download_file', args=[f.id])
+    } for f in page]
+    data['next_cursor'] = next_cursor
+    data['has_more'] = next_cursor is not None
+    return JsonResponse(data)
 
 
 def folder_list_json(request):
-    folders = Folder.objects.all().values('id', 'name')
-    return JsonResponse(list(folders), safe=False)
+    def build():
+        folders = Folder.objects.all().values('id', 'name')
+        return JsonResponse(list(folders), safe=False)
+    return cache.cached_response('folder_list_json', [cache.FOLDERS_VERSION], build)
 
 
 @csrf_exempt
 def upload_to_folder(request, folder_id):
     if request.method == 'POST':
         folder = Folder.objects.get(id=folder_id)
+        # Known from the URL: wrong types are skipped before their bytes are stored
+        restrict_upload_types(request, [folder.allowed_type])
         files = request.FILES.getlist('files')
+        uploaded = 0
         for f in files:
             ext = f.name.split('.')[-1].lower()
             if folder.allowed_type and ext != folder.allowed_type:
                 continue  # skip files with wrong extension
-            UploadedFile.objects.create(file=f, folder=folder)
-        return HttpResponse('OK')
+            save_upload(UploadedFile(folder=folder), f)
+            uploaded += 1
+        return JsonResponse({'status': 'success', 'uploaded': uploaded, 'rejected': get_rejected_uploads(request)})
@@ -41,6 +41,8 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # Before CsrfViewMiddleware, which parses the upload body
+    'files.uploadhandlers.UploadTypeMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -116,10 +118,16 @@ MEDIA_ROOT = BASE_DIR / 'media'
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024   # 50MB
 FILE_UPLOAD_PERMISSIONS = 0o644
+DATA_UPLOAD_MAX_NUMBER_FILES = 50000  # Directory uploads send one part per file
 
-# File upload handlers for large files
+# Bulk (directory) uploads: threads moving new content into the blob store
+UPLOAD_SETTINGS = {
+    'STORE_WORKERS': 8,
+}
+
+# Uploads stream once into the blob store, hashed and type-checked on the way
 FILE_UPLOAD_HANDLERS = [
-    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+    'files.uploadhandlers.StreamingBlobUploadHandler',
 ]
 
 # Processing settings (Flask reference pattern)
@@ -156,10 +164,65 @@ ALLOWED_UPLOAD_EXTENSIONS = ['.csv', '.parquet', '.json', '.txt', '.pdf', '.jpg'
 # Processing configuration
 PROCESSING_SETTINGS = {
     'CHUNK_SIZE': 1000,  # Records per chunk
+    'CHUNK_WORKERS': None,  # Compression processes; None = one per CPU
+    'CHUNK_COMPRESSION_LEVEL': 6,  # gzip level for .json.gz chunks
+    'CHUNK_FRAME_RECORDS': 100,  # Records per independently compressed gzip frame
+    'RECORDS_MAX_LIMIT': 10000,  # Cap on ?limit= for the record-range API
+    'PREVIEW_RECORDS': 10,  # Records kept in the preview.json sidecar
+    'PARALLEL_MIN_BYTES': 8 * 1024 * 1024,  # Smaller files are chunked in-process
+    'RECORD_INDEX_AUTO': False,  # Build the record (field/value) index after every chunking run
+    'RECORD_INDEX_FIELDS': None,  # Fields to index; None = every field
+    'RECORD_INDEX_MAX_VALUE_LENGTH': 256,  # Longer values are indexed by their prefix
     'INFERENCE_TIMEOUT': 300,  # 5 minutes
     'CONFIG_REQUIRED_FIELDS': ['algorithm', 'parameters'],
 }
+
+# Background processing queue (`python manage.py process_jobs --workers N`)
+JOB_SETTINGS = {
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF': 30,  # Seconds before the first retry; doubled after each failure
+    'POLL_INTERVAL': 2,  # Seconds between polls of an empty queue
+    'STALE_AFTER': 900,  # Running jobs without a heartbeat this long are requeued
+    'PROGRESS_INTERVAL': 1.0,  # Minimum seconds between progress writes
+}
+
+# Listing API pagination (keyset / cursor based)
+API_PAGINATION = {
+    'DEFAULT_LIMIT': 100,
+    'MAX_LIMIT': 1000,
+}
+
+# Streamed listings (?stream=1 / ?format=ndjson on the folder and file listing APIs)
+STREAMING_SETTINGS = {
+    'FETCH_SIZE': 2000,  # Rows per database fetch from the cursor
+    'BUFFER_BYTES': 64 * 1024,  # Encoded rows are sent in blocks of about this size
+}
+
+# User statistics rollup (api_user_stats)
+STATS_SETTINGS = {
+    'ROLLUP_MAX_AGE': 300,  # Seconds before a cached rollup is recomputed
+}
+
+# Download settings
+DOWNLOAD_SETTINGS = {
+    'BLOCK_SIZE': 64 * 1024,  # Bytes per read when streaming ranges
+    # Set to 'nginx' (X-Accel-Redirect) or 'apache' (X-Sendfile) to let a front proxy serve files
+    'SENDFILE_BACKEND': None,
+    'X_ACCEL_REDIRECT_LOCATION': '/protected-media/',  # nginx internal location mapped to MEDIA_ROOT
+    # Already-compressed formats are stored in folder ZIPs instead of deflated again
+    'ZIP_STORED_EXTENSIONS': ['.parquet', '.gz', '.zip', '.pdf', '.png', '.jpg'],
+}
+
+# Folder view response cache (files/cache.py)
+RESPONSE_CACHE_SETTINGS = {
+    'ENABLED': True,
+    # Must be shared by every process that changes folders or files (web workers and job workers)
+    'ALIAS': 'file_processing',
+    'TIMEOUT': 300,  # Seconds an unchanged response stays cached
+    'KEY_PREFIX': 'folder-views',
+}
 # settings.py
 FLASK_ENCLAVE_URL = 'http://localhost:8001'
 FLASK_USERNAME = 'your_flask_username'
 FLASK_PASSWORD = 'your_flask_password'
+